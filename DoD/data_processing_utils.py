@@ -3,8 +3,11 @@ from collections import defaultdict
 import math
 
 from DoD.utils import FilterType
+from DoD import hash_join
+from DoD.relation_cache import RelationCache, enable_copy_on_write, normalize_value
 import config as C
 import os
+import tempfile
 import psutil
 from tqdm import tqdm
 import time
@@ -12,20 +15,37 @@ import pprint
 
 
 pp = pprint.PrettyPrinter(indent=4)
-# Cache reading and transformation of DFs
-cache = dict()
 
 memory_limit_join_processing = C.memory_limit_join_processing * psutil.virtual_memory().total
 
 data_separator = C.separator
 
-tmp_spill_file = "./tmp_spill_file.tmp"
-# tmp_df_chunk = "./chunk_df"
+# Cache reading and transformation of DFs. Copy-on-write is a process-wide pandas option, so it is off until
+# enable_relation_cache_copy_on_write is called when DoD starts
+copy_on_write = False
+cache = RelationCache(C.relation_cache_memory * psutil.virtual_memory().total, separator=data_separator,
+                      parquet_dir=C.relation_cache_parquet_dir, copy_on_write=copy_on_write)
+
+memory_limit_join_partition = C.memory_limit_join_partition * psutil.virtual_memory().total
+
+
+def enable_relation_cache_copy_on_write():
+    """
+    Turns on pandas copy-on-write for the whole process if relation_cache_copy_on_write is set, so that the relation
+    cache hands out shallow copies of the cached relations
+    :return: whether copy-on-write is enabled
+    """
+    global copy_on_write
+    copy_on_write = C.relation_cache_copy_on_write and enable_copy_on_write()
+    cache.copy_on_write = copy_on_write
+    return copy_on_write
 
 
 def configure_csv_separator(separator):
     global data_separator
     data_separator = separator
+    cache.separator = separator
+    cache.clear()
 
 
 def estimate_output_row_size(a: pd.DataFrame, b: pd.DataFrame):
@@ -57,14 +77,18 @@ def does_join_fit_in_memory(chunk, ratio, o_row_size):
     return True, estimated_output_size/1024/1024/1024
 
 
-def join_ab_on_key_optimizer(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key: str,
-                             suffix_str=None, chunksize=C.join_chunksize, normalize=True):
-    # clean up temporal stuff -- i.e., in case there was a crash
-    try:
-        # os.remove(tmp_df_chunk)
-        os.remove(tmp_spill_file)
-    except FileNotFoundError:
-        pass
+def join_ab_on_key_optimizer(a, b, a_key: str, b_key: str, suffix_str=None, normalize=True):
+    """
+    Joins a and b in memory if the output fits in memory_limit_join_processing. Otherwise both are partitioned
+    on the key and spilled to disk, and the partitions are joined one by one within memory_limit_join_partition,
+    writing each chunk of output to disk as it is produced
+    :param a: a DataFrame, or the SpilledRelation of a previous join
+    :param b: a DataFrame, or the SpilledRelation of a previous join
+    :return: the joined DataFrame, a SpilledRelation if it does not fit in memory, False if one of the relations
+    has no valid key values
+    """
+    if isinstance(a, hash_join.SpilledRelation) or isinstance(b, hash_join.SpilledRelation):
+        return join_spilled_on_key(a, b, a_key, b_key, suffix_str=suffix_str)
 
     # if normalize:
     a[a_key] = a[a_key].apply(lambda x: str(x).lower())
@@ -75,105 +99,61 @@ def join_ab_on_key_optimizer(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key
         print("KEY: " + str(b_key))
 
     # drop NaN/Null values
-    a.dropna(subset=[a_key], inplace=True)
-    b.dropna(subset=[b_key], inplace=True)
-    a_drop_indices = [i for i, el in enumerate(a[a_key]) if el == 'nan' or el == 'null' or el is pd.NaT]
-    b_drop_indices = [i for i, el in enumerate(b[b_key]) if el == 'nan' or el == 'null' or el is pd.NaT]
-    a.drop(a_drop_indices, inplace=True)
-    b.drop(b_drop_indices, inplace=True)
-    a.reset_index(drop=True)
-    b.reset_index(drop=True)
+    a = a[~a[a_key].isin(['nan', 'null'])]
+    b = b[~b[b_key].isin(['nan', 'null'])]
 
     if len(a) == 0 or len(b) == 0:
         return False
 
-    # Estimate output join row size
+    # Estimate output join size
     o_row_size = estimate_output_row_size(a, b)
+    o_rows = hash_join.join_output_rows(a[a_key], b[b_key])
+    fits, estimated_join_size = does_join_fit_in_memory(o_rows, 1.0, o_row_size)
+    print("Estimated join size: " + str(estimated_join_size))
+    if fits:  # join in memory and exit
+        return join_ab_on_key(a, b, a_key, b_key, suffix_str=suffix_str, normalize=False)
+
+    st = time.time()
+    empty = pd.merge(a.iloc[:0], b.iloc[:0], how='inner', left_on=a_key, right_on=b_key, sort=False,
+                     suffixes=('', suffix_str))
+    chunks = hash_join.grace_hash_join(a, b, a_key, b_key, memory_limit_join_partition, suffix_str=suffix_str,
+                                       output_rows=o_rows)
+    joined = hash_join.spill(chunks, empty)
+    print("Out-of-core join time: " + str(time.time() - st))
+    return joined
 
-    # join by chunks
-    def join_chunk(chunk_df, header=False):
-        # print("First chunk? : " + str(header))
-        # print("a: " + str(len(a)))
-        # print("b: " + str(len(chunk_df)))
-        # worst_case_estimated_join_size = chunksize * len(a) * o_row_size
-        # if worst_case_estimated_join_size >= memory_limit_join_processing:
-        #     print("Can't join sample. Size: " + str(worst_case_estimated_join_size))
-        #     return False  # can't even join a sample
-        # print(a[a_key].head(10))
-        # print(chunk_df[b_key].head(10))
-        target_chunk = pd.merge(a, chunk_df, left_on=a_key, right_on=b_key, sort=False, suffixes=('', suffix_str))
-        if header:  # header is only activated the first time. We only want to do this check the first time
-            # sjt = time.time()
-            fits, estimated_join_size = does_join_fit_in_memory(len(target_chunk), (float)(chunksize/len(b)), o_row_size)
-            # ejt = time.time()
-            # join_time = (float)((ejt - sjt) * (float)(len(b)/chunksize))
-            # print("Est. join time: " + str(join_time))
-            print("Estimated join size: " + str(estimated_join_size))
-            # if estimated_join_size < 0.01:
-            #     print("TC: " + str(len(target_chunk)))
-            #     print("Ratio: " + str((float)(chunksize/len(b))))
-            #     print("row size: " + str(o_row_size))
-            #     print("FITS? : " + str(fits))
-            if fits:
-                return True
-            else:
-                return False
-        target_chunk.to_csv(tmp_spill_file, mode="a", header=header, index=False)
-        return False
-
-    def chunk_reader(df):
-        len_df = len(df)
-        init_index = 0
-        num_chunks = math.ceil(len_df / chunksize)
-        for i in range(num_chunks):
-            chunk_df = df[init_index:init_index + chunksize]
-            init_index += chunksize
-            yield chunk_df
-
-    # swap row order of b to approximate uniform sampling
-    b = b.sample(frac=1).reset_index(drop=True)
-    first_chunk = True
-    all_chunks = [chunk for chunk in chunk_reader(b)]
-    # for chunk in tqdm(all_chunks):
-    for chunk in all_chunks:
-        scp = time.time()
-        if first_chunk:
-            fits_in_memory = join_chunk(chunk, header=True)
-            first_chunk = False
-            if fits_in_memory:  # join in memory and exit
-                return join_ab_on_key(a, b, a_key, b_key, suffix_str=suffix_str, normalize=False)
-            else:  # just ignore no-fit in memory chunks
-                return False
-        else:
-            join_chunk(chunk)
-        ecp = time.time()
-        chunk_time = ecp - scp
-        estimated_total_time = chunk_time * len(all_chunks)
-        print("ETT: " + str(estimated_total_time))
-        if estimated_total_time > 60 * 3:  # no more than 3 minutes
-            return False  # cancel this join without breaking the whole pipeline
-
-    print("Reading written down relation: ")
-    # [join_chunk(chunk) for chunk in chunk_reader(b)]
-    joined = pd.read_csv(tmp_spill_file, encoding='latin1', sep=data_separator)
 
-    # clean up temporal stuff
-    try:
-        # os.remove(tmp_df_chunk)
-        os.remove(tmp_spill_file)
-    except FileNotFoundError:
-        pass
-
-    return joined
+def join_spilled_on_key(a, b, a_key: str, b_key: str, suffix_str=None):
+    """
+    Joins a and b when one of them is a SpilledRelation: the join distributes over the chunks, so each pair of
+    chunks is joined with join_ab_on_key_optimizer and the output is spilled
+    :return: SpilledRelation with the join, False if no pair of chunks had valid key values
+    """
+    def chunks_of(relation):
+        if isinstance(relation, hash_join.SpilledRelation):
+            return relation.chunks()
+        return [relation]
+
+    output = None
+    for a_chunk in chunks_of(a):
+        for b_chunk in chunks_of(b):
+            joined = join_ab_on_key_optimizer(a_chunk, b_chunk, a_key, b_key, suffix_str=suffix_str)
+            if joined is False:
+                continue
+            if output is None:
+                output = hash_join.SpilledRelation(joined.empty if isinstance(joined, hash_join.SpilledRelation)
+                                                   else joined.iloc[:0])
+            for piece in chunks_of(joined):
+                output.append(piece)
+    if output is None:
+        return False
+    return output
 
 
 def join_ab_on_key_spill_disk(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key: str, suffix_str=None, chunksize=C.join_chunksize):
-    # clean up temporal stuff -- i.e., in case there was a crash
-    try:
-        # os.remove(tmp_df_chunk)
-        os.remove(tmp_spill_file)
-    except FileNotFoundError:
-        pass
+    # each join spills to its own file, so that concurrent joins do not write on each other
+    spill_fd, tmp_spill_file = tempfile.mkstemp(suffix=".tmp", prefix="spill_")
+    os.close(spill_fd)
 
     a[a_key] = a[a_key].apply(lambda x: str(x).lower())
     try:
@@ -194,7 +174,7 @@ def join_ab_on_key_spill_disk(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_ke
     def join_chunk(chunk_df, header=False):
         # chunk_df[b_key] = chunk_df[b_key].apply(lambda x: str(x).lower())  # transform to string for join
         target_chunk = pd.merge(a, chunk_df, left_on=a_key, right_on=b_key, sort=False, suffixes=('', suffix_str))
-        target_chunk.to_csv(tmp_spill_file, mode="a", header=header, index=False)
+        target_chunk.to_csv(tmp_spill_file, mode="a", header=header, index=False, sep=data_separator)
 
     def chunk_reader(df):
         len_df = len(df)
@@ -243,31 +223,21 @@ def join_ab_on_key(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key: str, suf
 
 
 def read_relation(relation_path):
-    if relation_path in cache:
-        df = cache[relation_path]
-    else:
-        df = pd.read_csv(relation_path, encoding='latin1', sep=data_separator)
-        cache[relation_path] = df
-    return df
+    return cache.get(relation_path)
 
 
 def read_relation_on_copy(relation_path):
     """
-    This is assuming than copying a DF is cheaper than reading it back from disk
+    This is assuming than copying a DF is cheaper than reading it back from disk. With copy-on-write the copy
+    is shallow and columns are only copied when they are modified
     :param relation_path:
     :return:
     """
-    if relation_path in cache:
-        df = cache[relation_path]
-    else:
-        df = pd.read_csv(relation_path, encoding='latin1', sep=data_separator)
-        cache[relation_path] = df
-    return df.copy()
+    return cache.get(relation_path, copy=True)
 
 
 def empty_relation_cache():
-    global cache
-    cache = dict()
+    cache.clear()
 
 
 def get_dataframe(path):
@@ -302,17 +272,12 @@ def _join_ab_on_key(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key: str, su
 
 
 def apply_filter(relation_path, attribute, cell_value):
-    # if relation_path in cache:
-    #     df = cache[relation_path]
-    # else:
-    #     df = pd.read_csv(relation_path, encoding='latin1', sep=data_separator)
-    #     # store in cache
-    #     cache[relation_path] = df
-    df = read_relation_on_copy(relation_path)  # FIXME FIXE FIXME
-    # df = get_dataframe(relation_path)
-    df[attribute] = df[attribute].apply(lambda x: str(x).lower())
-    # update_relation_cache(relation_path, df)
-    df = df[df[attribute] == cell_value]
+    """
+    select * from relation where normalized(attribute) = cell_value; attribute comes back normalized
+    """
+    df, index = cache.value_index(relation_path, attribute)
+    df = df.iloc[index.lookup(cell_value)].copy(deep=not copy_on_write)
+    df[attribute] = df[attribute].map(normalize_value)
     return df
 
 
@@ -321,34 +286,25 @@ def find_key_for(relation_path, key, attribute, value):
     select key from relation where attribute = value;
     """
     # normalize this value
-    value = str(value).lower()
-    # Check if DF in cache
-    if relation_path in cache:
-        df = cache[relation_path]
-    else:
-        df = pd.read_csv(relation_path, encoding='latin1', sep=data_separator)
-        #df = df.apply(lambda x: x.astype(str).str.lower())
-        # cache[relation_path] = df  # cache for later
+    value = normalize_value(value)
     try:
-        key_value_df = df[df[attribute].map(lambda x: str(x).lower()) == value][[key]]
+        df, index = cache.value_index(relation_path, attribute)
+        keys = df[key].values[index.lookup(value)]
     except KeyError:
+        df = read_relation(relation_path)
         print("!!!")
         print("Attempt to access attribute: '" + str(attribute) + "' from relation: " + str(df.columns))
         print("Attempt to project attribute: '" + str(key) + "' from relation: " + str(df.columns))
         print("!!!")
-    return {x[0] for x in key_value_df.values}
+        raise
+    return set(keys)
 
 
 def is_value_in_column(value, relation_path, column):
     # normalize this value
-    value = str(value).lower()
-    if relation_path in cache:
-        df = cache[relation_path]
-    else:
-        df = pd.read_csv(relation_path, encoding='latin1', sep=data_separator)
-        #df = df.apply(lambda x: x.astype(str).str.lower())
-        cache[relation_path] = df  # cache for later
-    return value in df[column].map(lambda x: str(x).lower()).unique()
+    value = normalize_value(value)
+    _, index = cache.value_index(relation_path, column)
+    return value in index
 
 
 def obtain_attributes_to_project(filters):
@@ -376,8 +332,7 @@ def _obtain_attributes_to_project(jp_with_filters):
 
 def project(df, attributes_to_project):
     print("Project: " + str(attributes_to_project))
-    df = df[list(attributes_to_project)]
-    return df
+    return chunkwise(df, lambda chunk: chunk[list(attributes_to_project)])
 
 
 class InTreeNode:
@@ -409,10 +364,24 @@ class InTreeNode:
             return self.node == other.node
 
 
-def materialize_join_graph(jg, dod):
+def materialize_join_graph(jg, dod, paths=None, attributes_to_project=None, table_filters=None):
+    """
+    :param attributes_to_project: if given, only these attributes are read and returned, and the joins are planned
+    with materialize_join_graph_planned
+    :param table_filters: table -> [(value, attribute)] cell filters applied before joining, when planned
+    """
+    if attributes_to_project is not None:
+        return materialize_join_graph_planned(jg, dod, attributes_to_project, table_filters=table_filters,
+                                              paths=paths)
     print("Materializing:")
     pp.pprint(jg)
 
+    def get_path(hit):
+        # paths, table -> directory, lets worker processes materialize without a store client
+        if paths is not None:
+            return paths[hit.source_name]
+        return dod.aurum_api.helper.get_path_nid(hit.nid)
+
     def build_tree(jg):
         # Build in-tree (leaves to root)
         intree = dict()  # keep reference to all nodes here
@@ -425,7 +394,7 @@ def materialize_join_graph(jg, dod):
             for l, r in hops:
                 if len(intree) == 0:
                     node = InTreeNode(l.source_name)
-                    node_path = dod.aurum_api.helper.get_path_nid(l.nid) + "/" + l.source_name
+                    node_path = get_path(l) + "/" + l.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     node.set_payload(df)
@@ -434,7 +403,7 @@ def materialize_join_graph(jg, dod):
                 # now either l or r should be in intree
                 if l.source_name in intree.keys():
                     rnode = InTreeNode(r.source_name)  # create node for r
-                    node_path = dod.aurum_api.helper.get_path_nid(r.nid) + "/" + r.source_name
+                    node_path = get_path(r) + "/" + r.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     rnode.set_payload(df)
@@ -447,7 +416,7 @@ def materialize_join_graph(jg, dod):
                     intree[r.source_name] = rnode
                 elif r.source_name in intree.keys():
                     lnode = InTreeNode(l.source_name)  # create node for l
-                    node_path = dod.aurum_api.helper.get_path_nid(l.nid) + "/" + l.source_name
+                    node_path = get_path(l) + "/" + l.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     lnode.set_payload(df)
@@ -509,6 +478,144 @@ def materialize_join_graph(jg, dod):
     return materialized_view
 
 
+def chunkwise(view, function):
+    """
+    Applies function, DataFrame -> DataFrame, to view or to each chunk of view if it is a SpilledRelation
+    """
+    if isinstance(view, hash_join.SpilledRelation):
+        return view.map(function)
+    return function(view)
+
+
+def plan_join_graph(jg, relation_columns, attributes_to_project, table_filters):
+    """
+    Columns to read from each table of jg: its join keys, the attributes of its cell filters, and the projected
+    attributes it has
+    :param relation_columns: table -> column names of the table
+    :param table_filters: table -> [(value, attribute)]
+    :return: table -> columns to read, in the order of the table
+    """
+    needed = defaultdict(set)
+    for l, r in jg:
+        needed[l.source_name].add(l.field_name)
+        needed[r.source_name].add(r.field_name)
+    for table, filters in table_filters.items():
+        if table in needed:
+            needed[table].update(attribute for _, attribute in filters)
+    for table in needed.keys():
+        needed[table].update(set(attributes_to_project) & set(relation_columns[table]))
+    return {table: [c for c in relation_columns[table] if c in columns] for table, columns in needed.items()}
+
+
+def materialize_join_graph_planned(jg, dod, attributes_to_project, table_filters=None, paths=None):
+    """
+    Materializes jg reading only the columns the view needs from each table, applying the cell filters of each
+    table before joining it, and joining first the tables that give fewer rows, estimated from the number of rows
+    and distinct key values of both sides
+    :param attributes_to_project: names of the attributes of the view
+    :param table_filters: table -> [(value, attribute)] cell filters, rows must have value in attribute
+    :param paths: table -> directory, the store is asked for the rest
+    :return: the view with the projected attributes its tables have, False if a join was an outlier
+    """
+    if table_filters is None:
+        table_filters = dict()
+    attributes_to_project = list(attributes_to_project)
+    relation_paths = dict()
+    for l, r in jg:
+        for hit in (l, r):
+            if hit.source_name not in relation_paths:
+                path = paths[hit.source_name] if paths is not None else dod.aurum_api.helper.get_path_nid(hit.nid)
+                relation_paths[hit.source_name] = path + "/" + hit.source_name
+    relation_columns = {table: cache.columns(path) for table, path in relation_paths.items()}
+    plan = plan_join_graph(jg, relation_columns, attributes_to_project, table_filters)
+
+    # Read the columns of the plan and filter
+    frames = dict()
+    for table, columns in plan.items():
+        df = cache.get_columns(relation_paths[table], columns)
+        for value, attribute in table_filters.get(table, []):
+            df[attribute] = df[attribute].map(normalize_value)
+            df = df[df[attribute] == value]
+        for l, r in jg:
+            for hit in (l, r):
+                if hit.source_name == table:
+                    df[hit.field_name] = df[hit.field_name].map(normalize_value)
+        frames[table] = df
+
+    # Join, keeping the name each (table, column) has in the view. Columns of the right relation that are already
+    # in the view are renamed with a suffix, as pd.merge would do
+    table_distinct = dict()  # (table, column) -> distinct values, of the filtered tables
+
+    def distinct_values(table, column):
+        if (table, column) not in table_distinct:
+            table_distinct[(table, column)] = frames[table][column].nunique()
+        return table_distinct[(table, column)]
+
+    def join_rows(l_rows, l_distinct, r_rows, r_distinct):
+        # every key value of the side with fewer distinct values is in the other side, values are uniform
+        return l_rows * r_rows / max(l_distinct, r_distinct, 1)
+
+    first = min(jg, key=lambda hop: join_rows(len(frames[hop[0].source_name]),
+                                              distinct_values(hop[0].source_name, hop[0].field_name),
+                                              len(frames[hop[1].source_name]),
+                                              distinct_values(hop[1].source_name, hop[1].field_name)))
+    view = frames[first[0].source_name]
+    column_of = {(first[0].source_name, c): c for c in view.columns}
+    joined_tables = {first[0].source_name}
+    pending = list(jg)
+    suffix_str = '_x'
+    while len(pending) > 0:
+        # hops between tables already in the view close a cycle, they are applied as a selection
+        cycles = [(l, r) for l, r in pending if l.source_name in joined_tables and r.source_name in joined_tables]
+        for l, r in cycles:
+            l_column = column_of[(l.source_name, l.field_name)]
+            r_column = column_of[(r.source_name, r.field_name)]
+            view = chunkwise(view, lambda df: df[df[l_column] == df[r_column]])
+            pending.remove((l, r))
+        candidates = []
+        for l, r in pending:
+            if l.source_name in joined_tables:
+                candidates.append(((l, r), l, r))
+            elif r.source_name in joined_tables:
+                candidates.append(((l, r), r, l))
+        if len(candidates) == 0:
+            break
+        view_distinct = dict()
+        for _, inside, _ in candidates:
+            view_key = column_of[(inside.source_name, inside.field_name)]
+            if isinstance(view, hash_join.SpilledRelation):
+                keys = [chunk[view_key].drop_duplicates() for chunk in view.chunks()]
+                view_distinct[view_key] = pd.concat(keys + [view.empty[view_key]]).nunique()
+            else:
+                view_distinct[view_key] = view[view_key].nunique()
+        hop, inside, outside = min(candidates, key=lambda c: join_rows(
+            len(view), view_distinct[column_of[(c[1].source_name, c[1].field_name)]],
+            len(frames[c[2].source_name]), distinct_values(c[2].source_name, c[2].field_name)))
+        pending.remove(hop)
+        right = frames[outside.source_name]
+        view_key = column_of[(inside.source_name, inside.field_name)]
+        renamed = {c: c + suffix_str for c in right.columns if c in view.columns and not
+                   (c == outside.field_name and c == view_key)}
+        right = right.rename(columns=renamed)
+        right_key = renamed.get(outside.field_name, outside.field_name)
+        view = join_ab_on_key_optimizer(view, right, view_key, right_key, suffix_str=suffix_str)
+        if view is False:  # no valid keys left on one side, or the join was an outlier
+            return False
+        for c in frames[outside.source_name].columns:
+            column_of[(outside.source_name, c)] = renamed.get(c, c)
+        joined_tables.add(outside.source_name)
+        suffix_str += '_x'
+
+    # Project, each attribute from the first table in jg that has it, as materialize_join_graph does
+    projection = dict()
+    for table in relation_paths.keys():
+        for c in attributes_to_project:
+            if (table, c) in column_of and c not in projection:
+                projection[c] = column_of[(table, c)]
+    attributes = [c for c in attributes_to_project if c in projection]
+    return chunkwise(view, lambda df: df[[projection[c] for c in attributes]].set_axis(attributes, axis=1))
+
+
 def apply_consistent_sample(dfa, dfb, a_key, b_key, sample_size):
     # Normalize values
     dfa[a_key] = dfa[a_key].apply(lambda x: str(x).lower())
@@ -542,10 +649,16 @@ def apply_consistent_sample(dfa, dfb, a_key, b_key, sample_size):
     return dfa, dfb
 
 
-def materialize_join_graph_sample(jg, dod, sample_size=100):
+def materialize_join_graph_sample(jg, dod, sample_size=100, paths=None):
     print("Materializing:")
     pp.pprint(jg)
 
+    def get_path(hit):
+        # paths, table -> directory, lets worker processes materialize without a store client
+        if paths is not None:
+            return paths[hit.source_name]
+        return dod.aurum_api.helper.get_path_nid(hit.nid)
+
     def build_tree(jg):
         # Build in-tree (leaves to root)
         intree = dict()  # keep reference to all nodes here
@@ -558,7 +671,7 @@ def materialize_join_graph_sample(jg, dod, sample_size=100):
             for l, r in hops:
                 if len(intree) == 0:
                     node = InTreeNode(l.source_name)
-                    node_path = dod.aurum_api.helper.get_path_nid(l.nid) + "/" + l.source_name
+                    node_path = get_path(l) + "/" + l.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     node.set_payload(df)
@@ -567,7 +680,7 @@ def materialize_join_graph_sample(jg, dod, sample_size=100):
                 # now either l or r should be in intree
                 if l.source_name in intree.keys():
                     rnode = InTreeNode(r.source_name)  # create node for r
-                    node_path = dod.aurum_api.helper.get_path_nid(r.nid) + "/" + r.source_name
+                    node_path = get_path(r) + "/" + r.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     rnode.set_payload(df)
@@ -580,7 +693,7 @@ def materialize_join_graph_sample(jg, dod, sample_size=100):
                     intree[r.source_name] = rnode
                 elif r.source_name in intree.keys():
                     lnode = InTreeNode(l.source_name)  # create node for l
-                    node_path = dod.aurum_api.helper.get_path_nid(l.nid) + "/" + l.source_name
+                    node_path = get_path(l) + "/" + l.source_name
                     df = read_relation_on_copy(node_path)# FIXME FIXME FIXME
                     # df = get_dataframe(node_path)
                     lnode.set_payload(df)
@@ -2,21 +2,29 @@ from algebra import API
 from api.apiutils import Relation
 from collections import defaultdict
 from collections import OrderedDict
+from collections import deque
 import itertools
+import multiprocessing
 from DoD import data_processing_utils as dpu
 from DoD import material_view_analysis as mva
 from DoD.utils import FilterType
+from DoD import join_path_index as jpi
+from DoD import join_estimation as je
 import numpy as np
 from functools import reduce
 import operator
 import pickle
 from tqdm import tqdm
 from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
 from modelstore.elasticstore import StoreHandler
+from modelstore.elasticstore import KWType
 import time
-from DoD import view_4c_analysis_baseline as v4c
+from DoD import view_4c_analysis_vectorized as v4cv
 import os
 import pandas as pd
+import psutil
+import config as C
 import pprint
 
 
@@ -25,9 +33,16 @@ pp = pprint.PrettyPrinter(indent=4)
 
 class DoD:
 
-    def __init__(self, network, store_client, csv_separator=","):
+    def __init__(self, network, store_client, csv_separator=",", join_path_index=None, join_estimator=None,
+                 num_workers=C.dod_num_workers):
         self.aurum_api = API(network=network, store_client=store_client)
         self.paths_cache = dict()
+        self.join_path_index = join_path_index  # precomputed join paths, see DoD/join_path_index.py
+        self.join_estimator = join_estimator  # prunes and ranks join graphs, see DoD/join_estimation.py
+        self.num_workers = num_workers  # > 1 to check and materialize join graphs in a pool of processes
+        self.materialization_memory = C.dod_materialization_memory * psutil.virtual_memory().total
+        self.pool = None
+        network.table_join_graph(Relation.PKFK)  # join path queries run on it, build it now
         dpu.configure_csv_separator(csv_separator)
 
     def place_paths_in_cache(self, t1, t2, paths):
@@ -45,32 +60,40 @@ class DoD:
             return None
 
     def individual_filters(self, sch_def):
-        # Obtain sets that fulfill individual filters
+        # Obtain sets that fulfill individual filters, searching all of them in one request
+        queries = [(attr, KWType.KW_SCHEMA, 200, True) for attr in sch_def.keys()]
+        queries += [(cell, KWType.KW_CONTENT, 200, False) for cell in sch_def.values()]
+        drss = self.aurum_api.search_batch(queries)
+
         filter_drs = dict()
         filter_id = 0
         for attr in sch_def.keys():
-            drs = self.aurum_api.search_exact_attribute(attr, max_results=200)
-            filter_drs[(attr, FilterType.ATTR, filter_id)] = drs
+            filter_drs[(attr, FilterType.ATTR, filter_id)] = drss[filter_id]
             filter_id += 1
 
         for cell in sch_def.values():
-            drs = self.aurum_api.search_content(cell, max_results=200)
-            filter_drs[(cell, FilterType.CELL, filter_id)] = drs
+            filter_drs[(cell, FilterType.CELL, filter_id)] = drss[filter_id]
             filter_id += 1
         return filter_drs
 
     def joint_filters(self, sch_def):
-        # Obtain sets that fulfill individual filters
+        # Obtain sets that fulfill individual filters, searching all of them in one request
+        queries = []
+        for attr, cell in sch_def.items():
+            queries.append((attr, KWType.KW_SCHEMA, 50, True))
+            if cell != "":
+                queries.append((cell, KWType.KW_CONTENT, 500, False))
+        drss = iter(self.aurum_api.search_batch(queries))
+
         filter_drs = dict()
         filter_id = 0
-
         for attr, cell in sch_def.items():
             if cell == "":
-                drs = self.aurum_api.search_exact_attribute(attr, max_results=50)
+                drs = next(drss)
                 filter_drs[(attr, FilterType.ATTR, filter_id)] = drs
             else:
-                drs_attr = self.aurum_api.search_exact_attribute(attr, max_results=50)
-                drs_cell = self.aurum_api.search_content(cell, max_results=500)
+                drs_attr = next(drss)
+                drs_cell = next(drss)
                 drs = self.aurum_api.intersection(drs_attr, drs_cell)
                 filter_drs[(cell, FilterType.CELL, filter_id)] = drs
             filter_id += 1
@@ -277,41 +300,71 @@ class DoD:
                 perf_stats['num_join_graphs_per_candidate_group'] = []
             perf_stats['num_join_graphs_per_candidate_group'].append(len(join_graphs))
 
-            # Now we need to check every join graph individually and see if it's materializable. Only once we've
-            # exhausted these join graphs we move on to the next candidate group. We know already that each of the
-            # join graphs covers all tables in candidate_group, so if they're materializable we're good.
-            total_materializable_join_graphs = 0
-            materializable_join_graphs = []
-            for jpg in join_graphs:
-                # Obtain filters that apply to this join graph
-                filters = set()
-                for l, r in jpg:
-                    if l.source_name in table_fulfilled_filters:
-                        filters.update(table_fulfilled_filters[l.source_name])
-                    if r.source_name in table_fulfilled_filters:
-                        filters.update(table_fulfilled_filters[r.source_name])
-
-                # TODO: obtain join_graph score for diff metrics. useful for ranking later
-                # rank_materializable_join_graphs(materializable_join_paths, table_path, dod)
-                st_is_materializable = time.time()
-                # if query view is all attributes, then it's always materializable or we could
-                # join on a small sample and see -- we can have 2 different impls.
-                if sum([0] + [1 for el in list_samples if el != '']) > 0:
-                    is_join_graph_valid = self.is_join_graph_materializable(jpg, table_fulfilled_filters)
-                else:
-                    is_join_graph_valid = True
-                et_is_materializable = time.time()
-                perf_stats['time_is_materializable'] += (et_is_materializable - st_is_materializable)
-                # Obtain all materializable graphs, then materialize
-                if is_join_graph_valid:
-                    total_materializable_join_graphs += 1
-                    materializable_join_graphs.append((jpg, filters))
-            # At this point we can empty is-join-graph-materializable cache and create a new one
-            # dpu.empty_relation_cache()  # TODO: If df.copy() works, then this is a nice reuse
-            st_materialize = time.time()
-            to_return = self.materialize_join_graphs(materializable_join_graphs)
-            et_materialize = time.time()
-            perf_stats['time_materialize'] += (et_materialize - st_materialize)
+            # Drop the join graphs that the sketches say are empty or too big, best ones first
+            if self.join_estimator is not None:
+                num_join_graphs = len(join_graphs)
+                join_graphs = self.join_estimator.prune_and_rank(join_graphs)
+                if 'pruned_join_graphs' not in perf_stats:
+                    perf_stats['pruned_join_graphs'] = 0
+                perf_stats['pruned_join_graphs'] += num_join_graphs - len(join_graphs)
+
+            if self.num_workers > 1:
+                # Check and materialize the join graphs of the group in the worker pool, in the same order. Views are
+                # handed over as they are materialized, so only the join graphs in flight are held by the pool
+                views = self.check_and_materialize_join_graphs(
+                    join_graphs, table_fulfilled_filters, sum([0] + [1 for el in list_samples if el != '']) > 0,
+                    table_path=table_path)
+                while True:
+                    st_materialize = time.time()
+                    try:
+                        el = next(views)
+                    except StopIteration as done:
+                        total_materializable_join_graphs = done.value
+                        break
+                    finally:
+                        et_materialize = time.time()
+                        perf_stats['time_materialize'] += (et_materialize - st_materialize)
+                    if 'actually_materialized' not in perf_stats:
+                        perf_stats['actually_materialized'] = 0
+                    perf_stats['actually_materialized'] += 1
+                    yield el
+                to_return = []
+            else:
+                # Now we need to check every join graph individually and see if it's materializable. Only once we've
+                # exhausted these join graphs we move on to the next candidate group. We know already that each of the
+                # join graphs covers all tables in candidate_group, so if they're materializable we're good.
+                total_materializable_join_graphs = 0
+                materializable_join_graphs = []
+                for jpg in join_graphs:
+                    # Obtain filters that apply to this join graph
+                    filters = set()
+                    for l, r in jpg:
+                        if l.source_name in table_fulfilled_filters:
+                            filters.update(table_fulfilled_filters[l.source_name])
+                        if r.source_name in table_fulfilled_filters:
+                            filters.update(table_fulfilled_filters[r.source_name])
+
+                    # TODO: obtain join_graph score for diff metrics. useful for ranking later
+                    # rank_materializable_join_graphs(materializable_join_paths, table_path, dod)
+                    st_is_materializable = time.time()
+                    # if query view is all attributes, then it's always materializable or we could
+                    # join on a small sample and see -- we can have 2 different impls.
+                    if sum([0] + [1 for el in list_samples if el != '']) > 0:
+                        is_join_graph_valid = self.is_join_graph_materializable(jpg, table_fulfilled_filters)
+                    else:
+                        is_join_graph_valid = True
+                    et_is_materializable = time.time()
+                    perf_stats['time_is_materializable'] += (et_is_materializable - st_is_materializable)
+                    # Obtain all materializable graphs, then materialize
+                    if is_join_graph_valid:
+                        total_materializable_join_graphs += 1
+                        materializable_join_graphs.append((jpg, filters))
+                # At this point we can empty is-join-graph-materializable cache and create a new one
+                # dpu.empty_relation_cache()  # TODO: If df.copy() works, then this is a nice reuse
+                st_materialize = time.time()
+                to_return = self.materialize_join_graphs(materializable_join_graphs)
+                et_materialize = time.time()
+                perf_stats['time_materialize'] += (et_materialize - st_materialize)
             # yield to_return
             for el in to_return:
                 if 'actually_materialized' not in perf_stats:
@@ -353,7 +406,7 @@ class DoD:
             attrs_to_project = dpu.obtain_attributes_to_project(filters)
             # continue  # test
             materialized_virtual_schema = dpu.materialize_join_graph_sample(mjg, self, sample_size=1000)
-            # materialized_virtual_schema = dpu.materialize_join_graph(mjg, self)
+            # materialized_virtual_schema = dpu.materialize_join_graph(mjg, self, attributes_to_project=attrs_to_project)
             if materialized_virtual_schema is False:
                 continue  # happens when the join was an outlier
             # Create metadata to document this view
@@ -365,6 +418,83 @@ class DoD:
             # yield materialized_virtual_schema, attrs_to_project, view_metadata
         return to_return
 
+    def check_and_materialize_join_graphs(self, join_graphs, table_fulfilled_filters, check, table_path=None):
+        """
+        Parallel version of checking every join graph with is_join_graph_materializable and materializing the valid
+        ones with materialize_join_graphs. Workers read the relations themselves, through their own relation cache
+        and the parquet files of the cache directory, and the join graphs in flight are limited so that their
+        estimated memory stays within materialization_memory
+        :param check: whether join graphs must be checked before they are materialized
+        :param table_path: known table -> directory, the rest are looked up in the store
+        :return: generator of (view, attributes to project, metadata) in the order of join_graphs, that returns the
+        number of materializable join graphs. The #join_graphs of the metadata counts the materializable join graphs
+        found so far, and is set to the total once all join graphs are done
+        """
+        paths = dict(table_path) if table_path is not None else dict()
+        tasks = []
+        task_memory = []
+        for jpg in join_graphs:
+            filters = set()
+            memory = 0
+            for l, r in jpg:
+                for hit in (l, r):
+                    if hit.source_name not in paths:
+                        paths[hit.source_name] = self.aurum_api.helper.get_path_nid(hit.nid)
+                    if hit.source_name in table_fulfilled_filters:
+                        filters.update(table_fulfilled_filters[hit.source_name])
+            for table in {hit.source_name for hop in jpg for hit in hop}:
+                memory += relation_memory(paths[table] + "/" + table)
+            tasks.append((jpg, filters, table_fulfilled_filters if check else None,
+                          {hit.source_name: paths[hit.source_name] for hop in jpg for hit in hop}))
+            task_memory.append(memory)
+
+        total_materializable_join_graphs = 0
+        yielded_metadata = []
+        for (jpg, filters, _, _), view in zip(tasks, self._run_in_pool(tasks, task_memory)):
+            if view is None:
+                continue  # not materializable
+            total_materializable_join_graphs += 1
+            if view is False:
+                continue  # happens when the join was an outlier
+            view_metadata = dict()
+            view_metadata["#join_graphs"] = total_materializable_join_graphs
+            view_metadata["join_graph"] = self.format_join_graph_into_nodes_edges(jpg)
+            yielded_metadata.append(view_metadata)
+            yield view, dpu.obtain_attributes_to_project(filters), view_metadata
+        for view_metadata in yielded_metadata:
+            view_metadata["#join_graphs"] = total_materializable_join_graphs
+        return total_materializable_join_graphs
+
+    def _run_in_pool(self, tasks, task_memory):
+        """
+        Runs check_and_materialize_join_graph on every task, starting a task only if the memory of the tasks in
+        flight stays within materialization_memory; one task always runs even if it is bigger. Finished results count
+        against materialization_memory until they are consumed
+        :return: generator of the results, in the order of tasks
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.num_workers, initializer=dpu.configure_csv_separator,
+                                             initargs=(dpu.data_separator,))
+        in_flight = deque()
+        memory = 0
+        next_task = 0
+        while next_task < len(tasks) or len(in_flight) > 0:
+            while next_task < len(tasks) and len(in_flight) < 2 * self.num_workers and \
+                    (len(in_flight) == 0 or memory + task_memory[next_task] <= self.materialization_memory):
+                result = self.pool.apply_async(check_and_materialize_join_graph, (tasks[next_task],))
+                in_flight.append((result, task_memory[next_task]))
+                memory += task_memory[next_task]
+                next_task += 1
+            result, result_memory = in_flight.popleft()
+            memory -= result_memory
+            yield result.get()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def joinable(self, group_tables: [str], cache_unjoinable_pairs: defaultdict(int), max_hops=2):
         """
         Find all join graphs that connect the tables in group_tables. This boils down to check
@@ -395,11 +525,14 @@ class DoD:
             # Check cache first, if not in cache then do the search
             # drs = self.are_paths_in_cache(table1, table2)
             paths = self.are_paths_in_cache(table1, table2)  # list of lists
+            if paths is None and self.join_path_index is not None and max_hops <= self.join_path_index.max_hops:
+                paths = self.join_path_index.join_paths(table1, table2, max_hops=max_hops)
+                self.place_paths_in_cache(table1, table2, paths)
             if paths is None:
                 print("Finding paths between " + str(table1) + " and " + str(table2))
                 print("max hops: " + str(max_hops))
                 s = time.time()
-                drs = self.aurum_api.paths(t1, t2, Relation.PKFK, max_hops=max_hops, lean_search=True)
+                drs = self.aurum_api.paths(t1, t2, Relation.PKFK, max_hops=max_hops)
                 e = time.time()
                 print("Total time: " + str((e-s)))
                 paths = drs.paths()  # list of lists
@@ -502,69 +635,100 @@ class DoD:
         return jp_hops
 
     def is_join_graph_materializable(self, join_graph, table_fulfilled_filters):
-        # FIXME: add a way of collecting the join cardinalities and propagating them outside as well
-        local_intermediates = dict()
-
-        for l, r in join_graph:
-            # apply filters to l
-            if l.source_name not in local_intermediates:
-                l_path = self.aurum_api.helper.get_path_nid(l.nid)
-                # If there are filters apply them
-                if l.source_name in table_fulfilled_filters:
-                    filters_l = table_fulfilled_filters[l.source_name]
-                    filtered_l = None
-                    for info, filter_type, filter_id in filters_l:
-                        if filter_type == FilterType.ATTR:
-                            filtered_l = dpu.read_relation_on_copy(l_path + l.source_name)  # FIXME FIXME FIXME
-                            # filtered_l = dpu.get_dataframe(l_path + l.source_name)
-                            continue  # no need to filter anything if the filter is only attribute type
-                        attribute = info[1]
-                        cell_value = info[0]
-                        filtered_l = dpu.apply_filter(l_path + l.source_name, attribute, cell_value)# FIXME FIXME FIXME
-
-                    if len(filtered_l) == 0:
-                        return False  # filter does not leave any data => non-joinable
-                # If there are not filters, then do not apply them
-                else:
-                    filtered_l = dpu.read_relation_on_copy(l_path + l.source_name)# FIXME FIXME FIXME
-                    # filtered_l = dpu.get_dataframe(l_path + l.source_name)
+        return is_join_graph_materializable(join_graph, table_fulfilled_filters,
+                                            lambda hit: self.aurum_api.helper.get_path_nid(hit.nid))
+
+
+def is_join_graph_materializable(join_graph, table_fulfilled_filters, get_path):
+    """
+    Checks that every hop of join_graph gives rows once the filters are applied to its tables
+    :param get_path: function that returns the directory of the table of a Hit
+    """
+    # FIXME: add a way of collecting the join cardinalities and propagating them outside as well
+    local_intermediates = dict()
+
+    for l, r in join_graph:
+        # apply filters to l
+        if l.source_name not in local_intermediates:
+            l_path = get_path(l)
+            # If there are filters apply them
+            if l.source_name in table_fulfilled_filters:
+                filters_l = table_fulfilled_filters[l.source_name]
+                filtered_l = None
+                for info, filter_type, filter_id in filters_l:
+                    if filter_type == FilterType.ATTR:
+                        filtered_l = dpu.read_relation_on_copy(l_path + l.source_name)  # FIXME FIXME FIXME
+                        # filtered_l = dpu.get_dataframe(l_path + l.source_name)
+                        continue  # no need to filter anything if the filter is only attribute type
+                    attribute = info[1]
+                    cell_value = info[0]
+                    filtered_l = dpu.apply_filter(l_path + l.source_name, attribute, cell_value)# FIXME FIXME FIXME
+
+                if len(filtered_l) == 0:
+                    return False  # filter does not leave any data => non-joinable
+            # If there are not filters, then do not apply them
             else:
-                filtered_l = local_intermediates[l.source_name]
-            local_intermediates[l.source_name] = filtered_l
-
-            # apply filters to r
-            if r.source_name not in local_intermediates:
-                r_path = self.aurum_api.helper.get_path_nid(r.nid)
-                # If there are filters apply them
-                if r.source_name in table_fulfilled_filters:
-                    filters_r = table_fulfilled_filters[r.source_name]
-                    filtered_r = None
-                    for info, filter_type, filter_id in filters_r:
-                        if filter_type == FilterType.ATTR:
-                            filtered_r = dpu.read_relation_on_copy(r_path + r.source_name)# FIXME FIXME FIXME
-                            # filtered_r = dpu.get_dataframe(r_path + r.source_name)
-                            continue  # no need to filter anything if the filter is only attribute type
-                        attribute = info[1]
-                        cell_value = info[0]
-                        filtered_r = dpu.apply_filter(r_path + r.source_name, attribute, cell_value)
-
-                    if len(filtered_r) == 0:
-                        return False  # filter does not leave any data => non-joinable
-                # If there are not filters, then do not apply them
-                else:
-                    filtered_r = dpu.read_relation_on_copy(r_path + r.source_name)# FIXME FIXME FIXME
-                    # filtered_r = dpu.get_dataframe(r_path + r.source_name)
+                filtered_l = dpu.read_relation_on_copy(l_path + l.source_name)# FIXME FIXME FIXME
+                # filtered_l = dpu.get_dataframe(l_path + l.source_name)
+        else:
+            filtered_l = local_intermediates[l.source_name]
+        local_intermediates[l.source_name] = filtered_l
+
+        # apply filters to r
+        if r.source_name not in local_intermediates:
+            r_path = get_path(r)
+            # If there are filters apply them
+            if r.source_name in table_fulfilled_filters:
+                filters_r = table_fulfilled_filters[r.source_name]
+                filtered_r = None
+                for info, filter_type, filter_id in filters_r:
+                    if filter_type == FilterType.ATTR:
+                        filtered_r = dpu.read_relation_on_copy(r_path + r.source_name)# FIXME FIXME FIXME
+                        # filtered_r = dpu.get_dataframe(r_path + r.source_name)
+                        continue  # no need to filter anything if the filter is only attribute type
+                    attribute = info[1]
+                    cell_value = info[0]
+                    filtered_r = dpu.apply_filter(r_path + r.source_name, attribute, cell_value)
+
+                if len(filtered_r) == 0:
+                    return False  # filter does not leave any data => non-joinable
+            # If there are not filters, then do not apply them
             else:
-                filtered_r = local_intermediates[r.source_name]
-            local_intermediates[r.source_name] = filtered_r
-
-            # check if the materialized version join's cardinality > 0
-            joined = dpu.join_ab_on_key(filtered_l, filtered_r, l.field_name, r.field_name, suffix_str="_x")
-
-            if len(joined) == 0:
-                return False  # non-joinable hop enough to discard join graph
-        # if we make it through all hopes, then join graph is materializable (i.e., verified)
-        return True
+                filtered_r = dpu.read_relation_on_copy(r_path + r.source_name)# FIXME FIXME FIXME
+                # filtered_r = dpu.get_dataframe(r_path + r.source_name)
+        else:
+            filtered_r = local_intermediates[r.source_name]
+        local_intermediates[r.source_name] = filtered_r
+
+        # check if the materialized version join's cardinality > 0
+        joined = dpu.join_ab_on_key(filtered_l, filtered_r, l.field_name, r.field_name, suffix_str="_x")
+
+        if len(joined) == 0:
+            return False  # non-joinable hop enough to discard join graph
+    # if we make it through all hopes, then join graph is materializable (i.e., verified)
+    return True
+
+
+def relation_memory(relation_path):
+    # a DataFrame takes a few times the size of its csv
+    try:
+        return 3 * os.path.getsize(relation_path)
+    except OSError:
+        return 0
+
+
+def check_and_materialize_join_graph(task):
+    """
+    Runs in the workers of DoD.check_and_materialize_join_graphs
+    :param task: (join graph, filters, table_fulfilled_filters or None if it need not be checked, table -> directory)
+    :return: the materialized view, None if the join graph is not materializable and False if the join was an
+    outlier
+    """
+    jpg, filters, table_fulfilled_filters, paths = task
+    if table_fulfilled_filters is not None:
+        if not is_join_graph_materializable(jpg, table_fulfilled_filters, lambda hit: paths[hit.source_name]):
+            return None
+    return dpu.materialize_join_graph_sample(jpg, None, sample_size=1000, paths=paths)
 
 
 def rank_materializable_join_graphs(materializable_join_paths, table_path, dod):
@@ -713,7 +877,7 @@ def test_e2e(dod, attrs, values, number_jps=5, output_path=None, full_view=False
     # Run 4C
     ###
     # return
-    groups_per_column_cardinality = v4c.main(output_path)
+    groups_per_column_cardinality, schema_id_info = v4cv.main(output_path)
 
     for k, v in groups_per_column_cardinality.items():
         compatible_groups = v['compatible']
@@ -774,7 +938,7 @@ def test_dpu(dod):
     for mjp in clean_jp:
         attrs_to_project = dpu.obtain_attributes_to_project(mjp)
         # materialized_virtual_schema = dpu.materialize_join_path(mjp, self)
-        materialized_virtual_schema = dpu.materialize_join_graph(mjp, dod)
+        materialized_virtual_schema = dpu.materialize_join_graph(mjp, dod, attributes_to_project=attrs_to_project)
         yield materialized_virtual_schema, attrs_to_project
 
 
@@ -782,9 +946,13 @@ def main(args):
     model_path = args.model_path
     separator = args.separator
 
+    dpu.enable_relation_cache_copy_on_write()
     store_client = StoreHandler()
-    network = fieldnetwork.deserialize_network(model_path)
-    dod = DoD(network=network, store_client=store_client, csv_separator=separator)
+    network = fieldnetwork.deserialize_network(model_path, backend=modelformat.model_backend(model_path))
+    join_path_index = jpi.load_or_build_join_path_index(network, model_path)
+    join_estimator = je.JoinEstimator(store_client, hll_sketches=je.load_hll_sketches(model_path))
+    dod = DoD(network=network, store_client=store_client, csv_separator=separator, join_path_index=join_path_index,
+              join_estimator=join_estimator)
 
     attrs = args.list_attributes.split(";")
     values = args.list_values.split(";")
@@ -823,7 +991,7 @@ def pe_paths(dod):
     t1.set_table_mode()
     t2.set_table_mode()
     i = time.time()
-    drs = dod.aurum_api.paths(t1, t2, Relation.PKFK, max_hops=2, lean_search=True)
+    drs = dod.aurum_api.paths(t1, t2, Relation.PKFK, max_hops=2)
     a = drs.paths()
     e = time.time()
     print("Total time: " + str((e - s)))
@@ -845,8 +1013,10 @@ if __name__ == "__main__":
     # sep = ","
     # sep = "|"
     sep = ";"
+    dpu.enable_relation_cache_copy_on_write()
     store_client = StoreHandler()
-    network = fieldnetwork.deserialize_network(path_to_serialized_model)
+    network = fieldnetwork.deserialize_network(path_to_serialized_model,
+                                               backend=modelformat.model_backend(path_to_serialized_model))
     dod = DoD(network=network, store_client=store_client, csv_separator=sep)
 
     ###
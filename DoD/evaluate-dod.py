@@ -3,6 +3,7 @@ from modelstore.elasticstore import StoreHandler
 from DoD.dod import DoD
 from DoD import data_processing_utils as dpu
 from DoD import view_4c_analysis_baseline as v4c
+from DoD import view_4c_analysis_vectorized as v4cv
 
 from tqdm import tqdm
 import pandas as pd
@@ -97,6 +98,11 @@ def run_4c_nochasing(path):
     return groups_per_column_cardinality
 
 
+def run_4c_vectorized(path):
+    groups_per_column_cardinality = v4cv.main(path)
+    return groups_per_column_cardinality
+
+
 def run_4c_valuewise_main(path):
     groups_per_column_cardinality = v4c.valuewise_main(path)
     return groups_per_column_cardinality
@@ -334,6 +340,12 @@ def compare_4c_baselines(many_views, few_views):
         e = time.time()
         print("#$# No Chasing")
         print("#$# " + str(num_views) + " " + str((e - s)))
+
+        s = time.time()
+        run_4c_vectorized(path)
+        e = time.time()
+        print("#$# Vectorized")
+        print("#$# " + str(num_views) + " " + str((e - s)))
     for num_views, path in tqdm(few_views):
         print("#$# " + str(path))
         s = time.time()
@@ -348,6 +360,12 @@ def compare_4c_baselines(many_views, few_views):
         print("#$# No Chasing")
         print("#$# " + str(num_views) + " " + str((e - s)))
 
+        s = time.time()
+        run_4c_vectorized(path)
+        e = time.time()
+        print("#$# Vectorized")
+        print("#$# " + str(num_views) + " " + str((e - s)))
+
     # s = time.time()
     # run_4c_valuewise_main(path)
     # e = time.time()
@@ -434,6 +452,7 @@ if __name__ == "__main__":
     path_to_serialized_model = "/Users/ra-mit/development/discovery_proto/models/chembl_and_drugcentral/"
     # sep = ","
     sep = ";"
+    dpu.enable_relation_cache_copy_on_write()
     store_client = StoreHandler()
     network = fieldnetwork.deserialize_network(path_to_serialized_model)
     dod = DoD(network=network, store_client=store_client, csv_separator=sep)
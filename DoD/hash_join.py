@@ -0,0 +1,209 @@
+import math
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from DoD.relation_cache import parquet_available
+
+
+def join_output_rows(a_keys: pd.Series, b_keys: pd.Series):
+    """
+    Exact number of rows of the equi-join of the two key columns
+    """
+    a_counts = a_keys.value_counts()
+    b_counts = b_keys.value_counts()
+    a_counts, b_counts = a_counts.align(b_counts, join='inner')
+    return int((a_counts.values.astype(np.int64) * b_counts.values.astype(np.int64)).sum())
+
+
+def row_size(df: pd.DataFrame):
+    if len(df) == 0:
+        return 0.0
+    return float(sum(df.memory_usage(deep=False)) / len(df))
+
+
+def partition_ids(keys: pd.Series, num_partitions):
+    return pd.util.hash_pandas_object(keys, index=False).values % np.uint64(num_partitions)
+
+
+def _write_partition(df, path):
+    """
+    Partitions are parquet files if parquet is available, pickled DataFrames otherwise or when the columns
+    cannot be stored in parquet
+    """
+    if parquet_available:
+        try:
+            df.to_parquet(path + ".parquet")
+            return path + ".parquet"
+        except Exception:
+            if os.path.isfile(path + ".parquet"):
+                os.remove(path + ".parquet")
+    df.to_pickle(path + ".pkl")
+    return path + ".pkl"
+
+
+def _read_partition(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def partition_to_disk(df: pd.DataFrame, key, num_partitions, directory, prefix):
+    """
+    Hash-partitions df on key and writes each non-empty partition in directory
+    :return: dict partition id -> file
+    """
+    files = dict()
+    pids = partition_ids(df[key], num_partitions)
+    for pid, rows in pd.Series(np.arange(len(df))).groupby(pids):
+        files[int(pid)] = _write_partition(df.iloc[rows.values], os.path.join(directory, prefix + str(pid)))
+    return files
+
+
+class SpilledRelation:
+    """
+    A relation that does not fit in memory, kept on disk as a sequence of DataFrame chunks in a temporary directory
+    that is removed with the object. It offers the few DataFrame operations the views of DoD go through, chunk by
+    chunk, and chunks() for the rest
+    """
+
+    def __init__(self, empty: pd.DataFrame, spill_dir=None):
+        """
+        :param empty: a DataFrame without rows, with the columns and dtypes of the chunks
+        :param spill_dir: where to create the temporary directory, the system default if None
+        """
+        self.empty = empty.iloc[:0]
+        self.directory = tempfile.mkdtemp(prefix="spill_", dir=spill_dir)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self.files = []
+        self.num_rows = 0
+
+    def __getstate__(self):
+        # a relation pickled to another process, e.g., the view a DoD worker returns, is owned by the process that
+        # unpickles it: its files must outlive this object
+        self._finalizer.detach()
+        state = dict(self.__dict__)
+        del state['_finalizer']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    @property
+    def columns(self):
+        return self.empty.columns
+
+    def __len__(self):
+        return self.num_rows
+
+    def append(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        if len(self.files) == 0:
+            self.empty = df.iloc[:0]  # pd.merge of empty frames may order the columns differently
+        path = os.path.join(self.directory, "chunk_" + str(len(self.files)))
+        self.files.append(_write_partition(df, path))
+        self.num_rows += len(df)
+
+    def chunks(self):
+        """
+        :return: generator of the chunks of the relation, one in memory at a time
+        """
+        for path in self.files:
+            yield _read_partition(path)
+
+    def map(self, function):
+        """
+        :param function: DataFrame -> DataFrame applied to each chunk, e.g., a selection or a projection
+        :return: a new SpilledRelation with the result
+        """
+        output = SpilledRelation(function(self.empty), spill_dir=os.path.dirname(self.directory))
+        for chunk in self.chunks():
+            output.append(function(chunk))
+        return output
+
+    def head(self, n=5):
+        rows = []
+        for chunk in self.chunks():
+            rows.append(chunk.head(n - sum(len(r) for r in rows)))
+            if sum(len(r) for r in rows) >= n:
+                break
+        if len(rows) == 0:
+            return self.empty
+        return pd.concat(rows, ignore_index=True)
+
+    def to_frame(self):
+        """
+        :return: the whole relation as a DataFrame, only for relations that turn out to fit in memory
+        """
+        if len(self.files) == 0:
+            return self.empty
+        return pd.concat(list(self.chunks()), ignore_index=True)
+
+    def to_csv(self, path, **kwargs):
+        """
+        Writes the relation to a csv file a chunk at a time, with the arguments of DataFrame.to_csv
+        """
+        self.empty.to_csv(path, **kwargs)
+        kwargs = dict(kwargs, mode='a', header=False)
+        for chunk in self.chunks():
+            chunk.to_csv(path, **kwargs)
+
+
+def spill(chunks, empty: pd.DataFrame, spill_dir=None):
+    """
+    Writes each DataFrame of chunks to disk as soon as it is produced
+    :param empty: a DataFrame without rows, with the columns of the chunks
+    :return: SpilledRelation with the chunks
+    """
+    relation = SpilledRelation(empty, spill_dir=spill_dir)
+    for chunk in chunks:
+        relation.append(chunk)
+    return relation
+
+
+def grace_hash_join(a: pd.DataFrame, b: pd.DataFrame, a_key: str, b_key: str, memory_budget, suffix_str=None,
+                    spill_dir=None, output_rows=None):
+    """
+    Out-of-core hash join of a and b on already normalized keys. Both inputs are hash-partitioned on the key and
+    spilled to a temporary directory of this join, then the partitions are joined one by one so that each
+    partition join, and each chunk of output it produces, fits in memory_budget
+    :param spill_dir: where to create the temporary directory of the join, the system default if None
+    :param output_rows: join_output_rows of a and b if the caller already has it
+    :return: generator of joined DataFrames, with the same columns as pd.merge of a and b
+    """
+    o_row_size = max(row_size(a) + row_size(b), 1.0)
+    input_bytes = sum(a.memory_usage(deep=False)) + sum(b.memory_usage(deep=False))
+    if output_rows is None:
+        output_rows = join_output_rows(a[a_key], b[b_key])
+    output_bytes = output_rows * o_row_size
+    num_partitions = max(2, int(math.ceil((input_bytes + output_bytes) / memory_budget)))
+
+    directory = tempfile.mkdtemp(prefix="join_", dir=spill_dir)
+    try:
+        a_files = partition_to_disk(a, a_key, num_partitions, directory, "a_")
+        b_files = partition_to_disk(b, b_key, num_partitions, directory, "b_")
+        produced = False
+        for pid in sorted(set(a_files.keys()) & set(b_files.keys())):
+            a_part = _read_partition(a_files[pid])
+            b_part = _read_partition(b_files[pid])
+            # a partition with skewed keys may produce more than the budget, then it is joined by chunks of b
+            part_bytes = join_output_rows(a_part[a_key], b_part[b_key]) * o_row_size
+            num_chunks = max(1, int(math.ceil(part_bytes / memory_budget)))
+            chunk_size = int(math.ceil(len(b_part) / num_chunks))
+            for start in range(0, len(b_part), chunk_size):
+                joined = pd.merge(a_part, b_part.iloc[start:start + chunk_size], how='inner', left_on=a_key,
+                                  right_on=b_key, sort=False, suffixes=('', suffix_str))
+                if len(joined) > 0:
+                    produced = True
+                    yield joined
+        if not produced:
+            yield pd.merge(a.iloc[:0], b.iloc[:0], how='inner', left_on=a_key, right_on=b_key, sort=False,
+                           suffixes=('', suffix_str))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,225 @@
+"""
+Estimates of the size of joins from the profile of the columns, without reading the data: number of values,
+number of distinct values and minhash, all in the store, and optionally HyperLogLog sketches of the normalized
+values of each column, built with build_hll_sketches and stored next to the model
+"""
+import os
+import sys
+from collections import defaultdict
+from collections import namedtuple
+
+import numpy as np
+from datasketch import HyperLogLog
+
+from DoD import data_processing_utils as dpu
+from inputoutput import inputoutput as io
+import config as C
+
+HLL_FILE = "column_hll.pkl"
+
+# an intersection is told apart from an empty one if the sketches expect this many matches, or standard errors
+SKETCH_RESOLUTION = 3
+
+# intersection: estimated number of distinct key values in both columns
+# containment_l, containment_r: fraction of the distinct values of l (r) that are also in r (l)
+# rows: estimated number of rows of the join of the two tables
+# conclusive: False if the sketches cannot tell the intersection apart from 0, even if one column contains the
+# other, e.g., a foreign key with few values into a much bigger primary key
+JoinEstimate = namedtuple('JoinEstimate', 'intersection containment_l containment_r rows conclusive')
+
+
+class JoinEstimator:
+
+    def __init__(self, store_client, hll_sketches=None):
+        self.store_client = store_client
+        self.hll_sketches = hll_sketches if hll_sketches is not None else dict()  # nid -> HyperLogLog
+        self.sketches = dict()  # nid -> (total values, distinct values, minhash or None)
+
+    def add_sketch(self, nid, total_values, unique_values, minhash=None):
+        if minhash is not None:
+            minhash = np.asarray(minhash, dtype=np.int64)
+        self.sketches[str(nid)] = (total_values, unique_values, minhash)
+
+    def _fetch(self, nids):
+        missing = list({str(nid) for nid in nids if str(nid) not in self.sketches})
+        if len(missing) == 0 or self.store_client is None:
+            return
+        found = self.store_client.get_fields_sketches(missing)
+        for nid in missing:
+            total_values, unique_values, minhash = found.get(nid, (None, None, None))
+            self.add_sketch(nid, total_values, unique_values, minhash)
+
+    def total_values(self, nid):
+        return self.sketches.get(str(nid), (None, None, None))[0]
+
+    def distinct_values(self, nid):
+        hll = self.hll_sketches.get(str(nid))
+        if hll is not None:
+            return hll.count()
+        return self.sketches.get(str(nid), (None, None, None))[1]
+
+    def intersection(self, l_nid, r_nid):
+        """
+        Estimated number of distinct values in both columns, from the minhashes if both columns have one, from the
+        HyperLogLog sketches otherwise. None if there are no sketches to tell
+        """
+        l_distinct = self.distinct_values(l_nid)
+        r_distinct = self.distinct_values(r_nid)
+        if not l_distinct or not r_distinct:
+            return None
+        l_mh = self.sketches.get(str(l_nid), (None, None, None))[2]
+        r_mh = self.sketches.get(str(r_nid), (None, None, None))[2]
+        if l_mh is not None and r_mh is not None and len(l_mh) == len(r_mh):
+            jaccard = float(np.mean(l_mh == r_mh))
+            intersection = jaccard / (1 + jaccard) * (l_distinct + r_distinct)
+        elif str(l_nid) in self.hll_sketches and str(r_nid) in self.hll_sketches:
+            union = HyperLogLog(reg=self.hll_sketches[str(l_nid)].reg)
+            union.merge(self.hll_sketches[str(r_nid)])
+            intersection = max(0.0, l_distinct + r_distinct - union.count())
+        else:
+            return None
+        return min(intersection, l_distinct, r_distinct)
+
+    def resolution(self, l_nid, r_nid):
+        """
+        Smallest intersection the sketches used by intersection tell apart from an empty one. With minhashes, an
+        intersection of s values gives num_perm * s / (l + r - s) matching hashes, expected, and the resolution is the
+        s that gives SKETCH_RESOLUTION of them; with HyperLogLog it is SKETCH_RESOLUTION standard errors of the count
+        of the union. 0 if there are no sketches
+        """
+        l_distinct = self.distinct_values(l_nid)
+        r_distinct = self.distinct_values(r_nid)
+        if not l_distinct or not r_distinct:
+            return 0
+        l_mh = self.sketches.get(str(l_nid), (None, None, None))[2]
+        r_mh = self.sketches.get(str(r_nid), (None, None, None))[2]
+        if l_mh is not None and r_mh is not None and len(l_mh) == len(r_mh):
+            return SKETCH_RESOLUTION * (l_distinct + r_distinct) / (len(l_mh) + SKETCH_RESOLUTION)
+        elif str(l_nid) in self.hll_sketches and str(r_nid) in self.hll_sketches:
+            num_registers = len(self.hll_sketches[str(l_nid)].reg)
+            return SKETCH_RESOLUTION * 1.04 / np.sqrt(num_registers) * (l_distinct + r_distinct)
+        return 0
+
+    def estimate_hop(self, l, r):
+        """
+        :param l: Hit of the join column of the left table
+        :param r: Hit of the join column of the right table
+        :return: JoinEstimate, with None for what cannot be estimated
+        """
+        self._fetch([l.nid, r.nid])
+        intersection = self.intersection(l.nid, r.nid)
+        if intersection is None:
+            return JoinEstimate(None, None, None, None, False)
+        l_distinct = self.distinct_values(l.nid)
+        r_distinct = self.distinct_values(r.nid)
+        # if the smaller column fits under the resolution, not even its full containment would show
+        conclusive = min(l_distinct, r_distinct) >= self.resolution(l.nid, r.nid)
+        rows = None
+        l_total = self.total_values(l.nid)
+        r_total = self.total_values(r.nid)
+        if l_total is not None and r_total is not None:
+            # each distinct value appears the same number of times in its column
+            rows = intersection * (l_total / l_distinct) * (r_total / r_distinct)
+        return JoinEstimate(intersection, intersection / l_distinct, intersection / r_distinct, rows, conclusive)
+
+    def estimate_join_graph(self, join_graph):
+        """
+        :param join_graph: list of (l, r) hops, as DoD.joinable returns them
+        :return: (estimated rows of the join of all the tables or None, [JoinEstimate] of each hop)
+        """
+        self._fetch([h.nid for hop in join_graph for h in hop])
+        estimates = [self.estimate_hop(l, r) for l, r in join_graph]
+        if any(e.intersection is None or not e.conclusive for e in estimates):
+            return None, estimates
+        # rows of each table times the selectivity of each join, independent of each other
+        table_rows = dict()
+        for l, r in join_graph:
+            for h in (l, r):
+                table_rows[h.source_name] = max(table_rows.get(h.source_name, 0), self.total_values(h.nid) or 0)
+        rows = float(np.prod(list(table_rows.values())))
+        for (l, r), e in zip(join_graph, estimates):
+            rows *= e.intersection / (self.distinct_values(l.nid) * self.distinct_values(r.nid))
+        return rows, estimates
+
+    def prune_and_rank(self, join_graphs, max_rows=C.join_estimate_max_rows):
+        """
+        Drops the join graphs with a join that is estimated empty or whose output is estimated bigger than max_rows,
+        and sorts the rest so that the join graphs whose joins keep more of their tables come first. Join graphs
+        without sketches for a hop are kept, and so are those with a hop the sketches cannot tell from an empty one,
+        which rank by their estimate, i.e., last
+        :return: the join graphs that are left, best first
+        """
+        ranked = []
+        for i, join_graph in enumerate(join_graphs):
+            rows, estimates = self.estimate_join_graph(join_graph)
+            if any(e.intersection == 0 and e.conclusive for e in estimates):
+                continue
+            if rows is not None and rows > max_rows:
+                continue
+            score = 1.0
+            for e in estimates:
+                if e.intersection is not None:
+                    score *= max(e.containment_l, e.containment_r)
+            ranked.append((-score, i, join_graph))
+        ranked.sort(key=lambda x: (x[0], x[1]))
+        print("Join graphs pruned with sketches: " + str(len(join_graphs) - len(ranked)))
+        return [join_graph for _, _, join_graph in ranked]
+
+
+def column_hll(values, p=12):
+    hll = HyperLogLog(p=p)
+    for value in {dpu.normalize_value(v) for v in values}:
+        if value != 'nan' and value != 'null':  # the values join_ab_on_key_optimizer drops
+            hll.update(value.encode('utf8'))
+    return hll
+
+
+def build_hll_sketches(network, store_client, p=12):
+    """
+    HyperLogLog sketch of the normalized values of every column in the network. Reads every table once
+    :return: dict nid -> HyperLogLog
+    """
+    table_fields = defaultdict(list)
+    for nid in network.iterate_ids():
+        _, _, source_name, field_name = network.get_info_for([nid])[0]
+        table_fields[source_name].append((nid, field_name))
+    sketches = dict()
+    for table, fields in table_fields.items():
+        path = store_client.get_path_of(fields[0][0])
+        df = dpu.get_dataframe(path + table)
+        for nid, field_name in fields:
+            if field_name in df.columns:
+                sketches[str(nid)] = column_hll(df[field_name].values, p=p)
+    return sketches
+
+
+def serialize_hll_sketches(sketches, path):
+    io.serialize_object({nid: hll.reg for nid, hll in sketches.items()}, path + HLL_FILE)
+
+
+def load_hll_sketches(path):
+    """
+    :return: the sketches stored in path, None if there are none
+    """
+    if not os.path.isfile(path + HLL_FILE):
+        return None
+    registers = io.deserialize_object(path + HLL_FILE)
+    return {nid: HyperLogLog(reg=reg) for nid, reg in registers.items()}
+
+
+if __name__ == "__main__":
+    from knowledgerepr import fieldnetwork
+    from modelstore.elasticstore import StoreHandler
+
+    if len(sys.argv) != 3:
+        print("USAGE: python join_estimation.py <path_to_serialized_model> <csv_separator>")
+        exit()
+
+    model_path = sys.argv[1]
+    if not model_path.endswith('/'):
+        model_path = model_path + '/'
+    dpu.configure_csv_separator(sys.argv[2])
+    network = fieldnetwork.deserialize_network(model_path)
+    hll_sketches = build_hll_sketches(network, StoreHandler())
+    serialize_hll_sketches(hll_sketches, model_path)
+    print("Sketches of " + str(len(hll_sketches)) + " columns written in: " + model_path + HLL_FILE)
@@ -0,0 +1,169 @@
+import itertools
+import os
+from collections import defaultdict
+
+from api.apiutils import Relation
+from inputoutput import inputoutput as io
+
+
+INDEX_FILE = "join_path_index.pkl"
+INDEX_VERSION = 1
+
+
+class JoinPathIndex:
+    """
+    Precomputed join paths between every pair of tables that join within max_hops. The index keeps table-level
+    paths only, the columns that join each pair of tables come from the table join graph of the network, so the
+    index stays valid when PKFK edges change between tables that were already joinable and it only has to be
+    updated when tables start or stop joining
+    """
+
+    def __init__(self, network, max_hops=2, relation=Relation.PKFK):
+        self.network = network
+        self.max_hops = max_hops
+        self.relation = relation
+        self.table_edges = set()  # frozenset of the two tables of every table join
+        self.paths = dict()  # (t1, t2), t1 < t2 -> list of table paths from t1 to t2, shortest first
+
+    def build(self):
+        join_graph = self.network.table_join_graph(self.relation)
+        self.table_edges = self._table_edges(join_graph)
+        self.paths = dict()
+        for source in join_graph.keys():
+            for table_path in self._paths_from(join_graph, source):
+                if source < table_path[-1]:
+                    self.paths.setdefault((source, table_path[-1]), []).append(table_path)
+        for key in self.paths.keys():
+            self.paths[key].sort(key=lambda p: len(p))
+
+    def _table_edges(self, join_graph):
+        return set(frozenset((t1, t2)) for t1, neighbors in join_graph.items() for t2 in neighbors.keys())
+
+    def _paths_from(self, join_graph, source):
+        """
+        All the paths of at most max_hops joins that start in source and do not go twice through the same table
+        """
+        stack = [[source]]
+        while len(stack) > 0:
+            table_path = stack.pop()
+            for neighbor in join_graph[table_path[-1]].keys():
+                if neighbor in table_path:
+                    continue
+                next_path = table_path + [neighbor]
+                yield next_path
+                if len(next_path) <= self.max_hops:
+                    stack.append(next_path)
+
+    def update(self):
+        """
+        Brings the index up to date with the current relation of the network. Only the paths of the tables that
+        are close enough to a table join that appeared or disappeared are computed again
+        """
+        join_graph = self.network.table_join_graph(self.relation)
+        table_edges = self._table_edges(join_graph)
+        changed = self.table_edges.symmetric_difference(table_edges)
+        if len(changed) == 0:
+            return
+
+        # a path that uses a changed join starts at most max_hops - 1 joins away from one of its tables
+        adjacency = defaultdict(set)
+        for t1, t2 in [tuple(e) for e in self.table_edges.union(table_edges) if len(e) == 2]:
+            adjacency[t1].add(t2)
+            adjacency[t2].add(t1)
+        affected = set(t for e in changed for t in e)
+        fringe = set(affected)
+        for hops in range(self.max_hops - 1):
+            fringe = set(n for t in fringe for n in adjacency[t]) - affected
+            affected.update(fringe)
+
+        self.paths = {k: v for k, v in self.paths.items() if k[0] not in affected and k[1] not in affected}
+        for source in affected:
+            if source not in join_graph:
+                continue
+            for table_path in self._paths_from(join_graph, source):
+                target = table_path[-1]
+                if target in affected and target < source:
+                    continue  # computed from target
+                if source < target:
+                    self.paths.setdefault((source, target), []).append(table_path)
+                else:
+                    self.paths.setdefault((target, source), []).append(list(reversed(table_path)))
+        for key, paths in self.paths.items():
+            if key[0] in affected or key[1] in affected:
+                paths.sort(key=lambda p: len(p))
+        self.table_edges = table_edges
+
+    def table_paths(self, table1, table2, max_hops=None):
+        """
+        :return: list of table paths from table1 to table2 with at most max_hops joins, shortest first
+        """
+        if max_hops is None:
+            max_hops = self.max_hops
+        if max_hops > self.max_hops:
+            print("ERROR index has paths of up to " + str(self.max_hops) + " hops, not " + str(max_hops))
+            raise Exception
+        if table1 < table2:
+            paths = self.paths.get((table1, table2), [])
+        else:
+            paths = [list(reversed(p)) for p in self.paths.get((table2, table1), [])]
+        return [p for p in paths if len(p) - 1 <= max_hops]
+
+    def join_paths(self, table1, table2, max_hops=None):
+        """
+        Join paths between two tables, in the same form DRS.paths() returns them for a table path query: the
+        first column, then, for every join, the column of the next table and, if the next join starts from a
+        different column, that column too
+        :return: list of join paths, each one a list of Hit
+        """
+        join_graph = self.network.table_join_graph(self.relation)
+        join_paths = []
+        for table_path in self.table_paths(table1, table2, max_hops=max_hops):
+            hops = [join_graph[t1][t2] for t1, t2 in zip(table_path, table_path[1:])]
+            for column_pairs in itertools.product(*hops):
+                join_path = [column_pairs[0][0]]
+                for (_, sibling), (c, _) in zip(column_pairs, column_pairs[1:]):
+                    join_path.append(sibling)
+                    if c.nid != sibling.nid:
+                        join_path.append(c)
+                join_path.append(column_pairs[-1][1])
+                join_paths.append(join_path)
+        return join_paths
+
+
+def serialize_join_path_index(index, path):
+    state = {"version": INDEX_VERSION, "max_hops": index.max_hops, "relation": index.relation,
+             "table_edges": index.table_edges, "paths": index.paths}
+    io.serialize_object(state, path + INDEX_FILE)
+
+
+def deserialize_join_path_index(network, path):
+    state = io.deserialize_object(path + INDEX_FILE)
+    if state["version"] != INDEX_VERSION:
+        print("ERROR unsupported join path index version: " + str(state["version"]))
+        raise Exception
+    index = JoinPathIndex(network, max_hops=state["max_hops"], relation=state["relation"])
+    index.table_edges = state["table_edges"]
+    index.paths = state["paths"]
+    return index
+
+
+def load_or_build_join_path_index(network, path, max_hops=2):
+    """
+    Loads the join path index stored next to the model in path, bringing it up to date with the network, or
+    builds and stores it if there is none or it has paths of fewer hops than max_hops
+    """
+    index = None
+    if os.path.isfile(path + INDEX_FILE):
+        index = deserialize_join_path_index(network, path)
+        if index.max_hops < max_hops:
+            index = None
+    if index is None:
+        index = JoinPathIndex(network, max_hops=max_hops)
+        index.build()
+        serialize_join_path_index(index, path)
+        return index
+    edges_before = set(index.table_edges)
+    index.update()
+    if index.table_edges != edges_before:
+        serialize_join_path_index(index, path)
+    return index
@@ -0,0 +1,217 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # required by pandas to read and write parquet
+    parquet_available = True
+except ImportError:
+    parquet_available = False
+
+
+def _has_option(option):
+    try:
+        pd.get_option(option)
+        return True
+    except Exception:
+        return False
+
+
+def enable_copy_on_write():
+    """
+    With copy-on-write, a shallow copy of a cached relation is as safe to modify as a deep one, and its columns
+    are only copied when they are modified. This sets a global pandas option, for every DataFrame of the process
+    :return: True if copy-on-write is enabled, False if this version of pandas does not support it
+    """
+    if not _has_option("mode.copy_on_write"):
+        return False
+    pd.set_option("mode.copy_on_write", True)
+    return True
+
+
+def dataframe_size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def normalize_value(value):
+    return str(value).lower()
+
+
+class ColumnValueIndex:
+    """
+    Rows of a column grouped by normalized value. Values are factorized once, the rows of value i are
+    rows[indptr[i]:indptr[i + 1]], in the order they appear in the column
+    """
+
+    def __init__(self, column):
+        codes, uniques = pd.factorize(column.map(normalize_value))
+        self.codes = {value: code for code, value in enumerate(uniques)}
+        self.rows = np.argsort(codes, kind='stable')
+        self.indptr = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(uniques)), out=self.indptr[1:])
+
+    def __contains__(self, value):
+        return value in self.codes
+
+    def lookup(self, value):
+        """
+        :param value: an already normalized value
+        :return: positions of the rows with that value
+        """
+        code = self.codes.get(value)
+        if code is None:
+            return self.rows[:0]
+        return self.rows[self.indptr[code]:self.indptr[code + 1]]
+
+    def size(self):
+        # approximate, the dict holds the normalized strings plus a pointer and an int per value
+        return self.rows.nbytes + self.indptr.nbytes + sum(len(v) + 100 for v in self.codes.keys())
+
+
+class RelationCache:
+    """
+    Relations read by DoD, kept in memory up to max_bytes. When a new relation does not fit, the least recently
+    used ones are evicted; a relation bigger than the whole budget is read but not kept. If parquet_dir is given
+    and parquet is available, every csv is converted to parquet the first time it is read, so reading it back
+    after it is evicted does not parse the csv again. The value indexes of a relation count towards the budget
+    and are evicted with it
+    """
+
+    def __init__(self, max_bytes, separator=',', encoding='latin1', parquet_dir=None, copy_on_write=False):
+        self.max_bytes = max_bytes
+        self.separator = separator
+        self.encoding = encoding
+        self.parquet_dir = parquet_dir if parquet_available else None
+        self.copy_on_write = copy_on_write
+        self.entries = OrderedDict()  # relation_path -> [df, size, {column: index}], least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, relation_path):
+        return relation_path in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, relation_path, copy=False):
+        """
+        :param relation_path:
+        :param copy: if True, return a copy that can be modified without changing the cached relation
+        :return: the relation as a DataFrame
+        """
+        entry = self.entries.get(relation_path)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(relation_path)
+            df = entry[0]
+        else:
+            self.misses += 1
+            df = self._read(relation_path)
+            self.put(relation_path, df)
+        if copy:
+            # a shallow copy is enough with copy-on-write
+            df = df.copy(deep=not self.copy_on_write)
+        return df
+
+    def columns(self, relation_path):
+        """
+        :return: the column names of the relation, without reading it if it is not in the cache
+        """
+        entry = self.entries.get(relation_path)
+        if entry is not None:
+            return list(entry[0].columns)
+        return list(pd.read_csv(relation_path, encoding=self.encoding, sep=self.separator, nrows=0).columns)
+
+    def get_columns(self, relation_path, columns):
+        """
+        Reads only some columns of the relation: from the cache if it is there, from its parquet file or the csv
+        otherwise. A projection is not kept in the cache
+        :return: a DataFrame with columns, that can be modified without changing the cached relation
+        """
+        entry = self.entries.get(relation_path)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(relation_path)
+            return entry[0][columns].copy(deep=not self.copy_on_write)
+        self.misses += 1
+        if self.parquet_dir is not None:
+            parquet_path = self._parquet_path(relation_path)
+            if os.path.isfile(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(relation_path):
+                return pd.read_parquet(parquet_path, columns=columns)
+        df = pd.read_csv(relation_path, encoding=self.encoding, sep=self.separator, usecols=columns)
+        return df[columns]  # usecols keeps the order of the file
+
+    def put(self, relation_path, df):
+        self.evict(relation_path)
+        size = dataframe_size(df)
+        if size > self.max_bytes:
+            return
+        self._make_room(size)
+        self.entries[relation_path] = [df, size, dict()]
+        self.size += size
+
+    def _make_room(self, size):
+        while self.size + size > self.max_bytes and len(self.entries) > 0:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted[1]
+            self.evictions += 1
+
+    def value_index(self, relation_path, column):
+        """
+        The index of the normalized values of a column, built the first time it is asked for
+        :param relation_path:
+        :param column:
+        :return: (relation as a DataFrame, ColumnValueIndex of column)
+        """
+        df = self.get(relation_path)
+        entry = self.entries.get(relation_path)
+        if entry is not None and column in entry[2]:
+            return df, entry[2][column]
+        index = ColumnValueIndex(df[column])
+        if entry is not None:
+            index_size = index.size()
+            if entry[1] + index_size <= self.max_bytes:
+                # make room without evicting the relation of the index
+                self.entries.pop(relation_path)
+                self.size -= entry[1]
+                self._make_room(entry[1] + index_size)
+                entry[1] += index_size
+                entry[2][column] = index
+                self.entries[relation_path] = entry
+                self.size += entry[1]
+        return df, index
+
+    def evict(self, relation_path):
+        entry = self.entries.pop(relation_path, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def _parquet_path(self, relation_path):
+        name = hashlib.md5(os.path.abspath(relation_path).encode('utf8')).hexdigest()
+        return os.path.join(self.parquet_dir, name + ".parquet")
+
+    def _read(self, relation_path):
+        if self.parquet_dir is None:
+            return pd.read_csv(relation_path, encoding=self.encoding, sep=self.separator)
+        parquet_path = self._parquet_path(relation_path)
+        if os.path.isfile(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(relation_path):
+            return pd.read_parquet(parquet_path)
+        df = pd.read_csv(relation_path, encoding=self.encoding, sep=self.separator)
+        os.makedirs(self.parquet_dir, exist_ok=True)
+        try:
+            df.to_parquet(parquet_path)
+        except Exception as e:
+            # e.g., columns with mixed types, the relation is read from the csv next time
+            print("Could not convert " + str(relation_path) + " to parquet: " + str(e))
+            if os.path.isfile(parquet_path):
+                os.remove(parquet_path)
+        return df
@@ -0,0 +1,113 @@
+import unittest
+import tempfile
+import pandas as pd
+from api.apiutils import Hit
+from DoD import dod as dod_module
+from DoD import data_processing_utils as dpu
+from DoD.utils import FilterType
+from benchmarking.field_network_benchmarks import generate_random_network
+
+
+def write_tables(path):
+    pd.DataFrame({'k': range(100), 'name': ['n' + str(i) for i in range(100)]}).to_csv(path + "a.csv", index=False)
+    pd.DataFrame({'k': range(50, 150), 'k2': range(100)}).to_csv(path + "b.csv", index=False)
+    pd.DataFrame({'k': range(1000, 1100), 'city': ['c' + str(i % 7) for i in range(100)]}).to_csv(path + "c.csv",
+                                                                                                 index=False)
+
+
+class TestParallelMaterialization(unittest.TestCase):
+
+    def test_same_views_as_serial(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        write_tables(path)
+        a_k = Hit('1', 'db', 'a.csv', 'k', 0)
+        b_k = Hit('2', 'db', 'b.csv', 'k', 0)
+        b_k2 = Hit('3', 'db', 'b.csv', 'k2', 0)
+        c_k = Hit('4', 'db', 'c.csv', 'k', 0)
+        join_graphs = [[(a_k, b_k)], [(a_k, c_k)], [(b_k2, a_k)], [(a_k, b_k), (b_k2, c_k)]]
+        table_path = {'a.csv': path, 'b.csv': path, 'c.csv': path}
+        table_fulfilled_filters = {'a.csv': [(('n70', 'name'), FilterType.CELL, 0)]}
+
+        dod = dod_module.DoD(generate_random_network(20, 10), None, csv_separator=',', num_workers=2)
+        try:
+            generator = dod.check_and_materialize_join_graphs(join_graphs, table_fulfilled_filters, True,
+                                                              table_path=table_path)
+            views = []
+            while True:
+                try:
+                    views.append(next(generator))
+                except StopIteration as done:
+                    total = done.value
+                    break
+        finally:
+            dod.close()
+
+        expected = []
+        for jpg in join_graphs:
+            if dod_module.is_join_graph_materializable(jpg, table_fulfilled_filters, lambda h: path):
+                expected.append((jpg, dpu.materialize_join_graph_sample(jpg, None, sample_size=1000, paths=table_path)))
+        self.assertEqual(2, total)
+        self.assertEqual(len(expected), len(views))
+        for (jpg, expected_view), (view, attrs, metadata) in zip(expected, views):
+            self.assertEqual(dod.format_join_graph_into_nodes_edges(jpg), metadata["join_graph"])
+            self.assertEqual(2, metadata["#join_graphs"])
+            self.assertEqual({'name'}, attrs)
+            pd.testing.assert_frame_equal(expected_view.reset_index(drop=True), view.reset_index(drop=True))
+
+    def test_planned_materialization(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        write_tables(path)
+        pd.DataFrame({'k2': [i % 30 for i in range(200)], 'city': ['C' + str(i % 7) for i in range(200)],
+                      'name': ['m' + str(i) for i in range(200)]}).to_csv(path + "d.csv", index=False)
+        a_k = Hit('1', 'db', 'a.csv', 'k', 0)
+        b_k = Hit('2', 'db', 'b.csv', 'k', 0)
+        b_k2 = Hit('3', 'db', 'b.csv', 'k2', 0)
+        d_k2 = Hit('5', 'db', 'd.csv', 'k2', 0)
+        jg = [(a_k, b_k), (b_k2, d_k2)]
+        paths = {'a.csv': path, 'b.csv': path, 'd.csv': path}
+        dpu.configure_csv_separator(',')
+        attributes = ['name', 'city', 'k2']
+
+        full = dpu.materialize_join_graph(jg, None, paths=paths)
+        expected = full[attributes]  # name of a, city of d, k2 of b
+        planned = dpu.materialize_join_graph(jg, None, paths=paths, attributes_to_project=attributes)
+        self.assertEqual(attributes, list(planned.columns))
+        self.assertEqual(sorted(map(tuple, expected.values.tolist())), sorted(map(tuple, planned.values.tolist())))
+
+        # cell filters are applied before joining
+        filtered = dpu.materialize_join_graph(jg, None, paths=paths, attributes_to_project=attributes,
+                                              table_filters={'d.csv': [('c3', 'city')]})
+        self.assertTrue(len(filtered) > 0)
+        self.assertEqual(sorted(map(tuple, expected[expected['city'] == 'C3'].values.tolist())),
+                         sorted((n, 'C3', k2) for n, c, k2 in filtered.values.tolist()))
+
+    def test_planned_same_as_project(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        write_tables(path)
+        pd.DataFrame({'k2': [i % 30 for i in range(200)], 'city': ['C' + str(i % 7) for i in range(200)],
+                      'name': ['m' + str(i) for i in range(200)]}).to_csv(path + "d.csv", index=False)
+        a_k = Hit('1', 'db', 'a.csv', 'k', 0)
+        b_k = Hit('2', 'db', 'b.csv', 'k', 0)
+        b_k2 = Hit('3', 'db', 'b.csv', 'k2', 0)
+        d_k2 = Hit('5', 'db', 'd.csv', 'k2', 0)
+        paths = {'a.csv': path, 'b.csv': path, 'd.csv': path}
+        dpu.configure_csv_separator(',')
+
+        # without filters, the planned view has the rows of the whole join, projected
+        for jg, attributes in [([(a_k, b_k)], ['name', 'k2']), ([(b_k2, d_k2), (a_k, b_k)], ['city', 'k', 'name']),
+                               ([(d_k2, b_k2), (b_k, a_k)], ['k2', 'name'])]:
+            expected = dpu.project(dpu.materialize_join_graph(jg, None, paths=paths), attributes)
+            planned = dpu.materialize_join_graph(jg, None, paths=paths, attributes_to_project=attributes)
+            self.assertEqual(list(expected.columns), list(planned.columns))
+            self.assertEqual(sorted(map(tuple, expected.astype(str).values.tolist())),
+                             sorted(map(tuple, planned.astype(str).values.tolist())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import pickle
+import unittest
+import numpy as np
+import pandas as pd
+from DoD import hash_join
+from DoD import data_processing_utils as dpu
+
+
+def random_relations(seed):
+    rng = np.random.RandomState(seed)
+    a = pd.DataFrame({'k': rng.randint(0, 50, 400).astype(str), 'va': rng.rand(400)})
+    # skewed keys on b, key '0' is most of the relation
+    b = pd.DataFrame({'k': np.where(rng.rand(300) < 0.5, '0', rng.randint(0, 80, 300).astype(str)),
+                      'va': rng.rand(300), 'vb': rng.randint(0, 1000, 300)})
+    return a, b
+
+
+def sorted_rows(df):
+    return sorted(map(tuple, df.values.tolist()))
+
+
+class TestHashJoin(unittest.TestCase):
+
+    def test_grace_hash_join_same_as_merge(self):
+        print(self._testMethodName)
+
+        a, b = random_relations(0)
+        expected = pd.merge(a, b, how='inner', left_on='k', right_on='k', sort=False, suffixes=('', '_x'))
+        self.assertEqual(len(expected), hash_join.join_output_rows(a['k'], b['k']))
+
+        # a budget much smaller than the output, so there are many partitions and the skewed one goes by chunks
+        chunks = list(hash_join.grace_hash_join(a, b, 'k', 'k', 20000, suffix_str='_x'))
+        self.assertTrue(len(chunks) > 2)
+        joined = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(list(expected.columns), list(joined.columns))
+        self.assertEqual(sorted_rows(expected), sorted_rows(joined))
+
+        # no matching keys
+        b['k'] = 'none'
+        joined = pd.concat(list(hash_join.grace_hash_join(a, b, 'k', 'k', 20000, suffix_str='_x')))
+        self.assertEqual(0, len(joined))
+        self.assertEqual(set(expected.columns), set(joined.columns))
+
+    def test_optimizer_joins_out_of_core(self):
+        print(self._testMethodName)
+
+        a, b = random_relations(1)
+        a.loc[0, 'k'] = None
+        expected = dpu.join_ab_on_key(a.copy(), b.copy(), 'k', 'k', suffix_str='_x')
+        expected = expected[expected['k'] != 'none']
+        limit = dpu.memory_limit_join_processing
+        try:
+            dpu.memory_limit_join_processing = 1  # the join never fits in memory
+            joined = dpu.join_ab_on_key_optimizer(a, b, 'k', 'k', suffix_str='_x')
+            # the output stays on disk, and joining it again goes chunk by chunk
+            self.assertTrue(isinstance(joined, hash_join.SpilledRelation))
+            c = pd.DataFrame({'va': b['va'].values[:50], 'vc': np.arange(50)})
+            joined_again = dpu.join_ab_on_key_optimizer(joined, c, 'va_x', 'va', suffix_str='_xx')
+        finally:
+            dpu.memory_limit_join_processing = limit
+        self.assertEqual(len(expected), len(joined))
+        self.assertEqual(list(expected.columns), list(joined.columns))
+        self.assertEqual(sorted_rows(expected), sorted_rows(pd.concat(list(joined.chunks()))))
+        self.assertEqual(sorted_rows(expected.head(0)), sorted_rows(joined.head(0)))
+        self.assertEqual(10, len(joined.head(10)))
+
+        expected_again = dpu.join_ab_on_key(expected.copy(), c.copy(), 'va_x', 'va', suffix_str='_xx')
+        self.assertTrue(isinstance(joined_again, hash_join.SpilledRelation))
+        self.assertEqual(sorted_rows(expected_again), sorted_rows(joined_again.to_frame()))
+        projected = dpu.project(joined_again, ['k', 'vc'])
+        self.assertEqual(sorted_rows(expected_again[['k', 'vc']]), sorted_rows(projected.to_frame()))
+
+        # as returned by a DoD worker, the files are kept for the process that unpickles it
+        restored = pickle.loads(pickle.dumps(projected))
+        del projected
+        self.assertEqual(sorted_rows(expected_again[['k', 'vc']]), sorted_rows(restored.to_frame()))
+
+
+if __name__ == "__main__":
+    unittest.main()
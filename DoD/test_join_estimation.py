@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+from datasketch import MinHash
+from api.apiutils import Hit
+from DoD import join_estimation as je
+
+
+def minhash_of(values, num_perm=256):
+    mh = MinHash(num_perm=num_perm)
+    for v in values:
+        mh.update(str(v).encode('utf8'))
+    return mh.hashvalues.astype(np.int64)
+
+
+class TestJoinEstimation(unittest.TestCase):
+
+    def setUp(self):
+        # a.k: 0..999, b.k: 500..1499 with 2 rows per value, c.k: 5000..5099
+        self.a = Hit('1', 'db', 'a', 'k', 0)
+        self.b = Hit('2', 'db', 'b', 'k', 0)
+        self.c = Hit('3', 'db', 'c', 'k', 0)
+        self.b2 = Hit('4', 'db', 'b', 'k2', 0)
+        self.values = {'1': range(1000), '2': range(500, 1500), '3': range(5000, 5100), '4': range(1000)}
+        self.estimator = je.JoinEstimator(None)
+        self.estimator.add_sketch('1', 1000, 1000, minhash_of(self.values['1']))
+        self.estimator.add_sketch('2', 2000, 1000, minhash_of(self.values['2']))
+        self.estimator.add_sketch('3', 100, 100, minhash_of(self.values['3']))
+        self.estimator.add_sketch('4', 2000, 1000, minhash_of(self.values['4']))
+
+    def test_estimate_hop(self):
+        print(self._testMethodName)
+
+        e = self.estimator.estimate_hop(self.a, self.b)
+        self.assertTrue(400 < e.intersection < 600)
+        self.assertTrue(0.4 < e.containment_l < 0.6)
+        self.assertTrue(800 < e.rows < 1200)  # 500 values, 1 row in a and 2 in b
+        self.assertEqual(0, self.estimator.estimate_hop(self.a, self.c).intersection)
+
+        # HyperLogLog sketches when there are no minhashes
+        hlls = {nid: je.column_hll(values) for nid, values in self.values.items()}
+        estimator = je.JoinEstimator(None, hll_sketches=hlls)
+        estimator.add_sketch('1', 1000, 1000)
+        estimator.add_sketch('2', 2000, 1000)
+        e = estimator.estimate_hop(self.a, self.b)
+        self.assertTrue(400 < e.intersection < 600)
+        self.assertIsNone(je.JoinEstimator(None).estimate_hop(self.a, self.b).rows)
+
+    def test_prune_and_rank(self):
+        print(self._testMethodName)
+
+        half = [(self.a, self.b)]
+        full = [(self.a, self.b2)]
+        empty = [(self.a, self.c)]
+        unknown = [(self.a, Hit('5', 'db', 'd', 'k', 0))]
+        ranked = self.estimator.prune_and_rank([half, empty, unknown, full])
+        self.assertEqual([unknown, full, half], ranked)
+        self.assertEqual([unknown], self.estimator.prune_and_rank([half, unknown, full], max_rows=100))
+
+    def test_contained_foreign_key(self):
+        print(self._testMethodName)
+
+        # a foreign key with 100 values, all in a primary key of 200k: too few to show in the minhash of both
+        pk = Hit('6', 'db', 'pk', 'id', 0)
+        fk = Hit('7', 'db', 'fk', 'pk_id', 0)
+        pk_mh = MinHash(num_perm=512)
+        pk_mh.update_batch([str(v).encode('utf8') for v in range(200000)])
+        self.estimator.add_sketch('6', 200000, 200000, pk_mh.hashvalues.astype(np.int64))
+        self.estimator.add_sketch('7', 300, 100, minhash_of(range(0, 200000, 2000), num_perm=512))
+        e = self.estimator.estimate_hop(fk, pk)
+        self.assertFalse(e.conclusive)
+        self.assertTrue(self.estimator.estimate_hop(self.a, self.c).conclusive)
+
+        # kept, after the join graphs that the sketches show to overlap
+        contained = [(fk, pk)]
+        half = [(self.a, self.b)]
+        empty = [(self.a, self.c)]
+        self.assertEqual([half, contained], self.estimator.prune_and_rank([contained, empty, half]))
+        self.assertEqual([contained], self.estimator.prune_and_rank([contained], max_rows=100))
+
+        # the same with HyperLogLog sketches
+        hlls = {'6': je.column_hll(range(200000)), '7': je.column_hll(range(0, 200000, 2000))}
+        estimator = je.JoinEstimator(None, hll_sketches=hlls)
+        estimator.add_sketch('6', 200000, 200000)
+        estimator.add_sketch('7', 300, 100)
+        self.assertFalse(estimator.estimate_hop(fk, pk).conclusive)
+        self.assertEqual([contained], estimator.prune_and_rank([contained]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+from api.apiutils import Relation
+from DoD import join_path_index as jpi
+from benchmarking.field_network_benchmarks import generate_random_network
+
+
+def all_table_paths(index, tables):
+    return {(t1, t2): index.table_paths(t1, t2) for t1 in tables for t2 in tables if t1 != t2}
+
+
+class TestJoinPathIndex(unittest.TestCase):
+
+    def test_same_paths_as_search(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(200, 100, num_nodes_per_table=5, seed=11)
+        index = jpi.JoinPathIndex(network, max_hops=3)
+        index.build()
+        tables = sorted(network._get_underlying_repr_table_to_ids().keys())
+        found = 0
+        for t1 in tables[:10]:
+            for t2 in tables:
+                expected = network.table_join_paths(t1, t2, Relation.PKFK, max_hops=3)
+                self.assertEqual(sorted(expected), sorted(index.table_paths(t1, t2)))
+                self.assertEqual(sorted(p for p in expected if len(p) <= 2), sorted(index.table_paths(t1, t2, 1)))
+                found += len(expected)
+        self.assertTrue(found > 0)
+
+    def test_incremental_update(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(200, 80, num_nodes_per_table=5, seed=12)
+        path = tempfile.mkdtemp() + "/"
+        index = jpi.load_or_build_join_path_index(network, path, max_hops=3)
+
+        nids = list(network.iterate_ids())
+        for i in range(0, 40, 4):
+            network.add_relation(nids[i], nids[-i - 1], Relation.PKFK, 1)
+        updated = jpi.load_or_build_join_path_index(network, path, max_hops=3)
+        rebuilt = jpi.JoinPathIndex(network, max_hops=3)
+        rebuilt.build()
+
+        tables = sorted(network._get_underlying_repr_table_to_ids().keys())
+        self.assertNotEqual(all_table_paths(index, tables), all_table_paths(rebuilt, tables))
+        self.assertEqual(all_table_paths(rebuilt, tables), all_table_paths(updated, tables))
+        reloaded = jpi.deserialize_join_path_index(network, path)
+        self.assertEqual(all_table_paths(rebuilt, tables), all_table_paths(reloaded, tables))
+
+    def test_join_paths_columns(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(100, 60, num_nodes_per_table=5, seed=13)
+        index = jpi.JoinPathIndex(network, max_hops=2)
+        index.build()
+        for (t1, t2), table_paths in list(index.paths.items())[:20]:
+            join_paths = index.join_paths(t1, t2)
+            self.assertTrue(len(join_paths) >= len(table_paths))
+            for join_path in join_paths:
+                self.assertEqual(t1, join_path[0].source_name)
+                self.assertEqual(t2, join_path[-1].source_name)
+                # consecutive columns of different tables are joined by the relation
+                for h1, h2 in zip(join_path, join_path[1:]):
+                    if h1.source_name != h2.source_name:
+                        self.assertIn(h2.nid, [h.nid for h in network.neighbors_id(h1, Relation.PKFK)])
+
+
+if __name__ == "__main__":
+    unittest.main()
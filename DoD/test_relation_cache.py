@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+import pandas as pd
+import config as C
+from DoD import data_processing_utils as dpu
+from DoD.relation_cache import RelationCache, dataframe_size, enable_copy_on_write
+
+
+def write_relation(path, name, num_rows):
+    relation_path = path + name
+    df = pd.DataFrame({'id': range(num_rows), 'name': ['v' + str(i) for i in range(num_rows)]})
+    df.to_csv(relation_path, sep='|', index=False)
+    return relation_path
+
+
+class TestRelationCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        relations = [write_relation(path, "r" + str(i) + ".csv", 100) for i in range(4)]
+        size = dataframe_size(pd.read_csv(relations[0], sep='|', encoding='latin1'))
+        cache = RelationCache(3 * size, separator='|')
+
+        for relation_path in relations[:3]:
+            cache.get(relation_path)
+        cache.get(relations[0])  # r1 is now the least recently used
+        cache.get(relations[3])
+        self.assertTrue(relations[0] in cache)
+        self.assertFalse(relations[1] in cache)
+        self.assertEqual(3, len(cache))
+        self.assertTrue(cache.size <= cache.max_bytes)
+        self.assertEqual(1, cache.evictions)
+
+        # a relation bigger than the budget is read but not kept
+        big = write_relation(path, "big.csv", 1000)
+        self.assertEqual(1000, len(cache.get(big)))
+        self.assertFalse(big in cache)
+        self.assertEqual(3, len(cache))
+
+    def test_copy_does_not_change_cached_relation(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        relation_path = write_relation(path, "r.csv", 10)
+        cache = RelationCache(10 ** 9, separator='|', copy_on_write=enable_copy_on_write())
+
+        df = cache.get(relation_path, copy=True)
+        df['name'] = df['name'].apply(lambda x: x.upper())
+        df.dropna(subset=['id'], inplace=True)
+        self.assertEqual('v1', cache.get(relation_path)['name'][1])
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.hits)
+
+    def test_value_index_filters(self):
+        print(self._testMethodName)
+
+        path = tempfile.mkdtemp() + "/"
+        relation_path = path + "people.csv"
+        df = pd.DataFrame({'id': [1, 2, 3, 4, 5, 6],
+                           'name': ['Ann', 'bob', 'ANN', None, 'Carl', 'ann'],
+                           'age': [30, 40, 30, 20, None, 31]})
+        df.to_csv(relation_path, sep='|', index=False)
+        dpu.configure_csv_separator('|')
+        original = pd.read_csv(relation_path, sep='|', encoding='latin1')
+
+        for value in ['ann', 'bob', 'nan', 'dave']:
+            expected = original[original['name'].map(lambda x: str(x).lower()) == value]
+            filtered = dpu.apply_filter(relation_path, 'name', value)
+            self.assertEqual(list(expected.index), list(filtered.index))
+            self.assertTrue(all(filtered['name'] == value))
+            self.assertEqual(set(expected['id']), dpu.find_key_for(relation_path, 'id', 'name', value))
+            self.assertEqual(len(expected) > 0, dpu.is_value_in_column(value, relation_path, 'name'))
+        self.assertEqual({1, 3}, dpu.find_key_for(relation_path, 'id', 'age', 30.0))
+        self.assertEqual('Ann', dpu.read_relation(relation_path)['name'][0])
+        dpu.configure_csv_separator(C.separator)
+
+
+if __name__ == "__main__":
+    unittest.main()
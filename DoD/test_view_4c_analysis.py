@@ -0,0 +1,75 @@
+import unittest
+import pandas as pd
+from DoD import view_4c_analysis_baseline as v4c
+from DoD import view_4c_analysis_vectorized as v4cv
+
+
+def view(ids, cities=None):
+    cities = cities if cities is not None else dict()
+    return pd.DataFrame({'id': ids,
+                         'name': ['n' + str(i) for i in ids],
+                         'city': [cities.get(i, 'c' + str(i % 3)) for i in ids]})
+
+
+class TestView4CAnalysis(unittest.TestCase):
+
+    def views(self):
+        dfs = [(view(list(range(10))), 'a'),
+               (view(list(reversed(range(10)))), 'a_shuffled'),  # compatible with a
+               (view(list(range(5))), 'a_head'),  # contained in a
+               (view(list(range(8, 15))), 'overlap'),  # complementary with a
+               (view([3] + list(range(20, 24)), cities={3: 'other'}), 'conflict')]  # contradictory with a on id 3
+        return v4c.get_df_metadata(dfs)
+
+    def test_same_groups_as_baseline(self):
+        print(self._testMethodName)
+
+        dfs_with_metadata = self.views()
+        compatible, contained, complementary, contradictory = v4c.no_chasing_4c(dfs_with_metadata)
+        v_compatible, v_contained, v_complementary, v_contradictory = v4cv.vectorized_4c(dfs_with_metadata)
+
+        self.assertEqual([['a', 'a_shuffled']], v_compatible)
+        self.assertEqual(compatible, v_compatible)
+        self.assertEqual([['a', 'a_head']], v_contained)
+        self.assertEqual(contained, v_contained)
+        self.assertEqual(complementary, v_complementary)
+        pairs = {frozenset([p1, p2]) for p1, _, _, p2 in v_contradictory}
+        self.assertEqual({frozenset(['a', 'conflict']), frozenset(['a_head', 'conflict'])}, pairs)
+        self.assertEqual({frozenset([p1, p2]) for p1, _, _, p2 in contradictory}, pairs)
+        self.assertTrue(all(keys == {3} for _, _, keys, _ in v_contradictory))
+
+    def test_all_contradictory_keys(self):
+        print(self._testMethodName)
+
+        dfs_with_metadata = v4c.get_df_metadata([(view(list(range(6))), 'a'),
+                                                 (view(list(range(6)), cities={1: 'x', 4: 'y'}), 'b')])
+        _, contained, complementary, contradictory = v4cv.vectorized_4c(dfs_with_metadata)
+        self.assertEqual([], contained)
+        self.assertEqual([], complementary)
+        # the baseline stops at the first contradictory key
+        self.assertEqual({1, 4}, contradictory[0][2])
+        self.assertEqual(2, len(contradictory))
+
+    def test_duplicate_rows(self):
+        print(self._testMethodName)
+
+        dfs_with_metadata = v4c.get_df_metadata([(view(list(range(6))), 'a'),
+                                                 (view(list(range(6)) + [2]), 'a_dup'),
+                                                 (view([2] + list(range(6))), 'a_dup_shuffled')])
+        compatible, _, _, _ = v4c.no_chasing_4c(dfs_with_metadata)
+        v_compatible, _, _, _ = v4cv.vectorized_4c(dfs_with_metadata)
+        # as the baseline, a view with a duplicate row is not compatible with the view without it
+        self.assertEqual([['a_dup', 'a_dup_shuffled']], v_compatible)
+        self.assertEqual(compatible, v_compatible)
+
+    def test_chunked_minhash(self):
+        print(self._testMethodName)
+
+        df, path, metadata = v4c.get_df_metadata([(view(list(range(100))), 'a')])[0]
+        whole = v4cv.ViewSignature(df, path, metadata, chunk_size=1000)
+        chunked = v4cv.ViewSignature(df, path, metadata, chunk_size=7)
+        self.assertEqual(whole.minhash.tolist(), chunked.minhash.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+4C analysis (compatible, contained, complementary, contradictory views) on hashes. Every view is hashed once into
+uint64 arrays, one hash per row and one per cell of each column, and every classification is then a set
+operation on those arrays. Same input and output as view_4c_analysis_baseline, except that all the
+contradictory and complementary keys of a pair are reported, not only the first one found
+"""
+from collections import defaultdict
+
+import numpy as np
+from pandas.util import hash_pandas_object
+
+from DoD import view_4c_analysis_baseline as v4c
+
+# odd 64-bit constants to combine and permute hashes, arithmetic wraps around
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class ViewSignature:
+
+    def __init__(self, df, path, metadata, num_perm=64, seed=1, chunk_size=1024):
+        self.df = df
+        self.path = path
+        self.metadata = metadata
+        self.row_hashes = hash_pandas_object(df, index=False).values
+        self.row_set = np.unique(self.row_hashes)
+        self.column_hashes = {c: hash_pandas_object(df[c], index=False).values for c in df.columns}
+        rng = np.random.RandomState(seed)
+        a = rng.randint(1, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.minhash = np.full(num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        # chunk_size rows at a time, so the permuted hashes take chunk_size x num_perm, as in ress_utils.get_mh_batched
+        with np.errstate(over='ignore'):
+            for start in range(0, len(self.row_set), chunk_size):
+                permuted = self.row_set[start:start + chunk_size].reshape(-1, 1) * a
+                permuted += b
+                np.minimum(self.minhash, permuted.min(axis=0), out=self.minhash)
+
+    def pair_hashes(self, key, column):
+        """
+        One hash per row for the pair of values (key, column) of the row
+        """
+        with np.errstate(over='ignore'):
+            return self.column_hashes[key] * _MIX + self.column_hashes[column]
+
+
+def may_contain(large, small):
+    """
+    If small is contained in large, the minimum of large is not above the minimum of small for any permutation
+    """
+    return bool(np.all(large.minhash <= small.minhash))
+
+
+def is_contained(large, small):
+    return may_contain(large, small) and bool(np.isin(small.row_set, large.row_set, assume_unique=True).all())
+
+
+def identify_compatible_groups(signatures):
+    """
+    Views with the same rows, grouped by the bytes of their sorted row hashes. Duplicates count, as in the sum of
+    the row hashes of the baseline
+    :return: list of groups of paths, one group per distinct view, in the order of signatures
+    """
+    groups = dict()
+    for s in signatures:
+        groups.setdefault(np.sort(s.row_hashes).tobytes(), []).append(s.path)
+    return list(groups.values())
+
+
+def summarize_views_and_find_candidate_complementary(signatures):
+    """
+    :return: (contained groups, each the path of a view and of the smaller views it contains,
+    candidate complementary pairs (s1, rows1, s2, rows2), rows are the positions of the rows only in that view)
+    """
+    contained_groups = []
+    candidate_complementary_pairs = []
+    for i, s1 in enumerate(signatures):
+        contained_group = [s1.path]
+        for j, s2 in enumerate(signatures):
+            if i == j:
+                continue
+            if len(s1.row_set) > len(s2.row_set):
+                if is_contained(s1, s2):
+                    contained_group.append(s2.path)
+            elif len(s1.row_set) < len(s2.row_set) or i < j:  # every pair is checked once, from its smaller view
+                only1 = ~np.isin(s1.row_hashes, s2.row_set)
+                only2 = ~np.isin(s2.row_hashes, s1.row_set)
+                if only1.any() and only2.any():  # otherwise it's a containment relationship
+                    candidate_complementary_pairs.append((s1, np.flatnonzero(only1), s2, np.flatnonzero(only2)))
+        if len(contained_group) > 1:
+            contained_groups.append(contained_group)
+    return contained_groups, candidate_complementary_pairs
+
+
+def contradictory_keys(s1, rows1, s2, rows2, k):
+    """
+    Keys of the rows1 of s1 that are also in the rows2 of s2 with a value in some column that s2 does not have for
+    that key, and keys of rows1 that are not in rows2
+    :return: (contradictory keys, complementary keys) of s1
+    """
+    keys1 = s1.column_hashes[k][rows1]
+    keys2 = s2.column_hashes[k][rows2]
+    shared = np.isin(keys1, keys2)
+    contradictory = np.zeros(len(rows1), dtype=bool)
+    for c in s1.df.columns:
+        if c == k or c not in s2.column_hashes:
+            continue
+        contradictory |= ~np.isin(s1.pair_hashes(k, c)[rows1], s2.pair_hashes(k, c)[rows2])
+    values = s1.df[k].values[rows1]
+    return set(values[shared & contradictory]), set(values[~shared])
+
+
+def tell_contradictory_and_complementary(candidate_complementary_pairs):
+    complementary_group = list()
+    contradictory_group = list()
+    for s1, rows1, s2, rows2 in candidate_complementary_pairs:
+        k = v4c.pick_most_likely_key_of_pair(s1.metadata, s2.metadata)
+        contradictory_key1, complementary_key1 = contradictory_keys(s1, rows1, s2, rows2, k)
+        contradictory_key2, complementary_key2 = contradictory_keys(s2, rows2, s1, rows1, k)
+        if len(contradictory_key1) > 0:
+            contradictory_group.append((s1.path, k, contradictory_key1, s2.path))
+        if len(contradictory_key2) > 0:
+            contradictory_group.append((s2.path, k, contradictory_key2, s1.path))
+        if len(contradictory_key1) == 0 and len(contradictory_key2) == 0:
+            complementary_group.append((s1.path, s2.path, complementary_key1, complementary_key2))
+    return complementary_group, contradictory_group
+
+
+def vectorized_4c(dataframes_with_metadata):
+    """
+    Same classification as view_4c_analysis_baseline.no_chasing_4c
+    :param dataframes_with_metadata: list of (df, path, metadata)
+    :return: compatible groups, contained groups, complementary group, contradictory group
+    """
+    # sort relations by cardinality to avoid reverse containment
+    dataframes_with_metadata = sorted(dataframes_with_metadata, key=lambda x: len(x[0]), reverse=True)
+    signatures = [ViewSignature(df, path, metadata) for df, path, metadata in dataframes_with_metadata]
+
+    compatible_groups = identify_compatible_groups(signatures)
+    # We pick one representative from each compatible group
+    selection = set([x[0] for x in compatible_groups])
+    selected = [s for s in signatures if s.path in selection]
+
+    contained_groups, candidate_complementary_pairs = summarize_views_and_find_candidate_complementary(selected)
+    complementary_group, contradictory_group = tell_contradictory_and_complementary(candidate_complementary_pairs)
+
+    # prepare found groups for presentation
+    compatible_groups = [cg for cg in compatible_groups if len(cg) > 1]
+
+    return compatible_groups, contained_groups, complementary_group, contradictory_group
+
+
+def main(input_path):
+    groups_per_column_cardinality = defaultdict(dict)
+
+    dfs = v4c.get_dataframes(input_path)
+    print("Found " + str(len(dfs)) + " valid tables")
+
+    dfs_per_schema, schema_id_info = v4c.classify_per_table_schema(dfs)
+    print("View candidates classify into " + str(len(dfs_per_schema)) + " groups based on schema")
+    print("")
+    for key, group_dfs in dfs_per_schema.items():
+        print("Num elements with schema " + str(key) + " is: " + str(len(group_dfs)))
+        dfs_with_metadata = v4c.get_df_metadata(group_dfs)
+
+        compatible_group, contained_group, complementary_group, contradictory_group = \
+            vectorized_4c(dfs_with_metadata)
+        groups_per_column_cardinality[key]['compatible'] = compatible_group
+        groups_per_column_cardinality[key]['contained'] = contained_group
+        groups_per_column_cardinality[key]['complementary'] = complementary_group
+        groups_per_column_cardinality[key]['contradictory'] = contradictory_group
+
+    return groups_per_column_cardinality, schema_id_info
@@ -58,6 +58,26 @@ class Algebra:
         drs = DRS([x for x in hits], Operation(OP.KW_LOOKUP, params=[kw]))
         return drs
 
+    def search_batch(self, queries) -> [DRS]:
+        """
+        Performs many keyword searches with a single request to the store.
+
+        :param queries: list of (kw, kw_type, max_results, exact), exact as in 'exact_search'
+        :return: returns a DRS for each query, in the same order
+        """
+        all_hits = self._store_client.multi_search_keywords(queries)
+        drss = [DRS(hits, Operation(OP.KW_LOOKUP, params=[kw])) for (kw, _, _, _), hits in zip(queries, all_hits)]
+        return drss
+
+    def search_many(self, kws: [str], kw_type: KWType, max_results=10, exact=False) -> [DRS]:
+        """
+        See 'search'. Searches all the keywords with a single request to the store.
+
+        :param kws: the keywords to search
+        :return: returns a DRS for each keyword, in the same order
+        """
+        return self.search_batch([(kw, kw_type, max_results, exact) for kw in kws])
+
     def search_content(self, kw: str, max_results=10) -> DRS:
         return self.search(kw, kw_type=KWType.KW_CONTENT, max_results=max_results)
 
@@ -129,6 +149,7 @@ class Algebra:
         :param a: DRS
         :param b: DRS
         :param Relation: Relation
+        :param lean_search: ignored, table paths are found on the table join graph
         :return:
         """
         # create b if it wasn't passed in.
@@ -148,11 +169,11 @@ class Algebra:
             # there are different network operations for table and field mode
             res_drs = None
             if drs_a.mode == DRSMode.FIELDS:
-                res_drs = self._network.find_path_hit(
+                res_drs = self._network.find_path_hit_bfs(
                     h1, h2, relation, max_hops=max_hops)
             else:
-                res_drs = self._network.find_path_table(
-                    h1, h2, relation, self, max_hops=max_hops, lean_search=lean_search)
+                res_drs = self._network.find_path_table_bfs(
+                    h1, h2, relation, max_hops=max_hops)
 
             o_drs = o_drs.absorb(res_drs)
 
@@ -129,6 +129,27 @@ class Operation:
         return self._params
 
 
+def unique_hits(hits, ids, mask=None):
+    """
+    The first hit of each node id, among the hits selected by mask
+    :param ids: int array with the node id of each hit
+    :return: list of hits, sorted by node id
+    """
+    positions = np.arange(len(ids)) if mask is None else np.flatnonzero(mask)
+    _, first = np.unique(ids[positions], return_index=True)
+    hits = list(hits)
+    return [hits[i] for i in positions[first]]
+
+
+def union_hits(a, b):
+    """
+    Hits of the DRS a and b, with the hit of a when a node is in both
+    """
+    a_ids, _ = a.id_arrays()
+    b_ids, _ = b.id_arrays()
+    return unique_hits(list(a.data) + list(b.data), np.concatenate([a_ids, b_ids]))
+
+
 class DRSMode(Enum):
     FIELDS = 0
     TABLE = 1
@@ -137,10 +158,15 @@ class DRSMode(Enum):
 class Provenance:
     """
     Nodes are Hit (only). Origin nodes are given a special Hit object too.
+    A provenance that merges others does not copy their graphs: it points to them, and they are never modified
+    afterwards. The graph is materialized when it's first needed, visiting each merged provenance once
     """
 
     def __init__(self, data, operation):
         self._p_graph = nx.MultiDiGraph()
+        # merged provenances, and (labels, nodes) whose input edges are annotated with the labels after the merge
+        self._parents = []
+        self._annotations = ((), ())
         op = operation.op
         params = operation.params
         self.populate_provenance(data, op, params)
@@ -149,11 +175,76 @@ class Provenance:
 
     def prov_graph(self):
         self.invalidate_leafs_heads_cache()  # for safety invalidate cache
-        return self._p_graph
+        return self._graph()
 
     def swap_p_graph(self, new):
         self.invalidate_leafs_heads_cache()  # for safety invalidate cache
         self._p_graph = new
+        self._parents = []
+        self._annotations = ((), ())
+
+    def merge(self, provenance, labels=(), nodes=()):
+        """
+        Provenance with the graphs of self and provenance, without materializing any of them
+        :param labels: labels to set in the input edges of nodes once merged
+        :return: the new Provenance
+        """
+        merged = Provenance([], Operation(OP.NONE))
+        merged._p_graph = None
+        merged._parents = [self, provenance]
+        merged._annotations = (tuple(labels), tuple(nodes))
+        return merged
+
+    def _graph(self):
+        if self._p_graph is not None:
+            return self._p_graph
+        graph = nx.MultiDiGraph()
+        visited = set()
+        stack = [(self, False)]
+        while len(stack) > 0:  # post-order, so that annotations apply once the parents are merged
+            provenance, merged = stack.pop()
+            if merged:
+                if provenance._p_graph is not None:
+                    graph.add_nodes_from(provenance._p_graph.nodes())
+                    graph.add_edges_from(provenance._p_graph.edges(keys=True, data=True))
+                labels, nodes = provenance._annotations
+                if len(labels) > 0:
+                    # only the edges of the merged provenances, graph has those of the rest of the visit too
+                    for src, tar, e in provenance._in_edges_of_merge(nodes):
+                        for label in labels:
+                            graph[src][tar][e][label] = 1
+                continue
+            if id(provenance) in visited:
+                continue
+            visited.add(id(provenance))
+            stack.append((provenance, True))
+            if provenance._p_graph is None:
+                for parent in reversed(provenance._parents):
+                    stack.append((parent, False))
+        self._p_graph = graph
+        self._parents = []
+        return graph
+
+    def _in_edges_of_merge(self, nodes):
+        """
+        :return: set of (src, tar, key) edges into nodes in the graphs this provenance merges, its own graph if it
+        has one
+        """
+        edges = set()
+        visited = set()
+        stack = [self]
+        while len(stack) > 0:
+            provenance = stack.pop()
+            if id(provenance) in visited:
+                continue
+            visited.add(id(provenance))
+            if provenance._p_graph is not None:
+                for el in nodes:
+                    if el in provenance._p_graph:
+                        edges.update(provenance._p_graph.in_edges(el, keys=True))
+            else:
+                stack.extend(provenance._parents)
+        return edges
 
     def populate_provenance(self, data, op, params):
         if op == OP.NONE:
@@ -185,9 +276,10 @@ class Provenance:
             return self._cached_leafs_and_heads[0], self._cached_leafs_and_heads[1]
         leafs = []
         heads = []
-        for node in self._p_graph.nodes():
-            pre = self._p_graph.predecessors(node)
-            suc = self._p_graph.successors(node)
+        graph = self._graph()
+        for node in graph.nodes():
+            pre = list(graph.predecessors(node))
+            suc = list(graph.successors(node))
             no_cycles = set(pre) - set(suc)
             pre = list(no_cycles)
             if len(pre) == 0 and len(suc) == 0:
@@ -208,7 +300,7 @@ class Provenance:
             leafs, heads = self.get_leafs_and_heads()
         all_paths = []
         for l in leafs:
-            paths = nx.all_simple_paths(self._p_graph, l, a)
+            paths = nx.all_simple_paths(self._graph(), l, a)
             all_paths.extend(paths)
         return all_paths
 
@@ -233,20 +325,20 @@ class Provenance:
         all_paths = []
         if a in leafs:
             for h in heads:
-                paths = nx.all_simple_paths(self._p_graph, a, h)
+                paths = nx.all_simple_paths(self._graph(), a, h)
                 all_paths.extend(paths)
         elif a in heads:
             for l in leafs:
-                paths = nx.all_simple_paths(self._p_graph, l, a)
+                paths = nx.all_simple_paths(self._graph(), l, a)
                 all_paths.extend(paths)
         else:
             upstreams = []
             for l in leafs:
-                paths = nx.all_simple_paths(self._p_graph, l, a)
+                paths = nx.all_simple_paths(self._graph(), l, a)
                 upstreams.extend(paths)
             downstreams = []
             for h in heads:
-                paths = nx.all_simple_paths(self._p_graph, a, h)
+                paths = nx.all_simple_paths(self._graph(), a, h)
                 downstreams.extend(paths)
 
             if len(downstreams) > len(upstreams):
@@ -284,7 +376,7 @@ class Provenance:
                 pair = p[idx::slice_range(idx)]
                 src, trg = pair
                 explanation = explanation + get_name_from_hit(src) + " -> "
-                edge_info = self._p_graph[src][trg]
+                edge_info = self._graph()[src][trg]
                 explanation = explanation + get_string_from_edge_info(edge_info) + " -> " \
                     + get_name_from_hit(trg) + '\n'
         return explanation
@@ -310,6 +402,8 @@ class DRS:
         self._ranking_criteria = None
         self._chosen_rank = []
         self._origin_values_coverage = dict()
+        # (data, node ids, table names) of the last data whose arrays were computed
+        self._id_cache = (None, None, None)
 
     def __iter__(self):
         return self
@@ -390,6 +484,18 @@ class DRS:
     def size(self):
         return len(self.data)
 
+    def id_arrays(self):
+        """
+        Node ids and table names of the data, as arrays aligned with the data. Computed once for each data
+        :return: (int64 array of node ids, object array of table names)
+        """
+        if self._id_cache[0] is not self._data:
+            ids = np.fromiter((int(h.nid) for h in self._data), dtype=np.int64, count=len(self._data))
+            tables = np.empty(len(self._data), dtype=object)
+            tables[:] = [h.source_name for h in self._data]
+            self._id_cache = (self._data, ids, tables)
+        return self._id_cache[1], self._id_cache[2]
+
     def get_provenance(self):
         return self._provenance
 
@@ -412,53 +518,24 @@ class DRS:
 
     def absorb_provenance(self, drs, annotate_and_edges=False, annotate_or_edges=False):
         """
-        Merge provenance of the input parameter into self, *not* the data.
+        Merge provenance of the input parameter into self, *not* the data. The graphs are not merged until they
+        are needed, see Provenance.merge
         :param drs:
         :return:
         """
-        def annotate_union_edges(label):
-            # Find nodes that intersect (those that will contain add_edges)
-            my_data = set(self.data)
-            merging_data = set(drs.data)
-            disjoint = my_data.intersection(
-                merging_data)  # where a union is created
-            # Now find the incoming edges to these nodes in each of the drs's
-            node_and_edges = []
-            for el in disjoint:
-                input_edges1 = self._provenance.prov_graph().in_edges(el, data=True)
-                input_edges2 = drs._provenance.prov_graph().in_edges(el, data=True)
-                node_and_edges.append((input_edges1, input_edges2))
-            # Now locate the nodes in the merged prov graph and annotate edges
-            # with AND
-            for input1, input2 in node_and_edges:
-                for src1, tar1, dic1 in input1:
-                    # this is the edge information
-                    edge_data = merge[src1][tar1]
-                    for e in edge_data:  # we iterate over each edge
-                        # we assign the new metadata as data assigned to the
-                        # edge
-                        edge_data[e][label] = 1
-                for src2, tar2, dic2 in input2:
-                    edge_data = merge[src2][tar2]
-                    for e in edge_data:
-                        edge_data[e][label] = 1
-
-        # Reset ranking
-        self._ranked = False
-        # Get prov graph of merging
-        prov_graph_of_merging = drs.get_provenance().prov_graph()
-        # Compose into my prov graph
-        merge = nx.compose(self._provenance.prov_graph(),
-                           prov_graph_of_merging)
-
+        labels = []
         if annotate_and_edges:
-            annotate_union_edges('AND')
-
+            labels.append('AND')
         if annotate_or_edges:
-            annotate_union_edges('OR')
+            labels.append('OR')
+        nodes = []
+        if len(labels) > 0:
+            # Find nodes that intersect (those whose input edges are annotated)
+            nodes = set(self.data).intersection(set(drs.data))
 
-        # Rewrite my prov graph to the new merged one and return
-        self._provenance.swap_p_graph(merge)
+        # Reset ranking
+        self._ranked = False
+        self._provenance = self._provenance.merge(drs.get_provenance(), labels=labels, nodes=nodes)
         return self
 
     def absorb(self, drs):
@@ -470,10 +547,8 @@ class DRS:
         # Reset ranking
         self._ranked = False
         # Set union merge data
-        merging_data = set(drs.data)
-        my_data = set(self.data)
-        new_data = merging_data.union(my_data)
-        self.set_data(list(new_data))
+        new_data = union_hits(drs, self)
+        self.set_data(new_data)
         # Merge provenance
         self.absorb_provenance(drs)
         return self
@@ -487,19 +562,19 @@ class DRS:
         self._ranked = False
         result = DRS([], Operation(OP.NONE))
         new_data = []
-        # FIXME: There are more efficient ways of doing this
+        merging_ids, merging_tables = drs.id_arrays()
+        my_ids, my_tables = self.id_arrays()
         if drs.mode == DRSMode.TABLE:
-            merging_tables = [(hit.source_name, hit) for hit in drs.data]
-            my_tables = [(hit.source_name, hit) for hit in self.data]
-            for table, hit_ext in merging_tables:
-                for t, hit_in in my_tables:
-                    if table == t:
-                        new_data.append(hit_ext)
-                        new_data.append(hit_in)
+            # hits of both sides whose table is on the other side, tables as integer ids
+            _, table_ids = np.unique(np.concatenate([merging_tables, my_tables]), return_inverse=True)
+            merging_table_ids = table_ids[:len(merging_tables)]
+            my_table_ids = table_ids[len(merging_tables):]
+            new_data = unique_hits(list(drs.data) + list(self.data),
+                                   np.concatenate([merging_ids, my_ids]),
+                                   np.concatenate([np.isin(merging_table_ids, my_table_ids),
+                                                   np.isin(my_table_ids, merging_table_ids)]))
         elif drs.mode == DRSMode.FIELDS:
-            merging_data = set(drs.data)
-            my_data = set(self.data)
-            new_data = list(merging_data.intersection(my_data))
+            new_data = unique_hits(drs.data, merging_ids, np.isin(merging_ids, my_ids))
         # We set the new data into our DRS again
         # self.set_data(new_data)
         result.set_data(new_data)
@@ -515,11 +590,9 @@ class DRS:
         # Reset ranking
         self._ranked = False
         result = DRS([], Operation(OP.NONE))
-        merging_data = set(drs.data)
-        my_data = set(self.data)
-        new_data = merging_data.union(my_data)
+        new_data = union_hits(drs, self)
         # self.set_data(list(new_data))
-        result.set_data(list(new_data))
+        result.set_data(new_data)
         # Merge provenance
         # FIXME: perhaps we need to do some garbage collection of the prov
         # graph at some point
@@ -532,11 +605,11 @@ class DRS:
         # Reset ranking
         self._ranked = False
         result = DRS([], Operation(OP.NONE))
-        merging_data = set(drs.data)
-        my_data = set(self.data)
-        new_data = my_data - merging_data
+        merging_ids, _ = drs.id_arrays()
+        my_ids, _ = self.id_arrays()
+        new_data = unique_hits(self.data, my_ids, np.isin(my_ids, merging_ids, invert=True))
         # self.set_data(list(new_data))
-        result.set_data(list(new_data))
+        result.set_data(new_data)
         # Merge provenance
         # FIXME: perhaps we need to do some garbage collection of the prov
         # graph at some point
@@ -648,91 +721,62 @@ class DRS:
     Ranking functions
     """
 
-    def _compute_certainty_scores(self, aggr_strategy=None):
+    def _compute_ranking_scores(self):
         """
-        FIXME: scores being part of nodes instead of edges mean we cannot implement the
-        best aggregation method. Only one temporal one that works ok in practice.
-        :param aggregation:
+        Certainty and coverage scores of every result in one pass over the provenance graph, visiting its strongly
+        connected components in topological order. The certainty of a node is its score plus the best certainty of
+        the components before it, and its coverage is the set of origins (leafs) that reach it, carried as a bitset
         :return:
         """
-
-        def decide_path(pg, ns, nodes_already_visited):
-            """
-            Given n score_paths, it chooses one according to an aggregation strategy
-            :param pg:
-            :return:
-            """
-            if aggr_strategy is None:
-                max_score = 0
-                for n in ns:
-                    nodes_already_visited.add(n)
-                    score = get_score_continuous_path(pg, n, nodes_already_visited)
-                    if score > max_score:
-                        max_score = score
-            # FIXME: plug in here the logic for the other aggr strategies
-            return score
-
-        def get_score_continuous_path(pg, src, nodes_already_visited):
-            """
-            Traverse graph from src forming a score path
-            :param pg:
-            :param src:
-            :return:
-            """
-            current_score = float(src.score)
-            ns = [x for x in pg.neighbors(src) if x not in nodes_already_visited]  # skip already visited nodes
-            #ns = [x for x in pg.neighbors(src)]
-            if len(ns) == 1:
-                nodes_already_visited.add(ns[0])
-                current_score = current_score + get_score_continuous_path(pg, ns[0], nodes_already_visited)
-            elif len(ns) > 1:
-                current_score = current_score + decide_path(pg, ns, nodes_already_visited)
-            # Last option: when there are no neighbors, we simply return
-            # current_store
-            return current_score
-
-        # We reverse the provenance graph
-        pg = self._provenance.prov_graph().reverse()
-        nodes_already_visited = set()
-        # Compute recursively the certainty score for every result
-        for el in self.data:
-            if el not in nodes_already_visited:
-                score = get_score_continuous_path(pg, el, nodes_already_visited)
-                self._rank_data[el]['certainty_score'] = score
-
-    def _compute_coverage_scores(self):
-        # Get total number of ORIGIN elements FIXME: (not KW, etc)
+        pg = self._provenance.prov_graph()
         (leafs, _) = self._provenance.get_leafs_and_heads()
         total_number = len(leafs)
+        # Assign index to original values
+        self._origin_values_coverage = {origin: i for i, origin in enumerate(leafs)}
+
+        condensed = nx.condensation(pg)
+        component_of = condensed.graph['mapping']
+        reach = dict()  # component -> bitset (int) of the origins that reach it
+        best = dict()  # component -> best certainty of its nodes
+        certainty = dict()
+        for c in nx.topological_sort(condensed):
+            members = condensed.nodes[c]['members']
+            preds = list(condensed.predecessors(c))
+            bits = 0
+            for p in preds:
+                bits |= reach[p]
+            for m in members:
+                if m in self._origin_values_coverage:
+                    bits |= 1 << self._origin_values_coverage[m]
+            reach[c] = bits
+            previous = max([best[p] for p in preds]) if len(preds) > 0 else 0
+            for m in members:
+                certainty[m] = float(m.score) + previous
+            best[c] = max(certainty[m] for m in members)
 
-        i = 0
-        for origin in leafs:
-            # Assign index to original values
-            self._origin_values_coverage[origin] = i
-            i += 1
-
+        self._rank_data = defaultdict(dict)
         for el in self.data:
-            # initialize coverage set to False
-            coverage_set = bitarray(len(leafs))
+            coverage_set = bitarray(total_number)
             coverage_set.setall(False)
-            # Get covered elements
-            elements = self.why(el)
-            for element_covered in elements:
-                idx = self._origin_values_coverage[element_covered]
-                coverage_set[idx] = True
-            coverage = float(len(elements)) / float(total_number)
+            if el in component_of:
+                self._rank_data[el]['certainty_score'] = certainty[el]
+                # an origin does not cover itself
+                covered = reach[component_of[el]] & ~(1 << self._origin_values_coverage.get(el, total_number))
+                while covered:
+                    idx = (covered & -covered).bit_length() - 1
+                    coverage_set[idx] = True
+                    covered &= covered - 1
+            else:
+                self._rank_data[el]['certainty_score'] = float(el.score)
+            coverage = float(coverage_set.count()) / float(total_number) if total_number > 0 else 0.0
             self._rank_data[el]['coverage_score'] = (coverage, coverage_set)
 
     def compute_ranking_scores(self):
 
         st = time.time()
-        self._compute_certainty_scores()
+        self._compute_ranking_scores()
         et = time.time()
-        print("Time to compute certainty scores: " + str(et - st))
-        st = time.time()
-        self._compute_coverage_scores()
-        et = time.time()
-        print("Time to compute coverage scores: " + str(et - st))
+        print("Time to compute ranking scores: " + str(et - st))
 
         self._ranked = True
 
@@ -783,10 +827,24 @@ class DRS:
 
     def rank_certainty_include_coverage(self):
         """
-        TODO: future work
+        Ranks the current results in DRS with respect to coverage criteria, and results with the same coverage with
+        respect to certainty criteria
         :return:
         """
-        return
+        if self._ranked is False:
+            self.compute_ranking_scores()
+
+        elements = []
+        for el, score_dict in self._rank_data.items():
+            coverage = score_dict.get('coverage_score', (0, None))
+            certainty = score_dict.get('certainty_score', 0)
+            elements.append((el, coverage, certainty))
+        elements = sorted(elements, key=lambda a: (a[1][0], a[2]), reverse=True)
+        self._data = [el for (el, coverage, certainty) in elements]  # save data in order
+        self._ranking_criteria = self.RankingCriteria.COVERAGE
+        self._chosen_rank = [(el, coverage) for (el, coverage, certainty) in elements]
+
+        return self
 
     """
     Convenience functions
@@ -270,6 +270,96 @@ class TestApiutils(unittest.TestCase):
 
         self.assertTrue(ld == 4)
 
+    def test_lazy_provenance(self):
+        print(self._testMethodName)
+
+        h0 = Hit(10, "dba", "table_c", "v", -1)
+        h1 = Hit(0, "dba", "table_a", "a", -1)
+        h2 = Hit(1, "dba", "table_a", "b", -1)
+        drs = DRS([h1], Operation(OP.CONTENT_SIM, params=[h0]))
+        drs_b = DRS([h2], Operation(OP.SCHEMA_SIM, params=[h1]))
+
+        # a long chain of operations does not merge the graphs of the intermediate results
+        results = []
+        for i in range(500):
+            drs = drs.union(drs_b)
+            results.append(drs)
+        drs = drs.intersection(drs_b)
+        self.assertTrue(all(r.get_provenance()._p_graph is None for r in results))
+
+        prov_graph = drs.get_provenance().prov_graph()
+        self.assertEqual({h0, h1, h2}, set(prov_graph.nodes()))
+        self.assertEqual({(h0, h1, OP.CONTENT_SIM), (h1, h2, OP.SCHEMA_SIM)}, set(prov_graph.edges(keys=True)))
+        # the edges into the results of the intersection are annotated
+        self.assertEqual(1, prov_graph[h1][h2][OP.SCHEMA_SIM]['AND'])
+        self.assertFalse('AND' in prov_graph[h0][h1][OP.CONTENT_SIM])
+        self.assertEqual([h0], drs.why(h2))
+        # the provenance of the inputs does not change
+        self.assertEqual({h1, h2}, set(drs_b.get_provenance().prov_graph().nodes()))
+        self.assertFalse('AND' in drs_b.get_provenance().prov_graph()[h1][h2][OP.SCHEMA_SIM])
+
+        # a merge only annotates the edges of the provenances it merges, not those of siblings visited before
+        h3 = Hit(2, "dba", "table_b", "c", -1)
+        p_a = DRS([h2], Operation(OP.CONTENT_SIM, params=[h0])).get_provenance()
+        p_c = DRS([h2], Operation(OP.SCHEMA_SIM, params=[h1])).get_provenance()
+        p_d = DRS([h2], Operation(OP.PKFK, params=[h3])).get_provenance()
+        prov_graph = p_a.merge(p_c.merge(p_d, labels=['AND'], nodes=[h2])).prov_graph()
+        self.assertFalse('AND' in prov_graph[h0][h2][OP.CONTENT_SIM])
+        self.assertEqual(1, prov_graph[h1][h2][OP.SCHEMA_SIM]['AND'])
+        self.assertEqual(1, prov_graph[h3][h2][OP.PKFK]['AND'])
+
+    def test_intersection_table_mode(self):
+        print(self._testMethodName)
+
+        h1 = Hit(0, "dba", "table_a", "a", -1)
+        h2 = Hit(1, "dba", "table_a", "b", -1)
+        h3 = Hit(2, "dba", "table_b", "c", -1)
+        drs1 = DRS([h1, h2, h3], Operation(OP.ORIGIN))
+
+        h4 = Hit("5", "dba", "table_a", "e", -1)
+        h5 = Hit(6, "dba", "table_c", "f", -1)
+        drs2 = DRS([h5, h4, h1], Operation(OP.ORIGIN))
+        drs2.set_table_mode()
+
+        drs = drs1.intersection(drs2)
+        self.assertEqual([0, 1, 5], [int(h.nid) for h in drs.data])
+        ids, tables = drs2.id_arrays()
+        self.assertEqual([6, 5, 0], list(ids))
+        self.assertEqual(["table_c", "table_a", "table_a"], list(tables))
+
+        drs2.set_fields_mode()
+        self.assertEqual([h1], drs1.intersection(drs2).data)
+        self.assertEqual([h2, h3], drs1.set_difference(drs2).data)
+        self.assertEqual([0, 1, 2, 5, 6], [int(h.nid) for h in drs1.union(drs2).data])
+
+    def test_ranking_scores(self):
+        print(self._testMethodName)
+
+        h0 = Hit(10, "dba", "table_c", "v", 0.5)
+        h1 = Hit(11, "dba", "table_c", "w", 0.1)
+        h2 = Hit(0, "dba", "table_a", "a", 0.2)
+        h3 = Hit(1, "dba", "table_a", "b", 0.3)
+        h4 = Hit(2, "dba", "table_b", "c", 0.4)
+        drs = DRS([h0, h1], Operation(OP.ORIGIN))
+        drs = drs.absorb(DRS([h2, h3], Operation(OP.CONTENT_SIM, params=[h0])))
+        drs = drs.absorb(DRS([h3], Operation(OP.SCHEMA_SIM, params=[h1])))
+        drs = drs.absorb(DRS([h4], Operation(OP.PKFK, params=[h3])))
+
+        drs.compute_ranking_scores()
+        certainty = {el: scores['certainty_score'] for el, scores in drs._rank_data.items()}
+        coverage = {el: scores['coverage_score'][0] for el, scores in drs._rank_data.items()}
+        self.assertAlmostEqual(0.5 + 0.3 + 0.4, certainty[h4])
+        self.assertAlmostEqual(0.5 + 0.2, certainty[h2])
+        self.assertEqual(1.0, coverage[h4])
+        self.assertEqual(0.5, coverage[h2])
+        self.assertEqual(0.0, coverage[h0])
+        self.assertEqual(set(drs.why(h4)), {h0, h1})
+
+        drs.rank_coverage()
+        self.assertEqual({h3, h4}, set(drs.data[:2]))
+        drs.rank_certainty_include_coverage()
+        self.assertEqual([h4, h3, h2], drs.data[:3])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,95 @@
+from knowledgerepr import fieldnetwork
+from knowledgerepr.fieldnetwork import FieldNetwork
+from api.apiutils import Relation
+from collections import defaultdict
+import networkx as nx
+import numpy as np
+
+import time
+import tracemalloc
+
+
+def generate_random_network(num_nodes, num_edges, num_nodes_per_table=10, seed=0):
+    """
+    Creates a networkx-backed FieldNetwork with num_edges random edges of each of SCHEMA_SIM, CONTENT_SIM and PKFK.
+    Some edges are repeated, so their score is overwritten, as it happens while building a network
+    :return: the FieldNetwork
+    """
+    rnd = np.random.RandomState(seed)
+    # FieldNetwork() would share its field info with other instances
+    fn = FieldNetwork(nx.MultiGraph(), dict(), defaultdict(list))
+    fields = []
+    for i in range(num_nodes):
+        nid = str(1000000 + i)
+        table = "synt" + str(int(i / num_nodes_per_table))
+        fields.append((nid, "syndb", table, "synf" + str(i), 100, int(rnd.randint(1, 100)), "T"))
+    fn.init_meta_schema(fields)
+    for relation in [Relation.SCHEMA_SIM, Relation.CONTENT_SIM, Relation.PKFK]:
+        src = rnd.randint(0, num_nodes, size=num_edges)
+        tgt = rnd.randint(0, num_nodes, size=num_edges)
+        scores = rnd.uniform(size=num_edges)
+        for s, t, score in zip(src, tgt, scores):
+            fn.add_relation(fields[s][0], fields[t][0], relation, float(score))
+    return fn
+
+
+def measure_memory(build):
+    """
+    :param build: function that creates the object to measure
+    :return: (object, bytes allocated while building it and still alive)
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    obj = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def experiment_backends(sizes, edges_per_node=10, num_queries=1000, relation=Relation.CONTENT_SIM):
+    """
+    Compares the networkx-backed FieldNetwork with the CompactFieldNetwork on random networks. The memory of the
+    first includes the field info dicts, which the compact one shares with it
+    :return: dict of {num_nodes: ((bytes nx, bytes compact), (p5, median, p95) neighbors_id nx,
+    (p5, median, p95) neighbors_id compact)}
+    """
+    perf_results = dict()
+    for num_nodes in sizes:
+        network, nx_bytes = measure_memory(
+            lambda: generate_random_network(num_nodes, num_nodes * edges_per_node))
+        compact, compact_bytes = measure_memory(lambda: fieldnetwork.compact_field_network(network))
+
+        nids = list(network.iterate_ids())
+        rnd = np.random.RandomState(0)
+        queries = [nids[i] for i in rnd.randint(0, len(nids), size=num_queries)]
+        latencies = []
+        for backend in [network, compact]:
+            times = []
+            for nid in queries:
+                s = time.time()
+                backend.neighbors_id(nid, relation)
+                e = time.time()
+                times.append((e - s))
+            latencies.append(times)
+        p_nx, p_compact = get_percentiles(latencies)
+        perf_results[num_nodes] = ((nx_bytes, compact_bytes), p_nx, p_compact)
+    return perf_results
+
+
+def get_percentiles(list_of_lists):
+    results = []
+    for l in list_of_lists:
+        nq = np.array(l)
+        p5 = np.percentile(nq, 5)
+        p50 = np.percentile(nq, 50)
+        p95 = np.percentile(nq, 95)
+        percentiles = (p5, p50, p95)
+        results.append(percentiles)
+    return results
+
+
+if __name__ == "__main__":
+
+    results = experiment_backends([1000, 10000, 100000])
+    for k, v in results.items():
+        print(str(k) + " -> " + str(v))
@@ -0,0 +1,116 @@
+import sys
+import time
+
+import numpy as np
+
+from dataanalysis import dataanalysis as da
+from knowledgerepr import fieldnetwork
+from knowledgerepr.networkbuilder import BatchedLSHRandomProjectionsIndex
+from nearpy.experiments import RecallPrecisionExperiment
+
+
+def sample_field_names(network, sample_size, seed=0):
+    """
+    Samples distinct column names of the model, as build_schema_sim_relation indexes them
+    :return: list of column names
+    """
+    names = sorted({field_name for (_, _, field_name, _) in network.iterate_values()})
+    rnd = np.random.RandomState(seed)
+    if len(names) > sample_size:
+        names = [names[i] for i in sorted(rnd.choice(len(names), sample_size, replace=False))]
+    return names
+
+
+def distinct_vectors(tfidf):
+    """
+    Dense TF-IDF rows without empty and repeated vectors. The experiment identifies results by their rounded
+    vector, so names with the same tokens would be taken for each other
+    :return: matrix with one vector per row
+    """
+    dense = tfidf.toarray()
+    dense = dense[np.abs(dense).sum(axis=1) > 0]
+    norms = np.sqrt((dense ** 2).sum(axis=1))
+    _, first = np.unique(np.round(dense / norms[:, None], decimals=3), axis=0, return_index=True)
+    return dense[np.sort(first)]
+
+
+def recall_precision(experiment, index):
+    """
+    Recall and precision of index against the exact neighbours of the query vectors of a nearpy
+    RecallPrecisionExperiment, measured as perform_experiment does for an Engine
+    :param index: a BatchedLSHRandomProjectionsIndex, the vectors are indexed with their row as data
+    :return: (recall, precision, seconds per query)
+    """
+    index.bulk_index(experiment.vectors, list(range(len(experiment.vectors))))
+    recall = 0.0
+    precision = 0.0
+    search_time = 0.0
+    for row in experiment.query_indices:
+        st = time.time()
+        nearest = {data for _, data, _ in index.query(experiment.vectors[row])}
+        search_time += time.time() - st
+        # the query itself is not a neighbour, only finding it is a recall of 0
+        nearest.discard(row)
+        if len(nearest) > 0:
+            found = float(len(set(experiment.closest[row]) & nearest))
+            recall += found / len(experiment.closest[row])
+            precision += found / len(nearest)
+    num_queries = float(len(experiment.query_indices))
+    return recall / num_queries, precision / num_queries, search_time / num_queries
+
+
+def tune_schema_sim_index(vectors, configurations, num_neighbours=9, coverage_ratio=0.2):
+    """
+    Measures the recall of BatchedLSHRandomProjectionsIndex, the index build_schema_sim_relation_batched builds,
+    with each configuration against the exact search of nearpy's RecallPrecisionExperiment, together with its query
+    latency and the memory of its tables. The index returns 10 vectors per query, the query among them, so 9
+    neighbours can be recalled
+    :param vectors: matrix with one vector per row
+    :param configurations: list of (projection_count, num_tables, probe_distance)
+    :return: list of (configuration, recall, precision, seconds per query, bytes of the index)
+    """
+    experiment = RecallPrecisionExperiment(num_neighbours, vectors.T, coverage_ratio=coverage_ratio)
+    results = []
+    for configuration in configurations:
+        projection_count, num_tables, probe_distance = configuration
+        index = BatchedLSHRandomProjectionsIndex(vectors.shape[1], projection_count=projection_count,
+                                                 num_neighbours=num_neighbours + 1, num_tables=num_tables,
+                                                 probe_distance=probe_distance)
+        print("Configuration " + str(configuration))
+        recall, precision, latency = recall_precision(experiment, index)
+        results.append((configuration, recall, precision, latency, index.memory_size()))
+    return results
+
+
+def default_configurations():
+    configurations = []
+    for projection_count in [20, 30]:
+        for num_tables in [1, 2, 4]:
+            for probe_distance in [0, 1, 2]:
+                configurations.append((projection_count, num_tables, probe_distance))
+    return configurations
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("USAGE: python lsh_tuning.py <path_to_serialized_model> [sample_size]")
+        exit()
+
+    model_path = sys.argv[1]
+    if not model_path.endswith('/'):
+        model_path = model_path + '/'
+    sample_size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    network = fieldnetwork.deserialize_network(model_path)
+    st = time.time()
+    vectors = distinct_vectors(da.get_tfidf_docs(sample_field_names(network, sample_size)))
+    et = time.time()
+    print("Sampled " + str(vectors.shape[0]) + " column names in: " + str(et - st))
+
+    results = tune_schema_sim_index(vectors, default_configurations())
+    print("projections tables probe_distance -> recall precision ms/query MB")
+    for (projection_count, num_tables, probe_distance), recall, precision, latency, size in results:
+        print("{0} {1} {2} -> {3:.3f} {4:.3f} {5:.3f} {6:.1f}".format(projection_count, num_tables, probe_distance,
+                                                                      recall, precision, latency * 1000,
+                                                                      size / 1024 / 1024))
@@ -0,0 +1,233 @@
+from knowledgerepr import networkbuilder
+from knowledgerepr.fieldnetwork import FieldNetwork
+from api.apiutils import Relation
+from datasketch import MinHash
+import numpy as np
+
+import time
+
+
+def generate_num_signatures(num_columns, seed=0):
+    """
+    Creates synthetic (nid, (median, iqr, min, max)) signatures, mixing integer and float columns, columns with a
+    single value (iqr 0) and columns that are contained into others, as the profiler would store them
+    :param num_columns: number of numerical columns to generate
+    :param seed: seed of the random generator
+    :return: list of (nid, (median, iqr, min, max))
+    """
+    rnd = np.random.RandomState(seed)
+    id_sig = []
+    for i in range(num_columns):
+        nid = str(1000000 + i)
+        kind = rnd.randint(0, 10)
+        if kind < 5:  # integer columns, e.g., ids and counts
+            c_min = int(rnd.randint(0, 5000))
+            c_max = c_min + int(rnd.randint(0, 5000))
+            median = int((c_min + c_max) / 2)
+            iqr = int(rnd.randint(0, max(1, (c_max - c_min) // 2)))
+        elif kind < 9:  # float columns
+            c_min = float(rnd.uniform(-100, 1000))
+            c_max = c_min + float(rnd.uniform(0, 1000))
+            median = (c_min + c_max) / 2
+            iqr = float(rnd.uniform(0, (c_max - c_min) / 2))
+        else:  # single value columns
+            c_min = int(rnd.randint(0, 100))
+            c_max = c_min
+            median = c_min
+            iqr = 0
+        id_sig.append((nid, (median, iqr, c_min, c_max)))
+    return id_sig
+
+
+def generate_field_names(num_columns, seed=0):
+    """
+    Creates synthetic column names by combining a few common words, so that many of them share tokens
+    :return: list of column names
+    """
+    words = ["id", "name", "date", "value", "total", "city", "state", "code", "year", "amount", "user", "order",
+             "price", "address", "zip", "country", "type", "description", "start", "end"]
+    rnd = np.random.RandomState(seed)
+    names = []
+    for i in range(num_columns):
+        num_words = rnd.randint(1, 4)
+        names.append("_".join(rnd.choice(words, num_words, replace=False)))
+    return names
+
+
+def generate_mh_signatures(num_columns, num_perm=512, seed=0):
+    """
+    Creates synthetic (nid, minhash signature) pairs. Columns draw their values from a few shared vocabularies so
+    that groups of them have high Jaccard similarity, as columns of joinable tables would
+    :return: list of (nid, list of num_perm hash values)
+    """
+    rnd = np.random.RandomState(seed)
+    num_vocabularies = max(1, num_columns // 10)
+    vocabularies = [rnd.randint(0, 10000000, size=200) for _ in range(num_vocabularies)]
+    mh_signatures = []
+    for i in range(num_columns):
+        nid = str(1000000 + i)
+        vocabulary = vocabularies[rnd.randint(0, num_vocabularies)]
+        keep = rnd.uniform(0.7, 1.0)
+        values = vocabulary[rnd.uniform(size=len(vocabulary)) < keep]
+        mh = MinHash(num_perm=num_perm)
+        for v in values:
+            mh.update(str(v).encode('utf8'))
+        mh_signatures.append((nid, mh.hashvalues.tolist()))
+    return mh_signatures
+
+
+def network_with_fields(nids, field_names=None, data_type="N"):
+    fn = FieldNetwork()
+    if field_names is None:
+        field_names = ["synf" + nid for nid in nids]
+    fields = [(nid, "syndb", "synt" + str(int(nid) % 100), field_name, 100, 50, data_type)
+              for nid, field_name in zip(nids, field_names)]
+    fn.init_meta_schema(fields)
+    return fn
+
+
+def relation_edges(network, relation):
+    """
+    :return: dict of {frozenset(nid1, nid2): score} with all the edges of the given relation
+    """
+    edges = dict()
+    G = network._get_underlying_repr_graph()
+    for src, tgt, key, data in G.edges(keys=True, data=True):
+        if key == relation:
+            edges[frozenset((src, tgt))] = data['score']['score']
+    return edges
+
+
+def same_edges(network_a, network_b, relation):
+    edges_a = relation_edges(network_a, relation)
+    edges_b = relation_edges(network_b, relation)
+    if edges_a.keys() != edges_b.keys():
+        return False
+    for k, v in edges_a.items():
+        if not np.isclose(v, edges_b[k]):
+            return False
+    return True
+
+
+def experiment_num_overlap_engines(sizes, repetitions=3):
+    """
+    Compares the pairwise numerical overlap builder with the sort-and-sweep one on synthetic signatures
+    :return: dict of {size: ((p5, median, p95) pairwise, (p5, median, p95) sweep, same_output)}
+    """
+    perf_results = dict()
+    for size in sizes:
+        id_sig = generate_num_signatures(size)
+        nids = [nid for nid, _ in id_sig]
+
+        pairwise_times = []
+        sweep_times = []
+        for i in range(repetitions):
+            pairwise_network = network_with_fields(nids)
+            s = time.time()
+            networkbuilder.build_content_sim_relation_num_overlap_distr(pairwise_network, id_sig)
+            e = time.time()
+            pairwise_times.append((e - s))
+
+            sweep_network = network_with_fields(nids)
+            s = time.time()
+            networkbuilder.build_content_sim_relation_num_overlap_distr_sweep(sweep_network, id_sig)
+            e = time.time()
+            sweep_times.append((e - s))
+
+        same_output = same_edges(pairwise_network, sweep_network, Relation.CONTENT_SIM) and \
+            same_edges(pairwise_network, sweep_network, Relation.INCLUSION_DEPENDENCY)
+        p_pairwise, p_sweep = get_percentiles([pairwise_times, sweep_times])
+        perf_results[size] = (p_pairwise, p_sweep, same_output)
+    return perf_results
+
+
+def experiment_schema_sim_engines(sizes, repetitions=3):
+    """
+    Compares the per-row schema-sim builder with the batched one on synthetic column names. Hyperplanes are random
+    so the edges are not the same, we report how many each one finds
+    :return: dict of {size: ((p5, median, p95) per-row, (p5, median, p95) batched, (num edges per-row, batched))}
+    """
+    perf_results = dict()
+    for size in sizes:
+        nids = [str(1000000 + i) for i in range(size)]
+        field_names = generate_field_names(size)
+
+        row_times = []
+        batched_times = []
+        for i in range(repetitions):
+            row_network = network_with_fields(nids, field_names=field_names, data_type="T")
+            s = time.time()
+            networkbuilder.build_schema_sim_relation(row_network)
+            e = time.time()
+            row_times.append((e - s))
+
+            batched_network = network_with_fields(nids, field_names=field_names, data_type="T")
+            s = time.time()
+            networkbuilder.build_schema_sim_relation_batched(batched_network)
+            e = time.time()
+            batched_times.append((e - s))
+
+        num_edges = (len(relation_edges(row_network, Relation.SCHEMA_SIM)),
+                     len(relation_edges(batched_network, Relation.SCHEMA_SIM)))
+        p_row, p_batched = get_percentiles([row_times, batched_times])
+        perf_results[size] = (p_row, p_batched, num_edges)
+    return perf_results
+
+
+def experiment_content_sim_mh_engines(sizes, num_workers=None, repetitions=3):
+    """
+    Compares the per-column MinHashLSH query builder with the band-sharded parallel one on synthetic signatures
+    :return: dict of {size: ((p5, median, p95) per-column, (p5, median, p95) parallel, same_output)}
+    """
+    perf_results = dict()
+    for size in sizes:
+        mh_signatures = generate_mh_signatures(size)
+        nids = [nid for nid, _ in mh_signatures]
+
+        query_times = []
+        parallel_times = []
+        for i in range(repetitions):
+            query_network = network_with_fields(nids, data_type="T")
+            s = time.time()
+            networkbuilder.build_content_sim_mh_text(query_network, mh_signatures)
+            e = time.time()
+            query_times.append((e - s))
+
+            parallel_network = network_with_fields(nids, data_type="T")
+            s = time.time()
+            networkbuilder.build_content_sim_mh_text_parallel(parallel_network, mh_signatures,
+                                                              num_workers=num_workers)
+            e = time.time()
+            parallel_times.append((e - s))
+
+        same_output = same_edges(query_network, parallel_network, Relation.CONTENT_SIM)
+        p_query, p_parallel = get_percentiles([query_times, parallel_times])
+        perf_results[size] = (p_query, p_parallel, same_output)
+    return perf_results
+
+
+def get_percentiles(list_of_lists):
+    results = []
+    for l in list_of_lists:
+        nq = np.array(l)
+        p5 = np.percentile(nq, 5)
+        p50 = np.percentile(nq, 50)
+        p95 = np.percentile(nq, 95)
+        percentiles = (p5, p50, p95)
+        results.append(percentiles)
+    return results
+
+
+if __name__ == "__main__":
+
+    num_overlap_results = experiment_num_overlap_engines([100, 500, 1000, 2000], repetitions=3)
+    for k, v in num_overlap_results.items():
+        print(str(k) + " -> " + str(v))
+
+    schema_sim_results = experiment_schema_sim_engines([1000, 10000, 50000], repetitions=3)
+    for k, v in schema_sim_results.items():
+        print(str(k) + " -> " + str(v))
+
+    content_sim_mh_results = experiment_content_sim_mh_engines([1000, 5000, 20000], repetitions=3)
+    for k, v in content_sim_mh_results.items():
+        print(str(k) + " -> " + str(v))
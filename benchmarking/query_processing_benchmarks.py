@@ -1,5 +1,9 @@
 from knowledgerepr import syn_network_generator as syn
 from api.apiutils import Relation
+from api.apiutils import DRS
+from api.apiutils import OP
+from api.apiutils import Operation
+from knowledgerepr.fieldnetwork import assemble_field_path_provenance
 import numpy as np
 from ddapi import API
 
@@ -171,6 +175,66 @@ def experiment_changing_max_hops_tc_queries(repetitions=100):
     return perf_results
 
 
+def find_path_hit_dfs(network, source, target, relation, max_hops):
+    """
+    The recursive depth-first search that FieldNetwork.find_path_hit used before the bidirectional BFS, kept as the
+    baseline of experiment_path_queries_dfs_bfs
+    """
+
+    def deep_explore(candidates, target_group, already_visited, path, max_hops):
+        if max_hops == 0:
+            return False
+        for c in candidates:
+            if c in target_group:
+                path.insert(0, c)
+                return True
+        for c in candidates:
+            if c in already_visited:
+                continue
+            already_visited.append(c)
+            next_level_candidates = [x for x in network.neighbors_id(c, relation)]
+            if len(next_level_candidates) == 0:
+                continue
+            if deep_explore(next_level_candidates, target_group, already_visited, path, max_hops - 1):
+                path.insert(0, c)
+                return True
+        return False
+
+    path = []
+    if deep_explore([source], [target], [], path, max_hops):
+        return assemble_field_path_provenance(DRS([], Operation(OP.NONE)), path, relation)
+    return DRS([], Operation(OP.NONE))
+
+
+def experiment_path_queries_dfs_bfs(sizes, edges_per_node=2, num_queries=50, max_hops=4):
+    """
+    Latency of field path queries with the recursive DFS (find_path_hit_dfs) and the bidirectional BFS
+    (find_path_hit_bfs) on random networks of growing size
+    :return: dict of {size: ((p5, median, p95) dfs, (p5, median, p95) bfs)}
+    """
+    from benchmarking.field_network_benchmarks import generate_random_network
+    perf_results = dict()
+    for size in sizes:
+        fn = generate_random_network(size, size * edges_per_node)
+        hits = fn.get_hits_from_info(fn.get_info_for(list(fn.iterate_ids())))
+        rnd = np.random.RandomState(0)
+        pairs = [(hits[i], hits[j]) for i, j in rnd.randint(0, len(hits), size=(num_queries, 2))]
+
+        dfs_times = []
+        bfs_times = []
+        for h1, h2 in pairs:
+            s = time.time()
+            find_path_hit_dfs(fn, h1, h2, Relation.PKFK, max_hops)
+            e = time.time()
+            dfs_times.append((e - s))
+            s = time.time()
+            fn.find_path_hit_bfs(h1, h2, Relation.PKFK, max_hops=max_hops)
+            e = time.time()
+            bfs_times.append((e - s))
+        perf_results[size] = get_percentiles([dfs_times, bfs_times])
+    return perf_results
+
+
 def get_percentiles(list_of_lists):
     results = []
     for l in list_of_lists:
@@ -300,3 +364,6 @@ if __name__ == "__main__":
         print(str(k) + " -> " + str(v))
     write_results_to_csv_one_query("/Users/ra-mit/research/data-discovery/papers/dd-paper/evaluation_results/qp_performance/data/changing_hops_tc.dat", changing_hops_results, dat=True)
 
+    path_query_results = experiment_path_queries_dfs_bfs([1000, 10000, 100000])
+    for k, v in path_query_results.items():
+        print(str(k) + " -> " + str(v))
@@ -17,6 +17,11 @@ jgraphfile = "jgraphfile.pickle"
 db_host = 'localhost'
 db_port = '9200'
 
+# Bulk export of signatures from the store
+export_num_slices = 4
+export_page_size = 5000
+export_batch_size = 50000
+
 ###########
 ## minhash
 ###########
@@ -29,3 +34,10 @@ k = 512
 separator = '|'
 join_chunksize = 1000
 memory_limit_join_processing = 0.6  # 60% of total memory
+memory_limit_join_partition = 0.05  # 5% of total memory for each partition of an out-of-core join
+relation_cache_memory = 0.2  # 20% of total memory
+relation_cache_parquet_dir = None  # directory for parquet copies of the relations, None to always read the csv files
+relation_cache_copy_on_write = True  # enabled when DoD starts, see dpu.enable_relation_cache_copy_on_write
+dod_num_workers = 1  # processes that check and materialize join graphs, 1 to do it in the calling process
+dod_materialization_memory = 0.5  # 50% of total memory for the join graphs materialized at the same time
+join_estimate_max_rows = 10 ** 8  # join graphs estimated bigger than this are not materialized
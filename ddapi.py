@@ -115,11 +115,27 @@ class DDAPI:
         :return: the matches in the internal representation
         """
         o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.keyword_search(kw, max_results=max_results)
+        for res_drs in self.search_many(kws, KWType.KW_CONTENT, max_results=max_results):
             o_drs = o_drs.absorb(res_drs)
         return o_drs
 
+    def search_many(self, kws: [str], kw_type: KWType, max_results=10) -> [DRS]:
+        """
+        Performs a keyword search of each keyword, all in a single request to the store
+        :param kws: collection (iterable) of keywords (strings)
+        :param kw_type: where to search the keywords, content, schema names, entities or table names
+        :param max_results: the maximum number of results to return for each keyword
+        :return: a DRS for each keyword, in the same order
+        """
+        kws = list(kws)
+        op = OP.KW_LOOKUP
+        if kw_type == KWType.KW_SCHEMA:
+            op = OP.SCHNAME_LOOKUP
+        elif kw_type == KWType.KW_ENTITIES:
+            op = OP.ENTITY_LOOKUP
+        all_hits = store_client.search_keywords_batch(kws, kw_type, max_results)
+        return [DRS(hits, Operation(op, params=[kw])) for kw, hits in zip(kws, all_hits)]
+
     def schema_name_search(self, kw: str, max_results=10) -> DRS:
         """
         Performs a keyword search over the attribute/field names of the data
@@ -139,8 +155,7 @@ class DDAPI:
         :return: a DRS
         """
         o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.schema_name_search(kw, max_results=max_results)
+        for res_drs in self.search_many(kws, KWType.KW_SCHEMA, max_results=max_results):
             o_drs = o_drs.absorb(res_drs)
         return o_drs
 
@@ -162,8 +177,7 @@ class DDAPI:
         :return: a DRS
         """
         o_drs = DRS([], Operation(OP.NONE))
-        for kw in kws:
-            res_drs = self.table_name_search(kw, max_results=max_results)
+        for res_drs in self.search_many(kws, KWType.KW_TABLE, max_results=max_results):
             o_drs = o_drs.absorb(res_drs)
         return o_drs
 
@@ -399,8 +413,8 @@ class DDAPI:
                 for h2 in b:  # h2 is a table: str
                     if h1 == h2:
                         return o_drs  # same source ant target table
-                    res_drs = self.__network.find_path_table(
-                        h1, h2, primitives, self, max_hops=max_hops)
+                    res_drs = self.__network.find_path_table_bfs(
+                        h1, h2, primitives, max_hops=max_hops)
                     o_drs = o_drs.absorb(res_drs)
         return o_drs
 
@@ -424,8 +438,8 @@ class DDAPI:
         elif a.mode == DRSMode.TABLE:
             for h1 in a:  # h1 is a table: str
                 for h2 in a:  # h2 is a table: str
-                    res_drs = self.__network.find_path_table(
-                        h1, h2, primitives, self)
+                    res_drs = self.__network.find_path_table_bfs(
+                        h1, h2, primitives)
                     o_drs = o_drs.absorb(res_drs)
         return o_drs
 
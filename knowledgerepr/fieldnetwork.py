@@ -1,10 +1,14 @@
 import matplotlib.pyplot as plt
 import operator
+import heapq
 import networkx as nx
+import numpy as np
 import os
 
 
 from collections import defaultdict
+from collections import deque
+import itertools
 from api.apiutils import DRS
 from api.apiutils import Operation
 from api.apiutils import OP
@@ -19,6 +23,117 @@ def build_hit(sn, fn):
     return Hit(nid, sn, fn, -1)
 
 
+def assemble_field_path_provenance(o_drs, path, relation):
+    src = path[0]
+    tgt = path[-1]
+    origin = DRS([src], Operation(OP.ORIGIN))
+    o_drs.absorb_provenance(origin)
+    prev_c = src
+    for c in path[1:-1]:
+        nxt = DRS([c], Operation(OP.PKFK, params=[prev_c]))
+        o_drs.absorb_provenance(nxt)
+        prev_c = c
+    sink = DRS([tgt], Operation(OP.PKFK, params=[prev_c]))
+    o_drs = o_drs.absorb(sink)
+    return o_drs
+
+
+def assemble_table_path_provenance(o_drs, paths, relation):
+
+    for path in paths:
+        src, src_sibling = path[0]
+        assert (src_sibling is None)  # sibling of source should be None, as source is an origin
+        tgt, tgt_sibling = path[-1]
+        origin = DRS([src], Operation(OP.ORIGIN))
+        o_drs.absorb_provenance(origin)
+        prev_c = src
+        for c, sibling in path[1:-1]:
+            nxt = DRS([sibling], Operation(OP.PKFK, params=[prev_c]))
+            o_drs.absorb_provenance(nxt)
+            if c.nid != sibling.nid:  # avoid loop on head nodes of the graph
+                linker = DRS([c], Operation(OP.TABLE, params=[sibling]))
+                o_drs.absorb_provenance(linker)
+            prev_c = c
+        sink = DRS([tgt_sibling], Operation(OP.PKFK, params=[prev_c]))
+
+        #The join path at the target has None sibling
+        if tgt is not None and tgt_sibling is not None and tgt.nid != tgt_sibling.nid:
+            o_drs = o_drs.absorb_provenance(sink)
+            linker = DRS([tgt], Operation(OP.TABLE, params=[tgt_sibling]))
+            o_drs.absorb(linker)
+        else:
+            o_drs = o_drs.absorb(sink)
+    return o_drs
+
+
+def bidirectional_shortest_path(source, target, neighbors, max_hops, blocked_nodes=None, blocked_edges=None):
+    """
+    Breadth-first search from both ends at once, expanding one level of the smaller frontier at a time
+    :param source: the node where the path starts
+    :param target: the node where the path ends
+    :param neighbors: function that returns the neighbors of a node
+    :param max_hops: maximum number of edges of the path
+    :param blocked_nodes: set of nodes that the path cannot go through
+    :param blocked_edges: set of (node, node) edges that the path cannot use
+    :return: the list of nodes of a shortest path, or None if there is none with at most max_hops edges
+    """
+    if blocked_nodes is None:
+        blocked_nodes = set()
+    if blocked_edges is None:
+        blocked_edges = set()
+    if source == target:
+        return [source]
+    if source in blocked_nodes or target in blocked_nodes:
+        return None
+
+    # node -> (parent, distance) for the search from each end
+    visited_src = {source: (None, 0)}
+    visited_tgt = {target: (None, 0)}
+    frontier_src = [source]
+    frontier_tgt = [target]
+    hops = 0
+    while hops < max_hops and len(frontier_src) > 0 and len(frontier_tgt) > 0:
+        forward = len(frontier_src) <= len(frontier_tgt)
+        if forward:
+            frontier, visited, other = frontier_src, visited_src, visited_tgt
+        else:
+            frontier, visited, other = frontier_tgt, visited_tgt, visited_src
+        next_frontier = []
+        meeting = None
+        meeting_length = None
+        for node in frontier:
+            distance = visited[node][1]
+            for n in neighbors(node):
+                if n in blocked_nodes or n in visited:
+                    continue
+                if (node, n) in blocked_edges:
+                    continue
+                visited[n] = (node, distance + 1)
+                next_frontier.append(n)
+                if n in other:
+                    length = distance + 1 + other[n][1]
+                    if meeting is None or length < meeting_length:
+                        meeting = n
+                        meeting_length = length
+        hops += 1
+        if meeting is not None:
+            path = []
+            node = meeting
+            while node is not None:
+                path.insert(0, node)
+                node = visited_src[node][0]
+            node = visited_tgt[meeting][0]
+            while node is not None:
+                path.append(node)
+                node = visited_tgt[node][0]
+            return path
+        if forward:
+            frontier_src = next_frontier
+        else:
+            frontier_tgt = next_frontier
+    return None
+
+
 class FieldNetwork:
     # The core graph
     __G = nx.MultiGraph()
@@ -26,8 +141,11 @@ class FieldNetwork:
     __source_ids = defaultdict(list)
 
     def __init__(self, graph=None, id_names=None, source_ids=None):
+        self._table_join_graphs = dict()  # relation -> table join graph, see table_join_graph
         if graph is None:
             self.__G = nx.MultiGraph()
+            self.__id_names = dict()
+            self.__source_ids = defaultdict(list)
         else:
             self.__G = graph
             self.__id_names = id_names
@@ -78,7 +196,7 @@ class FieldNetwork:
         return hits
 
     def get_cardinality_of(self, node_id):
-        c = self.__G.node[node_id]
+        c = self.__G.nodes[node_id]
         card = c['cardinality']
         if card is None:
             return 0  # no cardinality is like card 0
@@ -109,14 +227,56 @@ class FieldNetwork:
         """
         print("Building schema relation...")
         for (nid, db_name, sn_name, fn_name, total_values, unique_values, data_type) in fields:
-            self.__id_names[nid] = (db_name, sn_name, fn_name, data_type)
-            self.__source_ids[sn_name].append(nid)
-            cardinality_ratio = None
-            if float(total_values) > 0:
-                cardinality_ratio = float(unique_values) / float(total_values)
-            self.add_field(nid, cardinality_ratio)
+            self.add_field_info(nid, db_name, sn_name, fn_name, total_values, unique_values, data_type)
         print("Building schema relation...OK")
 
+    def add_field_info(self, nid, db_name, sn_name, fn_name, total_values, unique_values, data_type):
+        """
+        Adds a field with its info and cardinality, as read from the store, or updates them if the field is
+        already in the network
+        :return:
+        """
+        if nid not in self.__id_names:
+            self.__source_ids.setdefault(sn_name, []).append(nid)
+        self.__id_names[nid] = (db_name, sn_name, fn_name, data_type)
+        cardinality_ratio = None
+        if float(total_values) > 0:
+            cardinality_ratio = float(unique_values) / float(total_values)
+        self.add_field(nid, cardinality_ratio)
+
+    def remove_field(self, nid):
+        """
+        Removes a field, its info and all its relations
+        :param nid: the id of the field
+        :return:
+        """
+        if nid not in self.__id_names:
+            return
+        db_name, sn_name, fn_name, data_type = self.__id_names.pop(nid)
+        self.__source_ids[sn_name].remove(nid)
+        if len(self.__source_ids[sn_name]) == 0:
+            del self.__source_ids[sn_name]
+        if self.__G.has_node(nid):
+            self.__G.remove_node(nid)
+        self._table_join_graphs.clear()
+
+    def remove_relations(self, relations, nids=None):
+        """
+        Removes the edges of the given relations
+        :param relations: list of Relation
+        :param nids: remove only the edges of these fields, all edges if None
+        :return:
+        """
+        if nids is None:
+            edges = [(src, tgt, key) for src, tgt, key in self.__G.edges(keys=True) if key in relations]
+        else:
+            edges = [(nid, neighbor, key) for nid in nids if self.__G.has_node(nid)
+                     for neighbor, keys in self.__G[nid].items() for key in keys if key in relations]
+        for src, tgt, key in edges:
+            if self.__G.has_edge(src, tgt, key):
+                self.__G.remove_edge(src, tgt, key)
+        self._table_join_graphs.clear()
+
     def add_field(self, nid, cardinality=None):
         """
         Creates a graph node for this field and adds it to the graph
@@ -151,6 +311,7 @@ class FieldNetwork:
         """
         score = {'score': score}
         self.__G.add_edge(node_src, node_target, relation, score=score)
+        self._table_join_graphs.clear()
 
     def fields_degree(self, topk):
         degree = nx.degree(self.__G)
@@ -248,193 +409,470 @@ class FieldNetwork:
         return o_drs
 
     def find_path_hit(self, source, target, relation, max_hops=5):
+        """
+        Finds the shortest path between source and target, see find_path_hit_bfs
+        """
+        return self.find_path_hit_bfs(source, target, relation, max_hops=max_hops)
 
-        def assemble_field_path_provenance(o_drs, path, relation):
-            src = path[0]
-            tgt = path[-1]
-            origin = DRS([src], Operation(OP.ORIGIN))
-            o_drs.absorb_provenance(origin)
-            prev_c = src
-            for c in path[1:-1]:
-                nxt = DRS([c], Operation(OP.PKFK, params=[prev_c]))
-                o_drs.absorb_provenance(nxt)
-                prev_c = c
-            sink = DRS([tgt], Operation(OP.PKFK, params=[prev_c]))
-            o_drs = o_drs.absorb(sink)
-            return o_drs
-
-        def deep_explore(candidates, target_group, already_visited, path, max_hops):
-            """
-            Recursively depth-first explore the graph, checking if candidates are in target_group
-            Returns (boolean, [])
-            """
-            local_max_hops = max_hops
-
-            if local_max_hops == 0:
-                return False
-
-            # first check membership
-            for c in candidates:
-                if c in target_group:
-                    path.insert(0, c)
-                    return True
-
-            # if not, then we explore these individually
-            for c in candidates:
-                if c in already_visited:
-                    continue  # next candidate
-                else:
-                    already_visited.append(c)  # add candidate to set of already visited
-
-                next_level_candidates = [x for x in self.neighbors_id(c, relation)]  # get next set of candidates
-
-                if len(next_level_candidates) == 0:
+    def find_path_hit_bfs(self, source, target, relation, max_hops=5, k=1):
+        """
+        Finds the shortest path between source and target with a bidirectional breadth-first search
+        :param source: the Hit where paths start
+        :param target: the Hit where paths end
+        :param relation: the relation to follow
+        :param max_hops: maximum number of edges of a path
+        :param k: number of paths to return, the k shortest ones (loopless, Yen's algorithm)
+        :return: DRS with the provenance of the paths found, empty if there is none
+        """
+        hits = {str(source.nid): source, str(target.nid): target}
+        neighbors_cache = dict()
+
+        def neighbors(nid):
+            ns = neighbors_cache.get(nid)
+            if ns is None:
+                ns = []
+                for h in self.neighbors_id(hits[nid], relation):
+                    h_nid = str(h.nid)
+                    hits.setdefault(h_nid, h)
+                    ns.append(h_nid)
+                neighbors_cache[nid] = ns
+            return ns
+
+        src = str(source.nid)
+        tgt = str(target.nid)
+        paths = []
+        shortest = bidirectional_shortest_path(src, tgt, neighbors, max_hops)
+        if shortest is not None:
+            paths.append(shortest)
+        candidates = []  # heap of (length, path) of the next shortest paths
+        while 0 < len(paths) < k:
+            previous = paths[-1]
+            for j in range(len(previous) - 1):
+                spur = previous[j]
+                root = previous[:j + 1]
+                blocked_edges = set()
+                for p in paths:
+                    if p[:j + 1] == root and len(p) > j + 1:
+                        blocked_edges.add((p[j], p[j + 1]))
+                        blocked_edges.add((p[j + 1], p[j]))
+                spur_path = bidirectional_shortest_path(spur, tgt, neighbors, max_hops - j,
+                                                        blocked_nodes=set(root[:-1]), blocked_edges=blocked_edges)
+                if spur_path is None:
                     continue
-                next_max_hops = local_max_hops - 1  # reduce one level depth and go ahead
-                success = deep_explore(next_level_candidates, target_group, already_visited, path, next_max_hops)
-                if success:
-                    path.insert(0, c)
-                    return True
-            return False  # if all nodes were already visited
-
-        # maximum number of hops
-        max_hops = 5
-
+                path = root[:-1] + spur_path
+                if path not in paths and (len(path), path) not in candidates:
+                    heapq.heappush(candidates, (len(path), path))
+            if len(candidates) == 0:
+                break
+            _, path = heapq.heappop(candidates)
+            paths.append(path)
+
+        if len(paths) == 0:
+            return DRS([], Operation(OP.NONE))
         o_drs = DRS([], Operation(OP.NONE))  # Carrier of provenance
+        for path in paths:
+            o_drs = assemble_field_path_provenance(o_drs, [hits[nid] for nid in path], relation)
+        return o_drs
 
-        # TODO: same src == trg, etc
+    def table_join_graph(self, relation=Relation.PKFK):
+        """
+        Table-level view of relation, built the first time it is needed and kept until the relation changes
+        :return: dict of {table: {neighbor_table: [(column Hit in table, column Hit in neighbor_table)]}}
+        """
+        join_graph = self._table_join_graphs.get(relation)
+        if join_graph is None:
+            join_graph = build_table_join_graph(self, relation)
+            self._table_join_graphs[relation] = join_graph
+        return join_graph
 
-        path = []
+    def table_join_paths(self, source: str, target: str, relation=Relation.PKFK, max_hops=3):
+        """
+        All paths of at most max_hops joins between two tables that do not go twice through the same table. The
+        paths are enumerated breadth-first on the table join graph, so shorter ones come first, and only through
+        tables that are close enough to the target to reach it in the remaining hops
+        :param source: the name of the table where paths start
+        :param target: the name of the table where paths end
+        :param relation: the relation that joins tables
+        :param max_hops: maximum number of joins of a path
+        :return: list of paths, each one the list of its table names
+        """
+        join_graph = self.table_join_graph(relation)
+        if source == target or source not in join_graph or target not in join_graph:
+            return []
+
+        # hops from each table to the target, for those that can reach it within max_hops
+        distance_to_target = {target: 0}
+        fringe = [target]
+        for hops in range(1, max_hops + 1):
+            next_fringe = []
+            for table in fringe:
+                for neighbor in join_graph[table].keys():
+                    if neighbor not in distance_to_target:
+                        distance_to_target[neighbor] = hops
+                        next_fringe.append(neighbor)
+            fringe = next_fringe
+        if source not in distance_to_target:
+            return []
+
+        table_paths = []
+        queue = deque([[source]])
+        while len(queue) > 0:
+            table_path = queue.popleft()
+            for neighbor in join_graph[table_path[-1]].keys():
+                if neighbor in table_path:
+                    continue
+                if neighbor == target:
+                    table_paths.append(table_path + [neighbor])
+                elif len(table_path) + distance_to_target.get(neighbor, max_hops + 1) <= max_hops:
+                    queue.append(table_path + [neighbor])
+        return table_paths
 
-        success = deep_explore([source], [target], [], path, max_hops)
-        if success:
-            o_drs = assemble_field_path_provenance(o_drs, path, relation)
-            return o_drs
-        else:
+    def find_path_table_bfs(self, source: str, target: str, relation, max_hops=3, max_column_paths=100):
+        """
+        Join paths between two tables, found with table_join_paths on the table join graph instead of exploring the
+        columns of every table reached
+        :param source: the name of the table where paths start
+        :param target: the name of the table where paths end
+        :param relation: the relation that joins tables
+        :param max_hops: maximum number of joins of a path
+        :param max_column_paths: maximum number of column paths of each table path, as the combinations of the column
+        pairs of its joins grow exponentially with the number of hops. None for all of them
+        :return: DRS with the provenance of the paths found, empty if there is none
+        """
+        join_graph = self.table_join_graph(relation)
+        table_paths = self.table_join_paths(source, target, relation, max_hops=max_hops)
+        if len(table_paths) == 0:
             return DRS([], Operation(OP.NONE))
 
-    def find_path_table(self, source: str, target: str, relation, api, max_hops=3, lean_search=False):
-
-        def assemble_table_path_provenance(o_drs, paths, relation):
-
-            for path in paths:
-                src, src_sibling = path[0]
-                assert (src_sibling is None)  # sibling of source should be None, as source is an origin
-                tgt, tgt_sibling = path[-1]
-                origin = DRS([src], Operation(OP.ORIGIN))
-                o_drs.absorb_provenance(origin)
-                prev_c = src
-                for c, sibling in path[1:-1]:
-                    nxt = DRS([sibling], Operation(OP.PKFK, params=[prev_c]))
-                    o_drs.absorb_provenance(nxt)
-                    if c.nid != sibling.nid:  # avoid loop on head nodes of the graph
-                        linker = DRS([c], Operation(OP.TABLE, params=[sibling]))
-                        o_drs.absorb_provenance(linker)
-                    prev_c = c
-                sink = DRS([tgt_sibling], Operation(OP.PKFK, params=[prev_c]))
-
-                #The join path at the target has None sibling
-                if tgt is not None and tgt_sibling is not None and tgt.nid != tgt_sibling.nid:
-                    o_drs = o_drs.absorb_provenance(sink)
-                    linker = DRS([tgt], Operation(OP.TABLE, params=[tgt_sibling]))
-                    o_drs.absorb(linker)
-                else:
-                    o_drs = o_drs.absorb(sink)
-            return o_drs
-
-        def check_membership(c, paths):
-            for p in paths:
-                for (s, sibling) in p:
-                    if c.source_name == s.source_name:
-                        return True
-            return False
-
-        def append_to_paths(paths, c):
-            new_paths = []
-            for p in paths:
-                new_path = []
-                new_path.extend(p)
-                new_path.append(c)
-                new_paths.append(new_path)
-            return new_paths
-
-        def get_table_neighbors(hit, relation, paths):
-            results = []
-            direct_neighbors = self.neighbors_id(hit, relation)
-
-            # Rewriting results - filtering out results that are in the same table as the input. Rewriting prov
-            direct_neighbors_list = [neigh for neigh in direct_neighbors if neigh.source_name != hit.source_name]
-            op = self.get_op_from_relation(relation)
-            direct_neighbors = DRS(direct_neighbors_list, Operation(op, params=[hit]))
-
-            # FIXME: filter out already seen nodes here
-            for n in direct_neighbors:
-                if not check_membership(n, paths):
-                    if lean_search:
-                        t_neighbors = api._drs_from_table_hit_lean_no_provenance(n)
-                    else:
-                        t_neighbors = api.drs_from_table_hit(n)  # Brought old API
-                    # t_neighbors = api.make_drs(n)  # XXX: this won't take all table neighbors, only the input one
-                    results.extend([(x, n) for x in t_neighbors])
-            return results  # note how we include hit as sibling of x here
-
-        def dfs_explore(sources, targets, max_hops, paths):
-
-            target_nid_set = set([x.nid for x in targets])
-
-            # Check if sources have reached targets
-            for (s, sibling) in sources:
-                if s.nid in target_nid_set:  # faster than using the generic __eq__ of Hit
-                #if s in targets:
-                    # Append successful paths to found_paths
-                    # T1.A join T2.B, and T2.C may join with other tables T3.D
-                    # get_table_neighbors returns next_candidates (s, sibling) (C,B)
-                    # in case T2 is the target add to the path (sibling, sibling)
-                    # Otherwise (C,B)
-                    if s.source_name == targets[0].source_name:
-                        next_paths = append_to_paths(paths, (sibling, sibling))
-                    else:
-                        next_paths = append_to_paths(paths, (s, sibling))
-                    found_paths.extend(next_paths)
-                    return True
-
-            # Check if no more hops are allowed:
-            if max_hops == 0:
-                return False  # not found path
-
-            # Get next set of candidates and keep exploration
-            for (s, sibling) in sources:
-                next_candidates = get_table_neighbors(s, relation, paths)  # updated paths to test membership
-                # recursive on new candidates, one fewer hop and updated paths
-                if len(next_candidates) == 0:
-                    continue
-                next_paths = append_to_paths(paths, (s, sibling))
-                dfs_explore(next_candidates, targets, max_hops - 1, next_paths)
+        # Every table path stands for all the combinations of the column pairs that join its tables
+        found_paths = []
+        for table_path in table_paths:
+            hops = [join_graph[t1][t2] for t1, t2 in zip(table_path, table_path[1:])]
+            for column_pairs in itertools.islice(itertools.product(*hops), max_column_paths):
+                path = [(column_pairs[0][0], None)]
+                for (_, sibling), (c, _) in zip(column_pairs, column_pairs[1:]):
+                    path.append((c, sibling))
+                path.append((column_pairs[-1][1], column_pairs[-1][1]))
+                found_paths.append(path)
 
         o_drs = DRS([], Operation(OP.NONE))  # Carrier of provenance
+        o_drs = assemble_table_path_provenance(o_drs, found_paths, relation)
+        return o_drs
 
-        # TODO: same src == trg, etc
 
-        # src_drs = api.drs_from_table(source)
-        # trg_drs = api.drs_from_table(target)
-        src_drs = api.make_drs(source)
-        trg_drs = api.make_drs(target)
+def build_table_join_graph(network, relation=Relation.PKFK):
+    """
+    Collapses the columns of each table of network into one node: two tables are connected if any of their columns
+    are connected by relation, and the edge keeps all the pairs of columns that connect them
+    :param network: a FieldNetwork
+    :param relation: the relation between columns
+    :return: dict of {table: {neighbor_table: [(column Hit in table, column Hit in neighbor_table)]}}
+    """
+    join_graph = defaultdict(lambda: defaultdict(list))
+    for nid in network.iterate_ids():
+        for hit in network.get_hits_from_info(network.get_info_for([nid])):
+            join_graph[hit.source_name]  # tables without joins are nodes too
+            for neighbor in network.neighbors_id(hit, relation):
+                if neighbor.source_name != hit.source_name:
+                    join_graph[hit.source_name][neighbor.source_name].append((hit, neighbor))
+    return {table: dict(neighbors) for table, neighbors in join_graph.items()}
 
-        found_paths = []
-        candidates = [(x, None) for x in src_drs]  # tuple carrying candidate and same-table attribute
 
-        paths = [[]]  # to carry partial paths
+class CompactFieldNetwork(FieldNetwork):
+    """
+    Same API as FieldNetwork, but instead of a networkx MultiGraph it keeps nodes as integer indices and, per
+    Relation, a symmetric CSR adjacency with int32 neighbor indices and float32 scores. Edges added with
+    add_relation are buffered and merged into the CSR arrays on the next read
+    """
+
+    def __init__(self, nids=None, cardinality=None, relations=None, id_names=None, source_ids=None, nid_idx=None):
+        """
+        :param nids: list of node ids, the index of a node is its position in this list
+        :param cardinality: float32 array with the cardinality of each node, NaN if unknown
+        :param relations: dict of {Relation: (indptr, indices, scores)}
+        :param id_names: dict of nid -> (dbname, sourcename, fieldname, datatype)
+        :param source_ids: dict of sourcename -> [nid]
+        :param nid_idx: mapping of nid -> index, built from nids if not given. If given, nids and cardinality may
+        be read-only sequences (e.g., of a memory-mapped model), they are copied the first time a node is modified
+        """
+        if id_names is None:
+            id_names = dict()
+        if source_ids is None:
+            source_ids = defaultdict(list)
+        # an empty graph so that FieldNetwork keeps these id_names and source_ids, we never add to it
+        super(CompactFieldNetwork, self).__init__(nx.MultiGraph(), id_names, source_ids)
+        if nids is None:
+            nids = []
+        if nid_idx is None:
+            self.__nids = list(nids)
+            self.__nid_idx = {nid: idx for idx, nid in enumerate(self.__nids)}
+            self.__cardinality = [float('nan')] * len(self.__nids) if cardinality is None else list(cardinality)
+        else:
+            self.__nids = nids
+            self.__nid_idx = nid_idx
+            self.__cardinality = cardinality
+        self.__relations = dict() if relations is None else relations
+        self.__pending = defaultdict(list)  # relation -> [(src_idx, tgt_idx, score)] not merged yet
+        self.__removed = set()  # indices of removed nodes, dropped from the arrays on the next read
 
-        dfs_explore(candidates, [x for x in trg_drs], max_hops, paths)
+    def graph_order(self):
+        return len(self._get_underlying_repr_id_to_field_info().keys())
+
+    def _node_index(self, nid):
+        self._apply_removals()
+        idx = self.__nid_idx.get(nid)
+        if idx is None:
+            self._make_writable()
+            idx = len(self.__nids)
+            self.__nids.append(nid)
+            self.__nid_idx[nid] = idx
+            self.__cardinality.append(float('nan'))
+        return idx
+
+    def _make_writable(self):
+        if not isinstance(self.__nids, list):
+            self.__nids = list(self.__nids)
+            self.__nid_idx = {nid: idx for idx, nid in enumerate(self.__nids)}
+            self.__cardinality = [float(card) for card in self.__cardinality]
+
+    def _apply_removals(self):
+        """
+        Drops the removed nodes and their edges from the arrays and renumbers the remaining nodes
+        """
+        if len(self.__removed) == 0:
+            return
+        self._make_writable()
+        num_nodes = len(self.__nids)
+        keep = np.ones(num_nodes, dtype=bool)
+        keep[np.fromiter(self.__removed, dtype=np.int64)] = False
+        self.__removed.clear()
+        new_idx = np.cumsum(keep) - 1
+        num_kept = int(keep.sum())
+        for relation, (indptr, indices, scores) in list(self.__relations.items()):
+            rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+            mask = keep[rows] & keep[indices]
+            new_indptr = np.zeros(num_kept + 1, dtype=np.int64)
+            np.cumsum(np.bincount(new_idx[rows[mask]], minlength=num_kept), out=new_indptr[1:])
+            self.__relations[relation] = (new_indptr, new_idx[indices[mask]].astype(np.int32), scores[mask])
+        for relation, edges in list(self.__pending.items()):
+            self.__pending[relation] = [(int(new_idx[src]), int(new_idx[tgt]), score) for src, tgt, score in edges
+                                        if keep[src] and keep[tgt]]
+        self.__nids = [nid for nid, k in zip(self.__nids, keep) if k]
+        self.__nid_idx = {nid: idx for idx, nid in enumerate(self.__nids)}
+        self.__cardinality = [card for card, k in zip(self.__cardinality, keep) if k]
+
+    def _get_csr(self, relation):
+        """
+        Merges the buffered edges of relation, if any, and returns its (indptr, indices, scores)
+        """
+        self._apply_removals()
+        pending = self.__pending.pop(relation, None)
+        num_nodes = len(self.__nids)
+        if relation in self.__relations:
+            indptr, indices, scores = self.__relations[relation]
+        else:
+            indptr = np.zeros(1, dtype=np.int64)
+            indices = np.empty(0, dtype=np.int32)
+            scores = np.empty(0, dtype=np.float32)
+        if len(indptr) - 1 < num_nodes:  # nodes added since the last merge have no neighbors yet
+            indptr = np.concatenate((indptr, np.repeat(indptr[-1], num_nodes - (len(indptr) - 1))))
+        if pending is not None:
+            rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+            cols = indices.astype(np.int64)
+            new = np.asarray([(s, t) for s, t, _ in pending], dtype=np.int64).reshape(-1, 2)
+            new_scores = np.asarray([score for _, _, score in pending], dtype=np.float32)
+            # the graph is undirected: each new edge is stored in the rows of both endpoints
+            rows = np.concatenate((rows, new.ravel()))
+            cols = np.concatenate((cols, new[:, ::-1].ravel()))
+            all_scores = np.concatenate((scores, np.repeat(new_scores, 2)))
+            # as in the MultiGraph, an edge keeps the position where it was first added and the last score
+            keys = rows * num_nodes + cols
+            _, first = np.unique(keys, return_index=True)
+            _, last_reversed = np.unique(keys[::-1], return_index=True)
+            last = len(keys) - 1 - last_reversed
+            sorting = np.lexsort((first, rows[first]))
+            first = first[sorting]
+            last = last[sorting]
+            indices = cols[first].astype(np.int32)
+            scores = all_scores[last]
+            indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows[first], minlength=num_nodes), out=indptr[1:])
+        self.__relations[relation] = (indptr, indices, scores)
+        return indptr, indices, scores
 
-        # for p in found_paths:
-        #     print(p)
+    def get_cardinality_of(self, node_id):
+        self._apply_removals()
+        card = self.__cardinality[self.__nid_idx[node_id]]
+        if card != card:  # NaN
+            return 0  # no cardinality is like card 0
+        return card
 
-        o_drs = assemble_table_path_provenance(o_drs, found_paths, relation)
+    def _get_underlying_repr_graph(self):
+        """
+        Materializes an equivalent networkx MultiGraph, for code that works on the graph directly
+        """
+        self._apply_removals()
+        G = nx.MultiGraph()
+        for nid, card in zip(self.__nids, self.__cardinality):
+            G.add_node(nid, cardinality=None if card != card else card)
+        for relation in list(self.__relations.keys()) + list(self.__pending.keys()):
+            indptr, indices, scores = self._get_csr(relation)
+            for idx in range(len(indptr) - 1):
+                for j in range(indptr[idx], indptr[idx + 1]):
+                    if indices[j] >= idx:
+                        G.add_edge(self.__nids[idx], self.__nids[indices[j]], relation,
+                                   score={'score': float(scores[j])})
+        return G
+
+    def _get_underlying_repr_arrays(self):
+        """
+        :return: (nids, cardinality, {Relation: (indptr, indices, scores)}) with all buffered edges merged
+        """
+        self._apply_removals()
+        for relation in list(self.__pending.keys()):
+            self._get_csr(relation)
+        for relation in list(self.__relations.keys()):
+            self._get_csr(relation)
+        return self.__nids, np.asarray(self.__cardinality, dtype=np.float32), self.__relations
 
+    def add_field(self, nid, cardinality=None):
+        idx = self._node_index(nid)
+        self._make_writable()
+        self.__cardinality[idx] = float('nan') if cardinality is None else cardinality
+        return nid
+
+    def add_fields(self, list_of_fields):
+        nodes = []
+        for nid, sn, fn in list_of_fields:
+            n = Hit(nid, sn, fn, -1)
+            self._node_index(n)
+            nodes.append(n)
+        return nodes
+
+    def add_relation(self, node_src, node_target, relation, score):
+        src = self._node_index(node_src)
+        tgt = self._node_index(node_target)
+        self.__pending[relation].append((src, tgt, score))
+        self._table_join_graphs.clear()
+
+    def _check_info_writable(self):
+        if not isinstance(self._get_underlying_repr_id_to_field_info(), dict):
+            print("ERROR the fields of a memory-mapped model cannot be modified, load it with the compact backend")
+            raise Exception
+
+    def remove_field(self, nid):
+        self._check_info_writable()
+        super(CompactFieldNetwork, self).remove_field(nid)
+        idx = self.__nid_idx.get(nid)
+        if idx is not None:
+            self.__removed.add(idx)
+
+    def remove_relations(self, relations, nids=None):
+        for relation in relations:
+            if relation not in self.__relations and relation not in self.__pending:
+                continue
+            indptr, indices, scores = self._get_csr(relation)
+            num_nodes = len(indptr) - 1
+            rows = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(indptr))
+            if nids is None:
+                mask = np.zeros(len(indices), dtype=bool)
+            else:
+                removed = np.zeros(num_nodes, dtype=bool)
+                removed[[self.__nid_idx[nid] for nid in nids if nid in self.__nid_idx]] = True
+                mask = ~(removed[rows] | removed[indices])
+            new_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows[mask], minlength=num_nodes), out=new_indptr[1:])
+            self.__relations[relation] = (new_indptr, indices[mask], scores[mask])
+        self._table_join_graphs.clear()
+
+    def fields_degree(self, topk):
+        self._apply_removals()
+        degree = np.zeros(len(self.__nids), dtype=np.int64)
+        for relation in list(self.__relations.keys()) + list(self.__pending.keys()):
+            indptr, indices, _ = self._get_csr(relation)
+            degree += np.diff(indptr)
+            # self loops count twice, as in networkx
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            degree += np.bincount(rows[indices == rows], minlength=len(degree))
+        top = np.argsort(-degree, kind='mergesort')[:topk]
+        return [(self.__nids[idx], int(degree[idx])) for idx in top]
+
+    def enumerate_relation(self, relation, as_str=True):
+        id_names = self._get_underlying_repr_id_to_field_info()
+        indptr, indices, _ = self._get_csr(relation)
+        for nid in self.iterate_ids():
+            db_name, source_name, field_name, data_type = id_names[nid]
+            hit = Hit(nid, db_name, source_name, field_name, 0)
+            idx = self.__nid_idx[nid]
+            row = indices[indptr[idx]:indptr[idx + 1]]
+            if len(row) == 0:
+                continue
+            # a pair is produced once, from the endpoint that is enumerated first
+            neighbors = self.neighbors_id(hit, relation)
+            for n2, n2_idx in zip(neighbors.data, row):
+                if n2_idx >= idx:
+                    if as_str:
+                        string = str(hit) + " - " + str(n2)
+                        yield string
+                    else:
+                        yield hit, n2
+
+    def neighbors_id(self, hit: Hit, relation: Relation) -> DRS:
+        if isinstance(hit, Hit):
+            nid = str(hit.nid)
+        if isinstance(hit, str):
+            nid = hit
+        nid = str(nid)
+        self._apply_removals()
+        idx = self.__nid_idx[nid]
+        id_names = self._get_underlying_repr_id_to_field_info()
+        data = []
+        indptr, indices, scores = self._get_csr(relation)
+        start = indptr[idx]
+        end = indptr[idx + 1]
+        for k_idx, score in zip(indices[start:end].tolist(), scores[start:end].tolist()):
+            k = self.__nids[k_idx]
+            (db_name, source_name, field_name, data_type) = id_names[k]
+            data.append(Hit(k, db_name, source_name, field_name, score))
+        op = self.get_op_from_relation(relation)
+        o_drs = DRS(data, Operation(op, params=[hit]))
         return o_drs
 
 
+def compact_field_network(network):
+    """
+    Builds a CompactFieldNetwork with the same nodes, relations and scores as a networkx-backed FieldNetwork.
+    Neighbors keep the order they have in the MultiGraph
+    """
+    G = network._get_underlying_repr_graph()
+    id_names = network._get_underlying_repr_id_to_field_info()
+    source_ids = network._get_underlying_repr_table_to_ids()
+    nids = list(id_names.keys())
+    known = set(nids)
+    nids.extend([n for n in G.nodes() if n not in known])
+    nid_idx = {nid: idx for idx, nid in enumerate(nids)}
+    cardinality = np.full(len(nids), np.nan, dtype=np.float32)
+    for nid, card in G.nodes(data='cardinality'):
+        if card is not None:
+            cardinality[nid_idx[nid]] = card
+    rows = defaultdict(lambda: [[] for _ in range(len(nids))])
+    for nid in nids:
+        if nid not in G:
+            continue
+        idx = nid_idx[nid]
+        for neighbor, edges in G.adj[nid].items():
+            for relation, data in edges.items():
+                rows[relation][idx].append((nid_idx[neighbor], data['score']['score']))
+    relations = dict()
+    for relation, adjacency in rows.items():
+        indptr = np.zeros(len(nids) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in adjacency], out=indptr[1:])
+        indices = np.fromiter((n for r in adjacency for n, _ in r), dtype=np.int32, count=indptr[-1])
+        scores = np.fromiter((s for r in adjacency for _, s in r), dtype=np.float32, count=indptr[-1])
+        relations[relation] = (indptr, indices, scores)
+    return CompactFieldNetwork(nids, cardinality, relations, id_names, source_ids)
+
+
 def serialize_network_to_csv(network, path):
     nodes = set()
     G = network._get_underlying_repr_graph()
@@ -469,7 +907,47 @@ def serialize_network(network, path):
     nx.write_gpickle(table_to_ids, path + "table_ids.pickle")
 
 
-def deserialize_network(path):
+def serialize_compact_network(network, path):
+    """
+    Serialize the meta schema index in the format of CompactFieldNetwork: the arrays of every relation go to
+    compact_graph.npz, the field info and table ids are pickled as in serialize_network
+    :param network: a FieldNetwork or CompactFieldNetwork
+    :param path:
+    :return:
+    """
+    if not isinstance(network, CompactFieldNetwork):
+        network = compact_field_network(network)
+    nids, cardinality, relations = network._get_underlying_repr_arrays()
+    id_to_field_info = network._get_underlying_repr_id_to_field_info()
+    table_to_ids = network._get_underlying_repr_table_to_ids()
+
+    path = path + '/'  # force separator
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    arrays = {'nids': np.asarray(nids, dtype=str), 'cardinality': cardinality}
+    for relation, (indptr, indices, scores) in relations.items():
+        arrays[relation.name + '_indptr'] = indptr
+        arrays[relation.name + '_indices'] = indices
+        arrays[relation.name + '_scores'] = scores
+    np.savez(path + "compact_graph.npz", **arrays)
+    nx.write_gpickle(id_to_field_info, path + "id_info.pickle")
+    nx.write_gpickle(table_to_ids, path + "table_ids.pickle")
+
+
+def deserialize_network(path, backend="networkx"):
+    """
+    Loads a serialized network
+    :param path:
+    :param backend: "networkx" for a FieldNetwork, "compact" for a CompactFieldNetwork, which is read from
+    compact_graph.npz if it was serialized with serialize_compact_network or converted from graph.pickle otherwise,
+    "mmap" for a CompactFieldNetwork on the memory-mapped binary model (see modelformat)
+    :return:
+    """
+    if backend == "compact":
+        return deserialize_compact_network(path)
+    if backend == "mmap":
+        from knowledgerepr import modelformat  # modelformat builds on this module
+        return modelformat.deserialize_network_mmap(path)
     G = nx.read_gpickle(path + "graph.pickle")
     id_to_info = nx.read_gpickle(path + "id_info.pickle")
     table_to_ids = nx.read_gpickle(path + "table_ids.pickle")
@@ -477,5 +955,22 @@ def deserialize_network(path):
     return network
 
 
+def deserialize_compact_network(path):
+    if not os.path.isfile(path + "compact_graph.npz"):
+        return compact_field_network(deserialize_network(path))
+    id_to_info = nx.read_gpickle(path + "id_info.pickle")
+    table_to_ids = nx.read_gpickle(path + "table_ids.pickle")
+    relations = dict()
+    with np.load(path + "compact_graph.npz") as arrays:
+        nids = arrays['nids'].tolist()
+        cardinality = arrays['cardinality']
+        for relation in Relation:
+            if relation.name + '_indptr' in arrays:
+                relations[relation] = (arrays[relation.name + '_indptr'], arrays[relation.name + '_indices'],
+                                       arrays[relation.name + '_scores'])
+    network = CompactFieldNetwork(nids, cardinality, relations, id_to_info, table_to_ids)
+    return network
+
+
 if __name__ == "__main__":
     print("Field Network")
@@ -0,0 +1,318 @@
+"""
+Binary on-disk format for the similarity indexes of a model, an alternative to the schema_sim_index.pkl and
+content_sim_index.pkl pickles written by networkbuildercoordinator. As in modelformat, all arrays are .npy files
+that are opened with numpy.memmap, so loading the indexes does not read them and the processes of several jobs
+share the pages of the same copy. Nothing in the format depends on the version of nearpy or datasketch.
+
+The indexes live in the 'indexes' directory of the model path:
+- indexes.json: format name and version, and the parameters of each index that was written
+- schema_normals.npy: (num_tables, projection_count, num_features) hyperplanes of each table of the schema_sim index
+- schema_keys.npy, schema_order.npy: (num_tables, num_vectors) packed bucket key of every vector in each table,
+  sorted, and the position of each one in the vectors and ids
+- schema_vectors_data.npy, schema_vectors_indices.npy, schema_vectors_indptr.npy: normalized vectors, CSR
+- schema_ids.bin, schema_ids_offsets.npy: string pool with the id of every vector
+- content_bands.npy: (num_bands, num_signatures, rows_per_band) uint64 band values of the content_sim index, the
+  entries of each band sorted by their values as bytes
+- content_members.npy: (num_bands, num_signatures) position in the ids of every sorted band entry
+- content_ids.bin, content_ids_offsets.npy: string pool with the id of every signature
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import scipy.sparse as sp
+
+from inputoutput import inputoutput as io
+from knowledgerepr.modelformat import StringPool
+from knowledgerepr.modelformat import save_array
+from knowledgerepr.modelformat import save_bytes
+from knowledgerepr.networkbuilder import BatchedLSHRandomProjectionsIndex
+from knowledgerepr.networkbuilder import LSHRandomProjectionsIndex
+from knowledgerepr.networkbuilder import normalize_rows
+
+FORMAT_NAME = "aurum-indexes"
+FORMAT_VERSION = 2  # version 1 has a single schema_sim table, with 2-d normals and 1-d keys and order
+INDEX_DIR = "indexes/"
+
+
+class CompactMinHashLSH:
+    """
+    Read-only MinHashLSH on the band tables of the binary format. query returns the same ids as
+    datasketch.MinHashLSH.query, those of the signatures with all the values of some band equal to the query's
+    """
+
+    def __init__(self, num_perm, num_bands, rows_per_band, bands, members, ids):
+        self.h = num_perm
+        self.b = num_bands
+        self.r = rows_per_band
+        self.bands = bands
+        self.members = members
+        self.ids = ids
+        self.band_dtype = np.dtype((np.void, rows_per_band * 8))
+
+    def query(self, minhash):
+        hashvalues = getattr(minhash, 'hashvalues', minhash)
+        if len(hashvalues) != self.h:
+            print("ERROR expecting minhash with length " + str(self.h) + ", got " + str(len(hashvalues)))
+            raise Exception
+        values = band_values(hashvalues)
+        candidates = set()
+        for band in range(self.b):
+            entries = self.bands[band].view(self.band_dtype).ravel()
+            key = np.ascontiguousarray(values[band * self.r:(band + 1) * self.r]).view(self.band_dtype)[0]
+            start = np.searchsorted(entries, key, side='left')
+            end = np.searchsorted(entries, key, side='right')
+            candidates.update(self.members[band, start:end].tolist())
+        return [self.ids[i] for i in candidates]
+
+    def band_arrays(self):
+        """
+        :return: (num_bands, num_signatures, rows_per_band) band values of every signature, in the order of ids
+        """
+        bands = np.empty(self.bands.shape, dtype=np.uint64)
+        for band in range(self.b):
+            bands[band][self.members[band]] = self.bands[band]
+        return bands
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def band_values(hashvalues):
+    """
+    The values of a signature as uint64, with the same bits as the int64 or uint64 values of the minhash
+    """
+    return np.asarray(hashvalues).astype(np.int64).view(np.uint64)
+
+
+def compact_minhash_lsh(num_perm, ids, bands):
+    """
+    Builds a CompactMinHashLSH in memory
+    :param num_perm: length of the signatures
+    :param ids: list with the id of every signature
+    :param bands: (num_bands, len(ids), rows_per_band) band values of every signature, in the order of ids
+    :return: the CompactMinHashLSH
+    """
+    num_bands, _, rows_per_band = bands.shape
+    band_dtype = np.dtype((np.void, rows_per_band * 8))
+    bands = np.array(bands, dtype=np.uint64)
+    members = np.empty((num_bands, len(ids)), dtype=np.int32)
+    for band in range(num_bands):
+        # sorted as the bytes that CompactMinHashLSH searches
+        members[band] = np.argsort(bands[band].view(band_dtype).ravel(), kind='mergesort')
+        bands[band] = bands[band][members[band]]
+    return CompactMinHashLSH(num_perm, num_bands, rows_per_band, bands, members, list(ids))
+
+
+def _write_strings(strings, path):
+    encoded = [str(string).encode('utf8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    save_bytes(path + ".bin", b''.join(encoded))
+    save_array(path + "_offsets.npy", offsets)
+
+
+def _load_strings(path, load):
+    if os.path.getsize(path + ".bin") > 0:
+        data = np.asarray(np.memmap(path + ".bin", dtype=np.uint8, mode='r'))
+    else:
+        data = np.empty(0, dtype=np.uint8)  # an empty file cannot be mapped
+    return StringPool(data, load(os.path.basename(path) + "_offsets"))
+
+
+def _schema_sim_arrays(schema_sim_index):
+    """
+    :return: (normals, sorted keys, order, CSR vectors, ids, num_neighbours, probe_distance), with a list of normals,
+    keys and order with one array per table, of a BatchedLSHRandomProjectionsIndex, or of a LSHRandomProjectionsIndex
+    whose buckets are turned into the same arrays
+    """
+    if isinstance(schema_sim_index, BatchedLSHRandomProjectionsIndex):
+        return ([lshash.normals for lshash in schema_sim_index.lshashes], schema_sim_index.keys,
+                schema_sim_index.order, schema_sim_index.vectors, schema_sim_index.data,
+                schema_sim_index.num_neighbours, schema_sim_index.rbp.probe_distance)
+    if not isinstance(schema_sim_index, LSHRandomProjectionsIndex):
+        print("ERROR only schema_sim indexes of random binary projections can be written")
+        raise Exception
+
+    def table_entries(hash_name):
+        # (key, vector, id) of every entry of the buckets of a table
+        for key, (block_vectors, count, data) in storage.blocks.get(hash_name, {}).items():
+            for i in range(count):
+                yield key, block_vectors[i], data[i]
+        for key, bucket in storage.buckets.get(hash_name, {}).items():
+            for v, data in bucket:
+                yield int(key, 2), np.asarray(v).ravel(), data
+
+    # The vectors and ids are those of the first table, every table has all of them
+    storage = schema_sim_index.text_engine.storage
+    vectors, ids = [], []
+    all_keys, all_order = [], []
+    position = dict()
+    for table, lshash in enumerate(schema_sim_index.lshashes):
+        entries = list(table_entries(lshash.hash_name))
+        if table == 0:
+            for _, v, data in entries:
+                position[data] = len(ids)
+                vectors.append(v.reshape(1, -1))
+                ids.append(data)
+            keys = np.asarray([key for key, _, _ in entries], dtype=np.uint64)
+        else:
+            keys = np.zeros(len(ids), dtype=np.uint64)
+            for key, _, data in entries:
+                keys[position[data]] = key
+        order = np.argsort(keys, kind='mergesort')
+        all_keys.append(keys[order])
+        all_order.append(order)
+    if len(vectors) > 0:
+        vectors = normalize_rows(sp.csr_matrix(np.vstack(vectors)))
+    else:
+        vectors = sp.csr_matrix((0, schema_sim_index.num_features))
+    num_neighbours = 10  # the NearestFilter of the default Engine
+    return ([lshash.normals for lshash in schema_sim_index.lshashes], all_keys, all_order, vectors, ids,
+            num_neighbours, schema_sim_index.rbp.probe_distance)
+
+
+def _content_sim_arrays(content_sim_index):
+    """
+    :return: (ids, (num_bands, num_signatures, rows_per_band) band values) of a datasketch MinHashLSH, rebuilt from
+    the band keys of each id, which are the big-endian bytes of the band values
+    """
+    ids = list(content_sim_index.keys.keys())
+    bands = np.empty((content_sim_index.b, len(ids), content_sim_index.r), dtype=np.uint64)
+    for i, key in enumerate(ids):
+        for band, H in enumerate(content_sim_index.keys.get(key)):
+            bands[band, i] = np.frombuffer(H, dtype='>u8')
+    return ids, bands
+
+
+def serialize_indexes(schema_sim_index, content_sim_index, path):
+    """
+    Writes the indexes in the binary index format, either of them may be None
+    :param schema_sim_index: a BatchedLSHRandomProjectionsIndex or a LSHRandomProjectionsIndex
+    :param content_sim_index: a datasketch MinHashLSH or a CompactMinHashLSH
+    :param path: the model path, the indexes are written in its 'indexes' directory
+    :return:
+    """
+    path = path + '/' + INDEX_DIR
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION}
+
+    if schema_sim_index is not None:
+        normals, keys, order, vectors, ids, num_neighbours, probe_distance = _schema_sim_arrays(schema_sim_index)
+        vectors = sp.csr_matrix(vectors)
+        save_array(path + "schema_normals.npy", np.stack([np.asarray(n, dtype=np.float64) for n in normals]))
+        save_array(path + "schema_keys.npy", np.stack([np.asarray(k, dtype=np.uint64) for k in keys]))
+        save_array(path + "schema_order.npy", np.stack([np.asarray(o, dtype=np.int64) for o in order]))
+        save_array(path + "schema_vectors_data.npy", np.asarray(vectors.data, dtype=np.float64))
+        save_array(path + "schema_vectors_indices.npy", np.asarray(vectors.indices, dtype=np.int32))
+        save_array(path + "schema_vectors_indptr.npy", np.asarray(vectors.indptr, dtype=np.int64))
+        _write_strings(ids, path + "schema_ids")
+        header["schema_sim"] = {"num_features": int(vectors.shape[1]),
+                                "projection_count": int(np.asarray(normals[0]).shape[0]),
+                                "num_neighbours": int(num_neighbours), "num_tables": len(normals),
+                                "probe_distance": int(probe_distance)}
+
+    if content_sim_index is not None:
+        if not isinstance(content_sim_index, CompactMinHashLSH):
+            ids, bands = _content_sim_arrays(content_sim_index)
+            content_sim_index = compact_minhash_lsh(content_sim_index.h, ids, bands)
+        save_array(path + "content_bands.npy", np.asarray(content_sim_index.bands, dtype=np.uint64))
+        save_array(path + "content_members.npy", np.asarray(content_sim_index.members, dtype=np.int32))
+        _write_strings(content_sim_index.ids, path + "content_ids")
+        header["content_sim"] = {"num_perm": int(content_sim_index.h), "num_bands": int(content_sim_index.b),
+                                 "rows_per_band": int(content_sim_index.r)}
+
+    # The header goes last, indexes without it are incomplete
+    with open(path + "indexes.json", 'w') as f:
+        json.dump(header, f)
+
+
+def has_indexes(path):
+    return os.path.isfile(path + '/' + INDEX_DIR + "indexes.json")
+
+
+def deserialize_indexes(path):
+    """
+    Opens the indexes written by serialize_indexes. Nothing is read until it is used
+    :param path: the model path
+    :return: (BatchedLSHRandomProjectionsIndex or None, CompactMinHashLSH or None)
+    """
+    path = path + '/' + INDEX_DIR
+    with open(path + "indexes.json", 'r') as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME or header.get("version") not in (1, FORMAT_VERSION):
+        print("ERROR unsupported index format: " + str(header.get("format")) + " v" + str(header.get("version")))
+        raise Exception
+
+    def load(name):
+        # a plain ndarray view of the memmap, indexing a memmap subclass is much slower
+        return np.asarray(np.load(path + name + ".npy", mmap_mode='r'))
+
+    schema_sim_index = None
+    if "schema_sim" in header:
+        params = header["schema_sim"]
+        schema_sim_index = BatchedLSHRandomProjectionsIndex(params["num_features"],
+                                                            projection_count=params["projection_count"],
+                                                            num_neighbours=params["num_neighbours"],
+                                                            num_tables=params.get("num_tables", 1),
+                                                            probe_distance=params.get("probe_distance", 0))
+        normals = load("schema_normals")
+        keys = load("schema_keys")
+        order = load("schema_order")
+        if header["version"] == 1:
+            normals, keys, order = normals[None], keys[None], order[None]
+        for table, lshash in enumerate(schema_sim_index.lshashes):
+            lshash.normals = normals[table]
+        schema_sim_index.keys = [keys[table] for table in range(len(keys))]
+        schema_sim_index.order = [order[table] for table in range(len(order))]
+        indptr = load("schema_vectors_indptr")
+        schema_sim_index.vectors = sp.csr_matrix((load("schema_vectors_data"), load("schema_vectors_indices"), indptr),
+                                                 shape=(len(indptr) - 1, params["num_features"]), copy=False)
+        schema_sim_index.data = _load_strings(path + "schema_ids", load)
+
+    content_sim_index = None
+    if "content_sim" in header:
+        params = header["content_sim"]
+        content_sim_index = CompactMinHashLSH(params["num_perm"], params["num_bands"], params["rows_per_band"],
+                                              load("content_bands"), load("content_members"),
+                                              _load_strings(path + "content_ids", load))
+    return schema_sim_index, content_sim_index
+
+
+def load_indexes(path):
+    """
+    The indexes of a model, from the binary format if the model has it, from its pickles otherwise
+    :param path: the model path
+    :return: (schema_sim_index, content_sim_index)
+    """
+    if has_indexes(path):
+        return deserialize_indexes(path)
+    schema_sim_index = io.deserialize_object(path + '/schema_sim_index.pkl')
+    content_sim_index = io.deserialize_object(path + '/content_sim_index.pkl')
+    return schema_sim_index, content_sim_index
+
+
+def convert_pickled_indexes(path):
+    """
+    Writes the binary indexes of a model whose indexes are pickled, next to its pickles
+    :param path: the model path
+    :return:
+    """
+    schema_sim_index = io.deserialize_object(path + 'schema_sim_index.pkl')
+    content_sim_index = io.deserialize_object(path + 'content_sim_index.pkl')
+    serialize_indexes(schema_sim_index, content_sim_index, path)
+
+
+if __name__ == "__main__":
+    print("Index format converter")
+
+    if len(sys.argv) != 2:
+        print("USAGE: python indexformat.py <path_to_serialized_model>")
+        exit()
+
+    model_path = sys.argv[1]
+    if not model_path.endswith('/'):
+        model_path = model_path + '/'
+    convert_pickled_indexes(model_path)
+    print("Binary indexes written in: " + model_path + INDEX_DIR)
@@ -0,0 +1,331 @@
+"""
+Binary on-disk format for the network model, an alternative to the graph.pickle, id_info.pickle and
+table_ids.pickle files written by fieldnetwork.serialize_network. All arrays are .npy files that are opened with
+numpy.memmap, so loading a model does not read it and worker processes share the pages of the same model.
+
+A model lives in the 'mmap' directory of the model path:
+- model.json: format name and version, number of nodes and relations
+- strings.bin, strings_offsets.npy: string pool, string i is strings.bin[offsets[i]:offsets[i+1]] in utf8
+- nodes_*.npy: columnar node table, one row per node. nid, db, source, field and type are indexes in the string
+  pool (-1 for nodes without field info) and cardinality is a float32 (NaN if unknown)
+- nids_sorted.npy, nids_sorted_node.npy: nids sorted as bytes and their node, to find a node by binary search
+- tables_sorted.npy, tables_indptr.npy, tables_nodes.npy: table names sorted as bytes and the nodes of each one
+- <RELATION>_indptr.npy, <RELATION>_indices.npy, <RELATION>_scores.npy: symmetric CSR adjacency of each relation
+"""
+import json
+import os
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr.fieldnetwork import CompactFieldNetwork
+
+FORMAT_NAME = "aurum-model"
+FORMAT_VERSION = 1
+MODEL_DIR = "mmap/"
+
+
+class StringPool(Sequence):
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf8')
+
+
+class NodeColumn(Sequence):
+    """
+    Strings of a column of the node table, resolved through the string pool
+    """
+
+    def __init__(self, pool, column):
+        self.pool = pool
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, idx):
+        return self.pool[self.column[idx]]
+
+
+class NidIndex(Mapping):
+    """
+    nid -> node index, by binary search on the sorted nids
+    """
+
+    def __init__(self, nids_sorted, nids_sorted_node):
+        self.nids_sorted = nids_sorted
+        self.nids_sorted_node = nids_sorted_node
+
+    def get(self, nid, default=None):
+        key = str(nid).encode('utf8')
+        pos = np.searchsorted(self.nids_sorted, key)
+        if pos < len(self.nids_sorted) and self.nids_sorted[pos] == key:
+            return int(self.nids_sorted_node[pos])
+        return default
+
+    def __getitem__(self, nid):
+        idx = self.get(nid)
+        if idx is None:
+            raise KeyError(nid)
+        return idx
+
+    def __contains__(self, nid):
+        return self.get(nid) is not None
+
+    def __iter__(self):
+        for key in self.nids_sorted:
+            yield key.decode('utf8')
+
+    def __len__(self):
+        return len(self.nids_sorted)
+
+
+class IdInfo(Mapping):
+    """
+    nid -> (dbname, sourcename, fieldname, datatype), iterated in node order as the dict it replaces
+    """
+
+    def __init__(self, pool, nodes, nid_index):
+        self.pool = pool
+        self.nodes = nodes
+        self.nid_index = nid_index
+        self.with_info = np.flatnonzero(np.asarray(nodes['db']) >= 0)
+
+    def info_at(self, idx):
+        return (self.pool[self.nodes['db'][idx]], self.pool[self.nodes['source'][idx]],
+                self.pool[self.nodes['field'][idx]], self.pool[self.nodes['type'][idx]])
+
+    def __getitem__(self, nid):
+        idx = self.nid_index.get(nid)
+        if idx is None or self.nodes['db'][idx] < 0:
+            raise KeyError(nid)
+        return self.info_at(idx)
+
+    def __contains__(self, nid):
+        idx = self.nid_index.get(nid)
+        return idx is not None and self.nodes['db'][idx] >= 0
+
+    def __iter__(self):
+        for idx in self.with_info:
+            yield self.pool[self.nodes['nid'][idx]]
+
+    def items(self):
+        for idx in self.with_info:
+            yield self.pool[self.nodes['nid'][idx]], self.info_at(idx)
+
+    def __len__(self):
+        return len(self.with_info)
+
+
+class TableIds(Mapping):
+    """
+    sourcename -> [nid], an unknown table has no nids as in the defaultdict it replaces
+    """
+
+    def __init__(self, pool, nodes, tables_sorted, tables_indptr, tables_nodes):
+        self.pool = pool
+        self.nodes = nodes
+        self.tables_sorted = tables_sorted
+        self.tables_indptr = tables_indptr
+        self.tables_nodes = tables_nodes
+
+    def _position(self, table):
+        key = table.encode('utf8')
+        pos = np.searchsorted(self.tables_sorted, key)
+        if pos < len(self.tables_sorted) and self.tables_sorted[pos] == key:
+            return pos
+        return None
+
+    def __getitem__(self, table):
+        pos = self._position(table)
+        if pos is None:
+            return []
+        members = self.tables_nodes[self.tables_indptr[pos]:self.tables_indptr[pos + 1]]
+        return [self.pool[self.nodes['nid'][idx]] for idx in members]
+
+    def __contains__(self, table):
+        return self._position(table) is not None
+
+    def __iter__(self):
+        for key in self.tables_sorted:
+            yield key.decode('utf8')
+
+    def __len__(self):
+        return len(self.tables_sorted)
+
+
+def save_array(path, array):
+    """
+    Writes array in the .npy file path through a temporary file that then replaces it, so that the processes that
+    have the previous file memory-mapped keep reading the previous one
+    """
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def save_bytes(path, data):
+    """
+    Writes data in the file path through a temporary file that then replaces it, as save_array
+    """
+    with open(path + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def serialize_network_mmap(network, path):
+    """
+    Writes network in the binary model format
+    :param network: a FieldNetwork or CompactFieldNetwork
+    :param path: the model path, the model is written in its 'mmap' directory
+    :return:
+    """
+    if not isinstance(network, CompactFieldNetwork):
+        network = fieldnetwork.compact_field_network(network)
+    nids, cardinality, relations = network._get_underlying_repr_arrays()
+    id_to_field_info = network._get_underlying_repr_id_to_field_info()
+    table_to_ids = network._get_underlying_repr_table_to_ids()
+
+    path = path + '/' + MODEL_DIR
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # String pool
+    string_ids = dict()
+
+    def string_id(string):
+        sid = string_ids.get(string)
+        if sid is None:
+            sid = len(string_ids)
+            string_ids[string] = sid
+        return sid
+
+    num_nodes = len(nids)
+    columns = {name: np.full(num_nodes, -1, dtype=np.int32) for name in ['nid', 'db', 'source', 'field', 'type']}
+    nid_idx = dict()
+    for idx, nid in enumerate(nids):
+        nid_idx[nid] = idx
+        columns['nid'][idx] = string_id(nid)
+        if nid in id_to_field_info:
+            db_name, source_name, field_name, data_type = id_to_field_info[nid]
+            columns['db'][idx] = string_id(db_name)
+            columns['source'][idx] = string_id(source_name)
+            columns['field'][idx] = string_id(field_name)
+            columns['type'][idx] = string_id(data_type)
+    encoded = [string.encode('utf8') for string in string_ids.keys()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    save_bytes(path + "strings.bin", b''.join(encoded))
+    save_array(path + "strings_offsets.npy", offsets)
+
+    # Node table and nid lookup
+    for name, column in columns.items():
+        save_array(path + "nodes_" + name + ".npy", column)
+    save_array(path + "nodes_cardinality.npy", np.asarray(cardinality, dtype=np.float32))
+    nid_keys = np.asarray([str(nid).encode('utf8') for nid in nids], dtype=bytes)
+    nid_order = np.argsort(nid_keys, kind='mergesort')
+    save_array(path + "nids_sorted.npy", nid_keys[nid_order])
+    save_array(path + "nids_sorted_node.npy", nid_order.astype(np.int32))
+
+    # Tables, each with its nids in the same order they are listed in table_to_ids
+    tables = sorted(table_to_ids.keys(), key=lambda t: t.encode('utf8'))
+    tables_nodes = [nid_idx[nid] for table in tables for nid in table_to_ids[table]]
+    tables_indptr = np.zeros(len(tables) + 1, dtype=np.int64)
+    np.cumsum([len(table_to_ids[table]) for table in tables], out=tables_indptr[1:])
+    save_array(path + "tables_sorted.npy", np.asarray([t.encode('utf8') for t in tables], dtype=bytes))
+    save_array(path + "tables_indptr.npy", tables_indptr)
+    save_array(path + "tables_nodes.npy", np.asarray(tables_nodes, dtype=np.int32))
+
+    # Relations
+    for relation, (indptr, indices, scores) in relations.items():
+        save_array(path + relation.name + "_indptr.npy", np.asarray(indptr, dtype=np.int64))
+        save_array(path + relation.name + "_indices.npy", np.asarray(indices, dtype=np.int32))
+        save_array(path + relation.name + "_scores.npy", np.asarray(scores, dtype=np.float32))
+
+    # The header goes last, a model without it is incomplete
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "num_nodes": num_nodes,
+              "relations": [relation.name for relation in relations.keys()]}
+    with open(path + "model.json", 'w') as f:
+        json.dump(header, f)
+
+
+def has_mmap_model(path):
+    return os.path.isfile(path + '/' + MODEL_DIR + "model.json")
+
+
+def model_backend(path):
+    """
+    The deserialize_network backend to load the model at path with
+    :param path: the model path
+    :return: "mmap" if the model was written with serialize_network_mmap, "networkx" otherwise
+    """
+    if has_mmap_model(path):
+        return "mmap"
+    return "networkx"
+
+
+def deserialize_network_mmap(path):
+    """
+    Opens a model written by serialize_network_mmap. Nothing is read until it is used
+    :param path: the model path
+    :return: a CompactFieldNetwork backed by the memory-mapped arrays
+    """
+    path = path + '/' + MODEL_DIR
+    with open(path + "model.json", 'r') as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME or header.get("version") != FORMAT_VERSION:
+        print("ERROR unsupported model format: " + str(header.get("format")) + " v" + str(header.get("version")))
+        raise Exception
+
+    def load(name):
+        # a plain ndarray view of the memmap, indexing a memmap subclass is much slower
+        return np.asarray(np.load(path + name + ".npy", mmap_mode='r'))
+
+    if os.path.getsize(path + "strings.bin") > 0:
+        data = np.asarray(np.memmap(path + "strings.bin", dtype=np.uint8, mode='r'))
+    else:
+        data = np.empty(0, dtype=np.uint8)  # an empty file cannot be mapped
+    pool = StringPool(data, load("strings_offsets"))
+    nodes = {name: load("nodes_" + name) for name in ['nid', 'db', 'source', 'field', 'type']}
+    nid_index = NidIndex(load("nids_sorted"), load("nids_sorted_node"))
+    id_info = IdInfo(pool, nodes, nid_index)
+    table_ids = TableIds(pool, nodes, load("tables_sorted"), load("tables_indptr"), load("tables_nodes"))
+    relations = dict()
+    for name in header["relations"]:
+        relations[Relation[name]] = (load(name + "_indptr"), load(name + "_indices"), load(name + "_scores"))
+    network = CompactFieldNetwork(NodeColumn(pool, nodes['nid']), load("nodes_cardinality"), relations,
+                                  id_info, table_ids, nid_idx=nid_index)
+    return network
+
+
+def convert_pickled_model(path):
+    """
+    Writes the binary model of a model serialized with fieldnetwork.serialize_network, next to its pickles
+    :param path: the model path
+    :return:
+    """
+    network = fieldnetwork.deserialize_network(path)
+    serialize_network_mmap(network, path)
+
+
+if __name__ == "__main__":
+    print("Model format converter")
+
+    if len(sys.argv) != 2:
+        print("USAGE: python modelformat.py <path_to_serialized_model>")
+        exit()
+
+    model_path = sys.argv[1]
+    if not model_path.endswith('/'):
+        model_path = model_path + '/'
+    convert_pickled_model(model_path)
+    print("Binary model written in: " + model_path + MODEL_DIR)
@@ -1,4 +1,6 @@
+import itertools
 import time
+import multiprocessing
 
 from dataanalysis import dataanalysis as da
 from math import isinf
@@ -14,6 +16,7 @@ from datasketch import MinHash, MinHashLSH
 
 from sklearn.cluster import DBSCAN
 import numpy as np
+import scipy.sparse as sp
 
 from collections import defaultdict
 
@@ -76,12 +79,21 @@ def lsa_dimensionality_reduction(tfidf):
 
 class LSHRandomProjectionsIndex:
 
-    def __init__(self, num_features, projection_count=30):
+    def __init__(self, num_features, projection_count=30, num_tables=1, probe_distance=0):
+        """
+        :param projection_count: number of random hyperplanes of each table, i.e., bits of the bucket keys
+        :param num_tables: number of independent hash tables, the candidates of a query are those of all tables
+        :param probe_distance: the buckets whose keys differ in up to this many bits from the key of a query are
+        also probed
+        """
         self.num_features = num_features
         #self.rbp = RandomDiscretizedProjections('default', projection_count, bin_width=100)
-        self.rbp = RandomBinaryProjections('default', projection_count)
+        self.rbp = RandomBinaryProjections('default', projection_count, probe_distance=probe_distance)
         #self.rbp = RandomBinaryProjectionTree('default', projection_count, 1)
-        self.text_engine = Engine(num_features, lshashes=[self.rbp], distance=CosineDistance())
+        self.lshashes = [self.rbp] + [RandomBinaryProjections('default_' + str(i), projection_count,
+                                                              probe_distance=probe_distance)
+                                      for i in range(1, num_tables)]
+        self.text_engine = Engine(num_features, lshashes=self.lshashes, distance=CosineDistance())
 
     def index(self, vector, key):
         if len(vector) != self.num_features:
@@ -93,6 +105,268 @@ class LSHRandomProjectionsIndex:
         res = self.text_engine.neighbours(vector)
         return res
 
+    def bulk_index(self, matrix, keys):
+        """
+        Indexes all rows of matrix at once, row i with keys[i]
+        """
+        if matrix.shape[1] != self.num_features:
+            print("ERROR received matrix.dim: " + str(matrix.shape[1]) + " on engine.dim: " + str(self.num_features))
+            raise Exception
+        self.text_engine.store_vectors(matrix, keys)
+
+    def query_batch(self, matrix):
+        """
+        Returns the result of query for every row of matrix
+        """
+        return self.text_engine.neighbours_batch(matrix)
+
+    def memory_size(self):
+        """
+        Bytes allocated for the vectors stored in the buckets of all tables
+        """
+        size = 0
+        for blocks in self.text_engine.storage.blocks.values():
+            for vectors, _, _ in blocks.values():
+                size += vectors.nbytes
+        for buckets in self.text_engine.storage.buckets.values():
+            for bucket in buckets.values():
+                size += sum(v.nbytes for v, _ in bucket if hasattr(v, 'nbytes'))
+        return size
+
+
+def hash_rows_binary_projections(matrix, normals, batch_size=100000):
+    """
+    Hashes every row of matrix with the random hyperplanes in normals, as RandomBinaryProjections does for one
+    vector, but with one (sparse x dense) product per batch of rows. The bits of each row are packed into an
+    integer key whose binary representation is the bucket key string used by nearpy
+    :param matrix: sparse or dense matrix with one vector per row
+    :param normals: (projection_count, num_features) matrix with the normals of the hyperplanes
+    :param batch_size: number of rows projected at once, bounds the size of the dense projection
+    :return: uint64 array with the bucket key of every row
+    """
+    projection_count = normals.shape[0]
+    if projection_count > 64:
+        print("ERROR cannot pack " + str(projection_count) + " projections in a uint64 key")
+        raise Exception
+    weights = np.left_shift(np.uint64(1), np.arange(projection_count - 1, -1, -1, dtype=np.uint64))
+    num_rows = matrix.shape[0]
+    keys = np.empty(num_rows, dtype=np.uint64)
+    for start in range(0, num_rows, batch_size):
+        end = min(start + batch_size, num_rows)
+        projection = np.asarray(matrix[start:end].dot(normals.T))
+        bits = (projection > 0.0).astype(np.uint64)
+        keys[start:end] = (bits * weights).sum(axis=1, dtype=np.uint64)
+    return keys
+
+
+def normalize_rows(matrix):
+    """
+    Scales every row of a sparse matrix to unit length, zero rows are kept as they are
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+class BatchedLSHRandomProjectionsIndex:
+    """
+    Same buckets and query results as LSHRandomProjectionsIndex, but it keeps the normalized sparse vectors once and
+    one integer key per vector and table, sorted, instead of one dense vector per entry in a dict of buckets of each
+    table
+    """
+
+    def __init__(self, num_features, projection_count=30, num_neighbours=10, num_tables=1, probe_distance=0):
+        """
+        :param projection_count: number of random hyperplanes of each table, i.e., bits of the bucket keys
+        :param num_tables: number of independent hash tables, the candidates of a query are those of all tables
+        :param probe_distance: the buckets whose keys differ in up to this many bits from the key of a query are
+        also probed
+        """
+        self.num_features = num_features
+        self.rbp = RandomBinaryProjections('default', projection_count, probe_distance=probe_distance)
+        self.lshashes = [self.rbp] + [RandomBinaryProjections('default_' + str(i), projection_count,
+                                                              probe_distance=probe_distance)
+                                      for i in range(1, num_tables)]
+        for lshash in self.lshashes:
+            lshash.reset(num_features)
+        self.num_neighbours = num_neighbours
+        # bucket key of each vector, sorted, and position of each sorted key in vectors and data, of each table
+        self.keys = [np.empty(0, dtype=np.uint64) for _ in self.lshashes]
+        self.order = [np.empty(0, dtype=np.int64) for _ in self.lshashes]
+        self.vectors = None
+        self.data = []
+
+    def probe_masks(self):
+        """
+        :return: the masks that give the keys of the buckets probed by a query, xor its key, 0 the first
+        """
+        masks = self.rbp.probe_masks()
+        if masks is None:
+            return np.zeros(1, dtype=np.uint64)
+        return masks
+
+    def bulk_index(self, matrix, data):
+        """
+        Indexes all rows of matrix at once, row i is stored with data[i]
+        """
+        if matrix.shape[1] != self.num_features:
+            print("ERROR received matrix.dim: " + str(matrix.shape[1]) + " on engine.dim: " + str(self.num_features))
+            raise Exception
+        self.vectors = normalize_rows(sp.csr_matrix(matrix))
+        self.data = list(data)
+        for table, lshash in enumerate(self.lshashes):
+            keys = hash_rows_binary_projections(self.vectors, lshash.normals)
+            # stable, members of a bucket stay in insertion order
+            self.order[table] = np.argsort(keys, kind='mergesort')
+            self.keys[table] = keys[self.order[table]]
+
+    def buckets(self, min_size=1):
+        """
+        Yields the positions, in insertion order, of the vectors of each bucket of the first table with at least
+        min_size members
+        """
+        keys = self.keys[0]
+        if len(keys) == 0:
+            return
+        boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(keys)]))
+        sizes = ends - starts
+        for start, end in zip(starts[sizes >= min_size], ends[sizes >= min_size]):
+            yield self.order[0][start:end]
+
+    def candidates(self, vector_keys):
+        """
+        :param vector_keys: bucket key of a vector in each table
+        :return: positions, in insertion order, of the vectors in the buckets it probes in all tables
+        """
+        found = []
+        for table, key in enumerate(vector_keys):
+            for probe_key in np.uint64(key) ^ self.probe_masks():
+                start = np.searchsorted(self.keys[table], probe_key, side='left')
+                end = np.searchsorted(self.keys[table], probe_key, side='right')
+                found.append(self.order[table][start:end])
+        return np.unique(np.concatenate(found))
+
+    def groups(self, min_size=1):
+        """
+        Yields (members, candidates) for the vectors with the same key in every table, which share their candidates:
+        the positions, in insertion order, of the members and of their candidates, for the groups with at least
+        min_size candidates. With a single table and no probes the groups are the buckets
+        """
+        if len(self.lshashes) == 1 and self.rbp.probe_masks() is None:
+            for members in self.buckets(min_size=min_size):
+                yield members, members
+            return
+        if self.vectors is None or self.vectors.shape[0] == 0:
+            return
+        vector_keys = np.empty((self.vectors.shape[0], len(self.lshashes)), dtype=np.uint64)
+        for table in range(len(self.lshashes)):
+            vector_keys[self.order[table], table] = self.keys[table]
+        _, inverse = np.unique(vector_keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        by_group = np.argsort(inverse, kind='mergesort')
+        boundaries = np.flatnonzero(np.diff(inverse[by_group])) + 1
+        for members in np.split(by_group, boundaries):
+            candidates = self.candidates(vector_keys[members[0]])
+            if len(candidates) >= min_size:
+                yield members, candidates
+
+    def nearest_in_bucket(self, members, candidates=None, block_cells=4000000):
+        """
+        Computes the num_neighbours nearest candidates of each member of a bucket with blocks of sparse products
+        :param members: positions of the bucket members, in insertion order
+        :param candidates: positions of their candidates, in insertion order, the members if None
+        :param block_cells: maximum number of similarity scores materialized at once
+        :return: generator of (member, [(candidate, distance)]) sorted by distance as the NearestFilter does
+        """
+        if candidates is None:
+            candidates = members
+        member_vectors = self.vectors[members]
+        candidate_vectors = self.vectors[candidates]
+        num_members = len(members)
+        rows_per_block = max(1, int(block_cells / len(candidates)))
+        for start in range(0, num_members, rows_per_block):
+            block = member_vectors[start:start + rows_per_block]
+            distances = 1.0 - block.dot(candidate_vectors.T).toarray()
+            nearest = np.argsort(distances, axis=1, kind='mergesort')[:, :self.num_neighbours]
+            for row in range(block.shape[0]):
+                yield members[start + row], [(candidates[col], distances[row, col]) for col in nearest[row]]
+
+    def query(self, vector):
+        """
+        Returns the (vector, data, distance) nearest neighbours of vector in the buckets it probes, like
+        Engine.neighbours
+        """
+        vector = sp.csr_matrix(vector)
+        vector_keys = [hash_rows_binary_projections(vector, lshash.normals)[0] for lshash in self.lshashes]
+        members = self.candidates(vector_keys)
+        if len(members) == 0:
+            return []
+        bucket_vectors = self.vectors[members]
+        distances = 1.0 - bucket_vectors.dot(normalize_rows(vector).T).toarray().ravel()
+        nearest = np.argsort(distances, kind='mergesort')[:self.num_neighbours]
+        return [(bucket_vectors[i].toarray()[0], self.data[members[i]], distances[i]) for i in nearest]
+
+    def memory_size(self):
+        """
+        Bytes of the vectors, stored once, and of the keys and positions of all tables
+        """
+        size = sum(keys.nbytes for keys in self.keys) + sum(order.nbytes for order in self.order)
+        if self.vectors is not None:
+            size += self.vectors.data.nbytes + self.vectors.indices.nbytes + self.vectors.indptr.nbytes
+        return size
+
+
+def build_schema_sim_relation_batched(network, projection_count=30, num_tables=1, probe_distance=0):
+    """
+    Builds the same SCHEMA_SIM relation as build_schema_sim_relation. Instead of densifying and indexing every
+    TF-IDF row one at a time it hashes the whole sparse matrix at once, groups rows by bucket key and computes the
+    cosine distances of each bucket with blocks of sparse products, so memory is bounded by the largest block
+    :param network: the FieldNetwork where to add the relations
+    :param projection_count: number of random hyperplanes, i.e., bits of the bucket keys
+    :param num_tables: number of hash tables, as in LSHRandomProjectionsIndex
+    :param probe_distance: bits in which the probed buckets may differ, as in LSHRandomProjectionsIndex
+    :return: the BatchedLSHRandomProjectionsIndex with all column names
+    """
+
+    def connect(nid1, nid2, score):
+        network.add_relation(nid1, nid2, Relation.SCHEMA_SIM, score)
+
+    st = time.time()
+    docs = []
+    for (_, _, field_name, _) in network.iterate_values():
+        docs.append(field_name)
+
+    tfidf = da.get_tfidf_docs(docs)
+    et = time.time()
+    print("Create docs and TF-IDF: {0}".format(str(et - st)))
+
+    nids = [nid for nid in network.iterate_ids()]
+    num_features = tfidf.shape[1]
+    new_index_engine = BatchedLSHRandomProjectionsIndex(num_features, projection_count=projection_count,
+                                                        num_tables=num_tables, probe_distance=probe_distance)
+
+    # Index all vectors at once
+    st = time.time()
+    new_index_engine.bulk_index(tfidf, nids)
+    et = time.time()
+    print("Total index text: " + str((et - st)))
+
+    # Create schema_sim links, vectors without other candidates do not produce any
+    st = time.time()
+    for members, candidates in new_index_engine.groups(min_size=2):
+        for member, neighbours in new_index_engine.nearest_in_bucket(members, candidates):
+            nid = nids[member]
+            for n_member, distance in neighbours:
+                key = nids[n_member]
+                if nid != key:
+                    connect(nid, key, distance)
+    et = time.time()
+    print("Create graph schema: {0}".format(str(et - st)))
+
+    return new_index_engine
+
 
 def build_schema_sim_relation(network):
 
@@ -254,6 +528,118 @@ def build_content_sim_mh_text(network, mh_signatures):
     return content_index
 
 
+def _lsh_band_candidates(task):
+    """
+    Runs the candidate generation of MinHashLSH for a range of bands: two signatures are candidates if all the
+    values of at least one of the bands are equal
+    :param task: (band_signatures, rows_per_band) where band_signatures is the slice of the signatures matrix
+    with the values of the bands of this range only
+    :return: sorted array with the candidate pairs (i, j), i < j, encoded as i * num_signatures + j
+    """
+    band_signatures, rows_per_band = task
+    num_signatures = band_signatures.shape[0]
+    pairs = []
+    for start in range(0, band_signatures.shape[1], rows_per_band):
+        band = np.ascontiguousarray(band_signatures[:, start:start + rows_per_band])
+        band = band.view(np.dtype((np.void, band.dtype.itemsize * band.shape[1]))).ravel()
+        _, bucket, bucket_size = np.unique(band, return_inverse=True, return_counts=True)
+        bucket = bucket.ravel()
+        # only signatures that share their bucket with some other one produce pairs
+        shared = np.flatnonzero(bucket_size[bucket] > 1)
+        if len(shared) == 0:
+            continue
+        members = shared[np.argsort(bucket[shared], kind='mergesort')]
+        boundaries = np.flatnonzero(np.diff(bucket[members])) + 1
+        for group in np.split(members, boundaries):
+            left, right = np.triu_indices(len(group), 1)
+            pairs.append(group[left].astype(np.int64) * num_signatures + group[right])
+    if len(pairs) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(pairs))
+
+
+def build_content_sim_mh_text_parallel(network, mh_signatures, threshold=0.7, num_perm=512, num_workers=None,
+                                       build_index=True):
+    """
+    Builds the same CONTENT_SIM relation as build_content_sim_mh_text, but instead of querying the LSH index once
+    per column it splits the bands of the index among a pool of processes. Each one finds the pairs of columns
+    that share a bucket in its bands, and the pairs of all of them are merged and deduplicated before adding them
+    to the network
+    :param network: the FieldNetwork where to add the relations
+    :param mh_signatures: iterable of (nid, minhash signature)
+    :param threshold: Jaccard similarity threshold used to choose the bands of the LSH index
+    :param num_perm: number of permutations (values of the signatures) to use
+    :param num_workers: number of processes, by default as many as cores
+    :param build_index: whether to also build and return the MinHashLSH index with all signatures
+    :return: the MinHashLSH index if build_index is True, None otherwise
+    """
+
+    nids = []
+    signatures = []
+    for nid, mh_sig in mh_signatures:
+        nids.append(nid)
+        signatures.append(mh_sig[:num_perm])
+    if len(nids) > 0:
+        signatures = np.asarray(signatures, dtype=int)
+    return build_content_sim_mh_text_matrix(network, nids, signatures, threshold=threshold, num_perm=num_perm,
+                                            num_workers=num_workers, build_index=build_index)
+
+
+def build_content_sim_mh_text_matrix(network, nids, signatures, threshold=0.7, num_perm=512, num_workers=None,
+                                     build_index=True):
+    """
+    Band-sharded builder on signatures that are already in a matrix, e.g., the batches of
+    StoreHandler.stream_mh_text_signatures concatenated
+    :param network: the FieldNetwork where to add the relations
+    :param nids: list of nids
+    :param signatures: (len(nids), >= num_perm) integer matrix with the minhash of each column
+    :return: the MinHashLSH index if build_index is True, None otherwise
+    """
+
+    def connect(nid1, nid2, score):
+        network.add_relation(nid1, nid2, Relation.CONTENT_SIM, score)
+
+    content_index = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    if len(nids) == 0:
+        return content_index if build_index else None
+    signatures = signatures[:, :num_perm]
+    num_bands, rows_per_band = content_index.b, content_index.r
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(1, min(num_workers, num_bands))
+
+    # Contiguous band ranges, one per worker
+    st = time.time()
+    bands_per_worker = int(np.ceil(num_bands / num_workers))
+    tasks = []
+    for first_band in range(0, num_bands, bands_per_worker):
+        last_band = min(first_band + bands_per_worker, num_bands)
+        band_signatures = signatures[:, first_band * rows_per_band:last_band * rows_per_band]
+        tasks.append((band_signatures, rows_per_band))
+    if num_workers == 1:
+        candidates = [_lsh_band_candidates(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes=num_workers) as pool:
+            candidates = pool.map(_lsh_band_candidates, tasks)
+    candidates = np.unique(np.concatenate(candidates))
+    et = time.time()
+    print("Time to find minhash candidates with {0} workers: {1}".format(str(num_workers), str(et - st)))
+
+    num_signatures = len(nids)
+    for left, right in zip((candidates // num_signatures).tolist(), (candidates % num_signatures).tolist()):
+        connect(nids[left], nids[right], 1)
+
+    if not build_index:
+        return None
+    with content_index.insertion_session() as session:
+        for nid, mh_sig in zip(nids, signatures):
+            mh_obj = MinHash(num_perm=num_perm)
+            mh_obj.hashvalues = mh_sig
+            session.insert(nid, mh_obj)
+    return content_index
+
+
 def build_content_sim_relation_num_overlap_distr_indexed(network, id_sig):
 
     def compute_overlap(value1, value2):
@@ -521,6 +907,225 @@ def build_content_sim_relation_num_overlap_distr(network, id_sig):
                     connect(nid1, nid2, overlap)
 
 
+def _overlapping_interval_pairs(left, right, ref_idx, cand_idx, threshold, pair_budget=2000000):
+    """
+    Finds (ref, candidate) pairs whose overlap, as defined by compute_overlap in
+    build_content_sim_relation_num_overlap_distr, may reach threshold. An overlap of at least
+    threshold * ref_domain requires that either the candidate starts inside
+    [ref_left, ref_right - threshold * ref_domain] or that it starts before ref_left and ends inside
+    [ref_left + threshold * ref_domain, ref_right], so both cases become range lookups on sorted endpoints
+    :param left: array with the left end (median - iqr) of every interval
+    :param right: array with the right end (median + iqr) of every interval
+    :param ref_idx: indexes of the intervals that act as reference
+    :param cand_idx: indexes of the intervals that act as candidates
+    :param threshold: minimum overlap ratio that a pair must be able to reach
+    :param pair_budget: maximum number of candidate pairs materialized at once
+    :return: generator of (ref, candidate) index arrays, one per chunk of references
+    """
+    by_left = cand_idx[np.argsort(left[cand_idx], kind='mergesort')]
+    by_right = cand_idx[np.argsort(right[cand_idx], kind='mergesort')]
+    sorted_left = left[by_left]
+    sorted_right = right[by_right]
+
+    r_left = left[ref_idx]
+    r_right = right[ref_idx]
+    # slightly widened so that rounding never drops a pair, the caller checks the exact overlap anyway
+    slack = threshold * (r_right - r_left) * (1 - 1e-9)
+
+    # Candidates starting inside the reference
+    lo_a = np.searchsorted(sorted_left, r_left, side='left')
+    hi_a = np.searchsorted(sorted_left, r_right - slack, side='right')
+    # Candidates starting before the reference and ending inside it
+    lo_b = np.searchsorted(sorted_right, r_left + slack, side='left')
+    hi_b = np.searchsorted(sorted_right, r_right, side='right')
+
+    for starts_before, order, lo, hi in ((False, by_left, lo_a, hi_a), (True, by_right, lo_b, hi_b)):
+        counts = np.maximum(hi - lo, 0)
+        cumulative = np.cumsum(counts)
+        start = 0
+        while start < len(ref_idx):
+            base = cumulative[start - 1] if start > 0 else 0
+            end = int(np.searchsorted(cumulative, base + pair_budget, side='right'))
+            end = max(end, start + 1)
+            chunk_counts = counts[start:end]
+            total = int(chunk_counts.sum())
+            if total > 0:
+                refs = np.repeat(ref_idx[start:end], chunk_counts)
+                offsets = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+                cands = order[np.repeat(lo[start:end], chunk_counts) + offsets]
+                if starts_before:
+                    # those starting inside the reference were already produced by the first lookup
+                    keep = left[cands] < left[refs]
+                    refs = refs[keep]
+                    cands = cands[keep]
+                yield refs, cands
+            start = end
+
+
+def build_content_sim_relation_num_overlap_distr_sweep(network, id_sig):
+    """
+    Builds the same CONTENT_SIM and INCLUSION_DEPENDENCY relations as
+    build_content_sim_relation_num_overlap_distr, but instead of comparing every pair of numerical
+    columns it loads the signatures into arrays and only checks the pairs that a sorted sweep over the
+    interval endpoints marks as possibly overlapping
+    :param network: the FieldNetwork where to add the relations
+    :param id_sig: iterable of (nid, (median, iqr, min, max))
+    :return:
+    """
+    fields = []
+    sigs = []
+    is_int = []
+    for c_k, (c_median, c_iqr, c_min_v, c_max_v) in id_sig:
+        fields.append(c_k)
+        domain = (c_median + c_iqr) - (c_median - c_iqr)
+        # Only integer domains are considered for inclusion dependencies
+        is_int.append(not isinstance(domain, float))
+        sigs.append((c_median, c_iqr, c_min_v, c_max_v))
+    build_content_sim_relation_num_overlap_distr_arrays(network, fields, sigs, is_int)
+
+
+def build_content_sim_relation_num_overlap_distr_arrays(network, fields, sigs, is_int, affected=None):
+    """
+    Sort-and-sweep builder on signatures that are already in arrays, e.g., the batches of
+    StoreHandler.stream_fields_num_signatures
+    :param network: the FieldNetwork where to add the relations
+    :param fields: list of nids
+    :param sigs: (len(fields), 4) matrix with the median, iqr, min and max of each column
+    :param is_int: whether median and iqr of each column are integers
+    :param affected: if given, only the relations of these nids are added, e.g., of the columns that changed since
+    the network was built. Clusters of single-value columns are only extended with the affected columns
+    :return:
+    """
+
+    def connect(nid1, nid2, score, inddep=False):
+        if inddep is False:
+            network.add_relation(nid1, nid2, Relation.CONTENT_SIM, score)
+        else:
+            network.add_relation(nid1, nid2, Relation.INCLUSION_DEPENDENCY, score)
+
+    overlap = 0.85
+    inddep_overlap = 0.3
+
+    if len(fields) == 0:
+        return
+
+    st = time.time()
+    sigs = np.asarray(sigs, dtype=np.float64)
+    x_left = sigs[:, 0] - sigs[:, 1]
+    x_right = sigs[:, 0] + sigs[:, 1]
+    x_min = sigs[:, 2]
+    x_max = sigs[:, 3]
+    domains = x_right - x_left
+    is_int = np.asarray(is_int, dtype=bool)
+    has_inf = np.isinf(x_min) | np.isinf(x_max)
+
+    # The original loop visits references in descending (domain, nid) order and the last score written for an
+    # edge is the one that stays, so we keep the position of each column in that order to resolve duplicates
+    visit_order = sorted(range(len(fields)), key=lambda i: (domains[i], fields[i]), reverse=True)
+    position = np.empty(len(fields), dtype=np.int64)
+    position[np.asarray(visit_order, dtype=np.int64)] = np.arange(len(fields))
+
+    def overlap_of(refs, cands):
+        r_left = x_left[refs]
+        r_right = x_right[refs]
+        c_left = x_left[cands]
+        c_right = x_right[cands]
+        intersection = np.minimum(r_right, c_right) - np.maximum(r_left, c_left)
+        # a candidate that strictly contains the reference has no overlap according to compute_overlap
+        contains_ref = (c_left < r_left) & (c_right > r_right)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ov = intersection / domains[refs]
+        ov[contains_ref] = 0
+        return ov
+
+    all_idx = np.arange(len(fields))
+    ref_idx = all_idx[domains != 0]
+    if affected is None:
+        is_affected = np.ones(len(fields), dtype=bool)
+    else:
+        affected = set(affected)
+        is_affected = np.asarray([nid in affected for nid in fields], dtype=bool)
+
+    def pairs_with_affected(refs_idx, cands_idx, threshold):
+        # the pairs with an affected reference and those with an affected candidate, some of them twice
+        if affected is None:
+            return _overlapping_interval_pairs(x_left, x_right, refs_idx, cands_idx, threshold)
+        return itertools.chain(
+            _overlapping_interval_pairs(x_left, x_right, refs_idx[is_affected[refs_idx]], cands_idx, threshold),
+            _overlapping_interval_pairs(x_left, x_right, refs_idx, cands_idx[is_affected[cands_idx]], threshold))
+
+    # Content sim
+    cs_src = []
+    cs_tgt = []
+    cs_score = []
+    for refs, cands in pairs_with_affected(ref_idx, all_idx, overlap):
+        ov = overlap_of(refs, cands)
+        keep = (refs != cands) & (ov >= overlap) & ~(is_int[cands] & (has_inf[refs] | has_inf[cands]))
+        cs_src.append(refs[keep])
+        cs_tgt.append(cands[keep])
+        cs_score.append(ov[keep])
+
+    # Inclusion dependencies
+    ind_src = []
+    ind_tgt = []
+    ind_cand_idx = all_idx[is_int & ~has_inf & (x_min >= 0)]
+    ind_ref_idx = ref_idx[~has_inf[ref_idx]]
+    if len(ind_cand_idx) > 0 and len(ind_ref_idx) > 0:
+        pairs = pairs_with_affected(ind_ref_idx, ind_cand_idx, inddep_overlap)
+        for refs, cands in pairs:
+            ov = overlap_of(refs, cands)
+            keep = (refs != cands) & (ov >= inddep_overlap) & \
+                   (x_min[cands] >= x_min[refs]) & (x_max[cands] <= x_max[refs])
+            ind_src.append(refs[keep])
+            ind_tgt.append(cands[keep])
+    et = time.time()
+    print("Time to find overlapping num signatures: {0}".format(str(et - st)))
+
+    if len(cs_src) > 0:
+        refs = np.concatenate(cs_src)
+        cands = np.concatenate(cs_tgt)
+        scores = np.concatenate(cs_score)
+        # Keep only the last score the sequential version would have written for every undirected pair
+        low = np.minimum(refs, cands)
+        high = np.maximum(refs, cands)
+        sorting = np.lexsort((position[refs], high, low))
+        low = low[sorting]
+        high = high[sorting]
+        last = np.ones(len(sorting), dtype=bool)
+        last[:-1] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+        for ref, cand, score in zip(refs[sorting][last], cands[sorting][last], scores[sorting][last]):
+            connect(fields[cand], fields[ref], float(score))
+
+    if len(ind_src) > 0:
+        refs = np.concatenate(ind_src)
+        cands = np.concatenate(ind_tgt)
+        for nid1, nid2 in set(zip(np.minimum(refs, cands).tolist(), np.maximum(refs, cands).tolist())):
+            connect(fields[nid1], fields[nid2], 1, inddep=True)
+
+    # Final clustering for single points
+    single_points = all_idx[domains == 0]
+    if len(single_points) == 0:
+        return
+
+    x_median = (x_right[single_points] - x_right[single_points] / 2).reshape(-1, 1)
+    db_median = DBSCAN(eps=0.1, min_samples=2).fit(x_median)
+    labels_median = db_median.labels_
+
+    clusters_median = defaultdict(list)
+    for i in range(len(labels_median)):
+        clusters_median[labels_median[i]].append(fields[single_points[i]])
+
+    for k, v in clusters_median.items():
+        if k == -1:
+            continue
+        for nid1 in v:
+            if affected is not None and nid1 not in affected:
+                continue
+            for nid2 in v:
+                if nid1 != nid2:
+                    connect(nid1, nid2, overlap)
+
+
 def build_content_sim_relation_num_double_clustering(network, id_sig):
 
     fields = []
@@ -621,7 +1226,12 @@ def build_content_sim_relation_num(network, id_sig):
                     network.add_relation(nid1, nid2, Relation.CONTENT_SIM, 1)
 
 
-def build_pkfk_relation(network):
+def build_pkfk_relation(network, nids=None):
+    """
+    :param network: the FieldNetwork where to add the relations
+    :param nids: if given, only the relations of these nids are added
+    :return:
+    """
 
     def get_neighborhood(n):
         neighbors = []
@@ -633,7 +1243,9 @@ def build_pkfk_relation(network):
         return neighbors
 
     total_pkfk_relations = 0
-    for n in network.iterate_ids():
+    if nids is None:
+        nids = network.iterate_ids()
+    for n in nids:
         n_card = network.get_cardinality_of(n)
         if n == '2314808454' or n == '1504465753':
             debug = True
@@ -0,0 +1,221 @@
+import unittest
+import itertools
+import tempfile
+import numpy as np
+import networkx as nx
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
+from knowledgerepr.fieldnetwork import CompactFieldNetwork
+from benchmarking.field_network_benchmarks import generate_random_network
+
+
+def score_of(hit):
+    # the networkx backend returns the attribute dict of the edge as score
+    if isinstance(hit.score, dict):
+        return hit.score['score']
+    return hit.score
+
+
+def nid_pairs(network, relation):
+    return [(h1.nid, h2.nid) for h1, h2 in network.enumerate_relation(relation, as_str=False)]
+
+
+class TestCompactFieldNetwork(unittest.TestCase):
+
+    def assert_same_network(self, expected, found):
+        for relation in [Relation.SCHEMA_SIM, Relation.CONTENT_SIM, Relation.PKFK]:
+            for nid in expected.iterate_ids():
+                e = [(h.nid, score_of(h)) for h in expected.neighbors_id(nid, relation)]
+                f = [(h.nid, score_of(h)) for h in found.neighbors_id(nid, relation)]
+                self.assertEqual([n for n, _ in e], [n for n, _ in f])
+                self.assertTrue(np.allclose([s for _, s in e], [s for _, s in f]))
+            self.assertEqual(nid_pairs(expected, relation), nid_pairs(found, relation))
+
+    def test_converted_network_same_neighbors(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(200, 1000, seed=1)
+        compact = fieldnetwork.compact_field_network(network)
+        self.assert_same_network(network, compact)
+        self.assertEqual(network.graph_order(), compact.graph_order())
+
+    def test_add_relation_same_neighbors(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(100, 500, seed=2)
+        # replay the same edges, with repeated edges and overwritten scores, into a compact network without edges
+        edges = list(network._get_underlying_repr_graph().edges(keys=True, data=True))
+        compact = fieldnetwork.compact_field_network(generate_random_network(100, 0, seed=2))
+        for src, tgt, relation, data in edges:
+            compact.add_relation(src, tgt, relation, 0.0)
+        compact.neighbors_id(edges[0][0], Relation.CONTENT_SIM)  # forces a merge in between
+        for src, tgt, relation, data in edges:
+            compact.add_relation(tgt, src, relation, data['score']['score'])
+        self.assertEqual(set(frozenset(p) for p in nid_pairs(network, Relation.PKFK)),
+                         set(frozenset(p) for p in nid_pairs(compact, Relation.PKFK)))
+        for relation in [Relation.SCHEMA_SIM, Relation.CONTENT_SIM, Relation.PKFK]:
+            for nid in network.iterate_ids():
+                e = {h.nid: score_of(h) for h in network.neighbors_id(nid, relation)}
+                f = {h.nid: h.score for h in compact.neighbors_id(nid, relation)}
+                self.assertEqual(e.keys(), f.keys())
+                for k, v in e.items():
+                    self.assertAlmostEqual(v, f[k], places=5)
+
+    def test_serialize_compact_network(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(100, 500, seed=3)
+        path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(network, path)
+        converted = fieldnetwork.deserialize_network(path, backend="compact")
+        self.assertTrue(isinstance(converted, CompactFieldNetwork))
+        self.assert_same_network(network, converted)
+
+        fieldnetwork.serialize_compact_network(converted, path)
+        loaded = fieldnetwork.deserialize_network(path, backend="compact")
+        self.assert_same_network(network, loaded)
+        nid = next(network.iterate_ids())
+        self.assertAlmostEqual(converted.get_cardinality_of(nid), loaded.get_cardinality_of(nid), places=5)
+        src, tgt = network.get_hits_from_info(network.get_info_for(list(network.iterate_ids())[:2]))
+        self.assertEqual([h.nid for h in network.find_path_hit(src, tgt, Relation.PKFK)],
+                         [h.nid for h in loaded.find_path_hit(src, tgt, Relation.PKFK)])
+
+    def test_mmap_model(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(100, 500, seed=4)
+        path = tempfile.mkdtemp() + "/"
+        fieldnetwork.serialize_network(network, path)
+        self.assertEqual(modelformat.model_backend(path), "networkx")
+        modelformat.convert_pickled_model(path)
+        self.assertEqual(modelformat.model_backend(path), "mmap")
+        loaded = fieldnetwork.deserialize_network(path, backend="mmap")
+        self.assert_same_network(network, loaded)
+        self.assertEqual(network.graph_order(), loaded.graph_order())
+        self.assertEqual(network.get_number_tables(), loaded.get_number_tables())
+        for table in ["synt0", "synt5", "missing"]:
+            self.assertEqual(network.get_fields_of_source(table), loaded.get_fields_of_source(table))
+        nid = next(network.iterate_ids())
+        self.assertEqual(network.get_info_for([nid]), loaded.get_info_for([nid]))
+
+        # the loaded model can still be extended
+        loaded.add_relation(nid, "new_node", Relation.PKFK, 0.5)
+        nids, _, relations = loaded._get_underlying_repr_arrays()
+        indptr, indices, _ = relations[Relation.PKFK]
+        idx = nids.index(nid)
+        self.assertIn(nids.index("new_node"), indices[indptr[idx]:indptr[idx + 1]].tolist())
+
+        with self.assertRaises(Exception):
+            loaded.remove_field(nid)
+
+    def test_remove_fields_and_relations(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(100, 500, seed=5)
+        compact = fieldnetwork.compact_field_network(network)
+        nids = list(network.iterate_ids())
+        # a pending edge of a removed node must go too
+        compact.add_relation(nids[0], nids[1], Relation.PKFK, 0.9)
+        network.add_relation(nids[0], nids[1], Relation.PKFK, 0.9)
+        for n in [network, compact]:
+            for nid in nids[:10]:
+                n.remove_field(nid)
+            n.remove_relations([Relation.CONTENT_SIM], nids[10:20])
+            n.remove_relations([Relation.SCHEMA_SIM])
+            # a removed field can come back, without relations
+            n.add_field_info(nids[0], "syndb", "synt_new", "f", 100, 50, "N")
+        self.assertEqual(sorted(network.iterate_ids()), sorted(compact.iterate_ids()))
+        self.assertEqual(network.graph_order(), compact.graph_order())
+        self.assertEqual(network.get_fields_of_source("synt_new"), compact.get_fields_of_source("synt_new"))
+        self.assertEqual([], nid_pairs(compact, Relation.SCHEMA_SIM))
+        for nid in nids[10:20]:
+            self.assertEqual(0, len(compact.neighbors_id(nid, Relation.CONTENT_SIM).data))
+        self.assert_same_network(network, compact)
+        self.assertAlmostEqual(0.5, compact.get_cardinality_of(nids[0]))
+        removed = set(nids[1:10])
+        arrays_nids, _, _ = compact._get_underlying_repr_arrays()
+        self.assertEqual(set(), removed & set(arrays_nids))
+
+
+class TestPathSearch(unittest.TestCase):
+
+    def test_bfs_finds_shortest_paths(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(300, 400, seed=5)
+        G = nx.Graph()
+        for src, tgt, relation in network._get_underlying_repr_graph().edges(keys=True):
+            if relation == Relation.PKFK:
+                G.add_edge(src, tgt)
+        hits = network.get_hits_from_info(network.get_info_for(list(network.iterate_ids())))
+        found = 0
+        for h1, h2 in zip(hits[:40], hits[40:80]):
+            try:
+                expected = nx.shortest_path_length(G, h1.nid, h2.nid)
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                expected = None
+            for max_hops in [2, 4, 8]:
+                res = network.find_path_hit_bfs(h1, h2, Relation.PKFK, max_hops=max_hops)
+                if expected is None or expected > max_hops:
+                    self.assertEqual(0, len(res.data))
+                else:
+                    # the path is the only chain in the provenance graph, from h1 to h2
+                    path = nx.shortest_path(res.get_provenance().prov_graph(), h1, h2)
+                    self.assertEqual(expected, len(path) - 1)
+                    found += 1
+        self.assertTrue(found > 0)
+
+    def test_bfs_k_shortest_paths(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(50, 150, seed=6)
+        G = nx.Graph()
+        for src, tgt, relation in network._get_underlying_repr_graph().edges(keys=True):
+            if relation == Relation.PKFK and src != tgt:
+                G.add_edge(src, tgt)
+        h1, h2 = network.get_hits_from_info(network.get_info_for(list(G.nodes())[:2]))
+        expected = list(itertools.islice(nx.shortest_simple_paths(G, h1.nid, h2.nid), 5))
+        res = network.find_path_hit_bfs(h1, h2, Relation.PKFK, max_hops=len(expected[-1]), k=5)
+        found = set()
+        for path in nx.all_simple_paths(res.get_provenance().prov_graph(), h1, h2):
+            found.add(tuple(h.nid for h in path))
+        self.assertEqual(5, len(found))
+        self.assertEqual(sorted(len(p) for p in expected), sorted(len(p) for p in found))
+        for path in found:
+            self.assertTrue(nx.is_simple_path(G, list(path)))
+
+    def test_table_join_paths(self):
+        print(self._testMethodName)
+
+        network = generate_random_network(200, 120, num_nodes_per_table=5, seed=9)
+        T = nx.Graph()
+        for src, tgt, relation in network._get_underlying_repr_graph().edges(keys=True):
+            t1 = network.get_info_for([src])[0][2]
+            t2 = network.get_info_for([tgt])[0][2]
+            if relation == Relation.PKFK and t1 != t2:
+                T.add_edge(t1, t2)
+        tables = sorted(network._get_underlying_repr_table_to_ids().keys())
+        found = 0
+        for t1, t2 in zip(tables[:10], tables[10:20]):
+            expected = set()
+            if t1 in T and t2 in T:
+                expected = set(tuple(p) for p in nx.all_simple_paths(T, t1, t2, cutoff=3))
+            table_paths = set(tuple(p) for p in network.table_join_paths(t1, t2, Relation.PKFK, max_hops=3))
+            lengths = [len(p) for p in network.table_join_paths(t1, t2, Relation.PKFK, max_hops=3)]
+            self.assertEqual(sorted(lengths), lengths)  # shortest first
+            # every join path is in the provenance of the path query
+            res = network.find_path_table_bfs(t1, t2, Relation.PKFK, max_hops=3)
+            self.assertEqual(set([t for p in table_paths for t in p]), set([h.source_name for h in res.data]) |
+                             set([h.source_name for h in res.get_provenance().prov_graph().nodes()]))
+            # capping the column paths keeps one for every table path
+            res = network.find_path_table_bfs(t1, t2, Relation.PKFK, max_hops=3, max_column_paths=1)
+            self.assertEqual(set([t for p in table_paths for t in p]), set([h.source_name for h in res.data]) |
+                             set([h.source_name for h in res.get_provenance().prov_graph().nodes()]))
+            self.assertEqual(expected, table_paths)
+            found += len(expected)
+        self.assertTrue(found > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
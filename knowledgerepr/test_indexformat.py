@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+
+import numpy as np
+from datasketch import MinHash
+
+from benchmarking.network_building_benchmarks import generate_field_names
+from benchmarking.network_building_benchmarks import generate_mh_signatures
+from benchmarking.network_building_benchmarks import network_with_fields
+from dataanalysis import dataanalysis as da
+from inputoutput import inputoutput as io
+from knowledgerepr import indexformat
+from knowledgerepr import networkbuilder
+
+
+class TestIndexFormat(unittest.TestCase):
+
+    def test_indexes_same_queries_as_pickled(self):
+        print(self._testMethodName)
+
+        nids = [str(i) for i in range(300)]
+        tfidf = da.get_tfidf_docs([name.replace("_", " ") for name in generate_field_names(300, seed=2)])
+        schema_sim_index = networkbuilder.BatchedLSHRandomProjectionsIndex(tfidf.shape[1])
+        schema_sim_index.bulk_index(tfidf, nids)
+        mh_signatures = generate_mh_signatures(200, seed=5)
+        network = network_with_fields([nid for nid, _ in mh_signatures], data_type="T")
+        content_sim_index = networkbuilder.build_content_sim_mh_text_parallel(network, mh_signatures, num_workers=1)
+
+        path = tempfile.mkdtemp() + "/"
+        io.serialize_object(schema_sim_index, path + "schema_sim_index.pkl")
+        io.serialize_object(content_sim_index, path + "content_sim_index.pkl")
+        self.assertFalse(indexformat.has_indexes(path))
+        indexformat.convert_pickled_indexes(path)
+        loaded_schema, loaded_content = indexformat.load_indexes(path)
+        self.assertTrue(isinstance(loaded_content, indexformat.CompactMinHashLSH))
+
+        for row_idx in range(0, 300, 7):
+            array = tfidf.getrow(row_idx).toarray()[0]
+            expected = [(key, value) for _, key, value in schema_sim_index.query(array)]
+            found = [(key, value) for _, key, value in loaded_schema.query(array)]
+            self.assertEqual([key for key, _ in expected], [key for key, _ in found])
+            self.assertTrue(np.allclose([v for _, v in expected], [v for _, v in found]))
+
+        for nid, mh_sig in mh_signatures:
+            mh_obj = MinHash(num_perm=512)
+            mh_obj.hashvalues = np.asarray(mh_sig, dtype=int)
+            expected = content_sim_index.query(mh_obj)
+            self.assertIn(nid, expected)
+            self.assertEqual(sorted(expected), sorted(loaded_content.query(mh_obj)))
+
+    def test_schema_sim_index_with_several_tables(self):
+        print(self._testMethodName)
+
+        nids = [str(i) for i in range(300)]
+        tfidf = da.get_tfidf_docs([name.replace("_", " ") for name in generate_field_names(300, seed=4)])
+        batched = networkbuilder.BatchedLSHRandomProjectionsIndex(tfidf.shape[1], num_tables=3, probe_distance=1)
+        batched.bulk_index(tfidf, nids)
+        nearpy_index = networkbuilder.LSHRandomProjectionsIndex(tfidf.shape[1], num_tables=2, probe_distance=1)
+        nearpy_index.bulk_index(tfidf, nids)
+
+        for index in [batched, nearpy_index]:
+            path = tempfile.mkdtemp() + "/"
+            indexformat.serialize_indexes(index, None, path)
+            loaded, _ = indexformat.deserialize_indexes(path)
+            self.assertEqual(len(index.lshashes), len(loaded.lshashes))
+            self.assertEqual(1, loaded.rbp.probe_distance)
+            for row_idx in range(0, 300, 7):
+                array = tfidf.getrow(row_idx).toarray()[0]
+                expected = [(key, value) for _, key, value in index.query(array)]
+                found = [(key, value) for _, key, value in loaded.query(array)]
+                self.assertTrue(np.allclose(sorted(v for _, v in expected), sorted(v for _, v in found)))
+                # ties at the last distance may keep different keys
+                last = max([v for _, v in expected] + [0.0])
+                self.assertEqual({k for k, v in expected if v < last - 1e-9},
+                                 {k for k, v in found if v < last - 1e-9})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import numpy as np
+from api.apiutils import Relation
+from knowledgerepr import networkbuilder
+from benchmarking.network_building_benchmarks import generate_num_signatures
+from benchmarking.network_building_benchmarks import network_with_fields
+from benchmarking.network_building_benchmarks import relation_edges
+from benchmarking.network_building_benchmarks import generate_field_names
+from benchmarking.network_building_benchmarks import generate_mh_signatures
+from dataanalysis import dataanalysis as da
+
+
+class TestNetworkBuilder(unittest.TestCase):
+
+    def test_num_overlap_sweep_same_as_pairwise(self):
+        print(self._testMethodName)
+
+        id_sig = generate_num_signatures(300, seed=7)
+        nids = [nid for nid, _ in id_sig]
+
+        pairwise = network_with_fields(nids)
+        networkbuilder.build_content_sim_relation_num_overlap_distr(pairwise, id_sig)
+        sweep = network_with_fields(nids)
+        networkbuilder.build_content_sim_relation_num_overlap_distr_sweep(sweep, id_sig)
+
+        for relation in [Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY]:
+            expected = relation_edges(pairwise, relation)
+            found = relation_edges(sweep, relation)
+            self.assertTrue(len(expected) > 0)
+            self.assertEqual(expected.keys(), found.keys())
+            for k, v in expected.items():
+                self.assertAlmostEqual(v, found[k])
+
+    def test_batched_schema_sim_index_same_as_nearpy(self):
+        print(self._testMethodName)
+
+        nids = [str(i) for i in range(500)]
+        tfidf = da.get_tfidf_docs(generate_field_names(500, seed=3))
+
+        batched = networkbuilder.BatchedLSHRandomProjectionsIndex(tfidf.shape[1])
+        batched.bulk_index(tfidf, nids)
+        nearpy_index = networkbuilder.LSHRandomProjectionsIndex(tfidf.shape[1])
+        nearpy_index.rbp.normals = batched.rbp.normals
+        for row_idx, nid in enumerate(nids):
+            nearpy_index.index(tfidf.getrow(row_idx).toarray()[0], nid)
+
+        for row_idx in range(0, 500, 7):
+            array = tfidf.getrow(row_idx).toarray()[0]
+            expected = [(key, value) for _, key, value in nearpy_index.query(array)]
+            found = [(key, value) for _, key, value in batched.query(array)]
+            self.assertEqual([key for key, _ in expected], [key for key, _ in found])
+            for (_, v1), (_, v2) in zip(expected, found):
+                self.assertAlmostEqual(v1, v2)
+
+    def test_schema_sim_index_tables_and_probes(self):
+        print(self._testMethodName)
+
+        nids = [str(i) for i in range(300)]
+        tfidf = da.get_tfidf_docs([name.replace("_", " ") for name in generate_field_names(300, seed=3)])
+
+        single = networkbuilder.LSHRandomProjectionsIndex(tfidf.shape[1])
+        single.bulk_index(tfidf, nids)
+        index = networkbuilder.LSHRandomProjectionsIndex(tfidf.shape[1], num_tables=3, probe_distance=1)
+        index.rbp.normals = single.rbp.normals
+        index.bulk_index(tfidf, nids)
+        self.assertEqual(3, len(index.text_engine.lshashes))
+        self.assertTrue(index.memory_size() > 2 * single.memory_size())
+
+        for row_idx in range(0, 300, 7):
+            array = tfidf.getrow(row_idx).toarray()[0]
+            found = [key for _, key, _ in index.query(array)]
+            self.assertTrue(nids[row_idx] in found or len(found) == 10)
+            # the first table alone finds a subset of the candidates of all tables and probes
+            self.assertTrue(single.text_engine.candidate_count(array) <= index.text_engine.candidate_count(array))
+
+    def test_batched_index_tables_and_probes_same_as_nearpy(self):
+        print(self._testMethodName)
+
+        nids = [str(i) for i in range(300)]
+        tfidf = da.get_tfidf_docs([name.replace("_", " ") for name in generate_field_names(300, seed=3)])
+
+        batched = networkbuilder.BatchedLSHRandomProjectionsIndex(tfidf.shape[1], num_tables=3, probe_distance=1)
+        batched.bulk_index(tfidf, nids)
+        nearpy_index = networkbuilder.LSHRandomProjectionsIndex(tfidf.shape[1], num_tables=3, probe_distance=1)
+        for lshash, batched_lshash in zip(nearpy_index.lshashes, batched.lshashes):
+            lshash.normals = batched_lshash.normals
+        nearpy_index.bulk_index(tfidf, nids)
+
+        for row_idx in range(0, 300, 7):
+            array = tfidf.getrow(row_idx).toarray()[0]
+            expected = [(key, value) for _, key, value in nearpy_index.query(array)]
+            found = [(key, value) for _, key, value in batched.query(array)]
+            self.assertTrue(np.allclose(sorted(v for _, v in expected), sorted(v for _, v in found)))
+            # ties at the last distance may keep different keys
+            last = max([v for _, v in expected] + [0.0])
+            self.assertEqual({k for k, v in expected if v < last - 1e-9}, {k for k, v in found if v < last - 1e-9})
+
+        # the relation has the neighbours of every column in all the tables and probes
+        network = network_with_fields(nids, field_names=generate_field_names(300, seed=3))
+        index = networkbuilder.build_schema_sim_relation_batched(network, num_tables=3, probe_distance=1)
+        edges = relation_edges(network, Relation.SCHEMA_SIM)
+        self.assertTrue(len(edges) > 0)
+        docs = [field_name for (_, _, field_name, _) in network.iterate_values()]
+        vectors = da.get_tfidf_docs(docs)
+        for row_idx, nid in enumerate(network.iterate_ids()):
+            found = index.query(vectors.getrow(row_idx).toarray()[0])
+            last = max([v for _, _, v in found] + [0.0])
+            for _, key, value in found:
+                if key != nid and value < last - 1e-9:
+                    self.assertIn(frozenset((nid, key)), edges)
+
+    def test_parallel_mh_content_sim_same_as_lsh_queries(self):
+        print(self._testMethodName)
+
+        mh_signatures = generate_mh_signatures(300, seed=5)
+        nids = [nid for nid, _ in mh_signatures]
+
+        queried = network_with_fields(nids, data_type="T")
+        networkbuilder.build_content_sim_mh_text(queried, mh_signatures)
+        parallel = network_with_fields(nids, data_type="T")
+        content_index = networkbuilder.build_content_sim_mh_text_parallel(parallel, mh_signatures, num_workers=2)
+
+        expected = relation_edges(queried, Relation.CONTENT_SIM)
+        self.assertTrue(len(expected) > 0)
+        self.assertEqual(expected, relation_edges(parallel, Relation.CONTENT_SIM))
+        self.assertEqual(len(nids), len(content_index.keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ import time
 
 from api.reporting import Report
 from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
 from modelstore.elasticstore import StoreHandler
 from ddapi import API as oldAPI
 from algebra import API
@@ -32,10 +33,12 @@ def __init_system(path_to_serialized_model, create_reporting=True):
     return api, reporting
 
 
-def init_system(path_to_serialized_model, create_reporting=False):
+def init_system(path_to_serialized_model, create_reporting=False, backend=None):
     print_md('Loading: *' + str(path_to_serialized_model) + "*")
     sl = time.time()
-    network = fieldnetwork.deserialize_network(path_to_serialized_model)
+    if backend is None:
+        backend = modelformat.model_backend(path_to_serialized_model)
+    network = fieldnetwork.deserialize_network(path_to_serialized_model, backend=backend)
     store_client = StoreHandler()
     api = API(network=network, store_client=store_client)
     if create_reporting:
@@ -51,7 +54,8 @@ def init_system(path_to_serialized_model, create_reporting=False):
 
 def main(path_to_serialized_model):
     print('Loading: ' + str(path_to_serialized_model))
-    network = fieldnetwork.deserialize_network(path_to_serialized_model)
+    network = fieldnetwork.deserialize_network(path_to_serialized_model,
+                                               backend=modelformat.model_backend(path_to_serialized_model))
     store_client = StoreHandler()
     api = API(network, store_client)
     ip_shell = InteractiveShellEmbed(banner1=init_banner, exit_msg=exit_banner)
@@ -2,6 +2,10 @@ import random
 import numpy as np
 from datasketch import MinHash
 
+from maintain.ress_utils import get_mh_batched
+from maintain.ress_utils import jaccard_batched
+from maintain.ress_utils import mh_permutations
+
 
 def generate_data(num_columns):
     #data = [[i for i in range(100)] for _ in range(num_columns)]
@@ -47,6 +51,7 @@ def col2col_ress(dataset1, dataset2, sample_perc, store_path):
 
         found = 0
         correct = 0
+        params = mh_permutations(512)
 
         for i in range(len(dataset1)):  # dataset1 and 2 have the same number of columns
 
@@ -55,15 +60,15 @@ def col2col_ress(dataset1, dataset2, sample_perc, store_path):
 
             val2 = get_random_sample(val2, sample_perc)
             #mh1 = get_mh(val1)
-            mh1 = get_mh(val1)
-            mh2 = get_mh(val2)
+            mh1 = get_mh_batched(val1, params=params)
+            mh2 = get_mh_batched(val2, params=params)
             card1 = len(set(val1))
             card2 = len(set(val2))
             if card1 == 0:
                 max_js = 0
             else:
                 max_js = card2 / card1
-            est_js = mh1.jaccard(mh2)
+            est_js = jaccard_batched(mh1, mh2)
             if max_js == 0:
                 scaled_est_js = 0
             else:
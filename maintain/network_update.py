@@ -0,0 +1,228 @@
+"""
+Incremental maintenance of a serialized model: instead of rebuilding the whole network with
+networkbuildercoordinator.main when some tables of the lake change, update_model takes the nids of the columns
+that were added, removed or changed since the model was built (e.g., those that RESS finds changed with
+ress_utils.col2col_ress), re-profiled in the store, and recomputes only their relations.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from datasketch import MinHashLSH
+
+from api.apiutils import Relation
+from knowledgerepr import fieldnetwork
+from knowledgerepr import indexformat
+from knowledgerepr import modelformat
+from knowledgerepr import networkbuilder
+from knowledgerepr.indexformat import CompactMinHashLSH
+
+
+def _updated_content_sim_index(content_sim_index, dropped, new_ids, new_signatures, threshold=0.7, num_perm=512):
+    """
+    :param content_sim_index: a MinHashLSH, a CompactMinHashLSH or None
+    :param dropped: ids to remove from the index
+    :param new_ids: ids to add to the index
+    :param new_signatures: minhash signature of each of new_ids
+    :return: CompactMinHashLSH without the dropped ids and with the new ones
+    """
+    if content_sim_index is None:
+        params = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        num_perm, num_bands, rows_per_band = params.h, params.b, params.r
+        ids = []
+        bands = np.empty((num_bands, 0, rows_per_band), dtype=np.uint64)
+    elif isinstance(content_sim_index, CompactMinHashLSH):
+        num_perm, num_bands, rows_per_band = content_sim_index.h, content_sim_index.b, content_sim_index.r
+        ids = list(content_sim_index.ids)
+        bands = content_sim_index.band_arrays()
+    else:
+        num_perm, num_bands, rows_per_band = content_sim_index.h, content_sim_index.b, content_sim_index.r
+        ids, bands = indexformat._content_sim_arrays(content_sim_index)
+
+    keep = np.asarray([nid not in dropped for nid in ids], dtype=bool)
+    ids = [nid for nid, k in zip(ids, keep) if k]
+    bands = bands[:, keep] if len(keep) > 0 else bands
+    if len(new_ids) > 0:
+        new_bands = [indexformat.band_values(sig[:num_perm])[:num_bands * rows_per_band]
+                     .reshape(num_bands, rows_per_band) for sig in new_signatures]
+        bands = np.concatenate([bands, np.stack(new_bands, axis=1)], axis=1)
+        ids.extend(new_ids)
+    return indexformat.compact_minhash_lsh(num_perm, ids, bands)
+
+
+def update_network(network, schema_sim_index, content_sim_index, removed, profiles, num_signatures=None):
+    """
+    Updates network in place with the changes of some columns. The relations between columns that did not change
+    stay as they are, the relations of the removed columns are dropped and those of the added and changed ones are
+    computed again against all columns, so that the result is that of building the network from scratch, except
+    for the clusters of single-value numerical columns: the unchanged ones are only connected with the changed
+    ones, the clusters of unchanged columns are merged or split in the next full build only
+    :param network: the FieldNetwork of the model
+    :param schema_sim_index: the schema_sim index of the model
+    :param content_sim_index: the content_sim index of the model, a MinHashLSH or CompactMinHashLSH
+    :param removed: nids of the columns that are no longer in the lake
+    :param profiles: dict nid -> (dbName, sourceName, columnName, totalValues, uniqueValues, dataType, minhash)
+    with the current profile of the added and changed columns, as StoreHandler.get_fields_profiles
+    :param num_signatures: (nids, sigs, is_int) with the numerical signatures of all the columns of the lake, as
+    the batches of StoreHandler.stream_fields_num_signatures concatenated, or None if there are no numerical columns
+    :return: (schema_sim_index, content_sim_index) updated with the changes
+    """
+    removed = set(removed)
+    affected = set(profiles.keys())
+    known = set(network.iterate_ids())
+    added = {nid for nid in affected if nid not in known}
+    changed = affected - added
+
+    # Columns that are gone
+    st = time.time()
+    for nid in removed:
+        network.remove_field(nid)
+
+    # The relations of the changed columns are computed again below
+    renamed = False
+    old_info = dict()
+    if len(changed) > 0:
+        old_info = {nid: (db_name, sn_name, fn_name) for nid, db_name, sn_name, fn_name in
+                    network.get_info_for(list(changed))}
+    network.remove_relations([Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY, Relation.PKFK], list(changed))
+    for nid, (db_name, sn_name, fn_name, total_values, unique_values, data_type, _) in profiles.items():
+        if nid in old_info and old_info[nid] != (db_name, sn_name, fn_name):
+            # a column that moved to another table is added again in that one
+            renamed = True
+            network.remove_field(nid)
+        network.add_field_info(nid, db_name, sn_name, fn_name, total_values, unique_values, data_type)
+    et = time.time()
+    print("Time to update the fields: {0}".format(str(et - st)))
+
+    # Schema_sim relation. The TF-IDF weights of all the names depend on the whole set of names, so if it changed
+    # the relation and its index are built again, which only needs the names of the network
+    if len(added) > 0 or len(removed) > 0 or renamed or schema_sim_index is None:
+        st = time.time()
+        network.remove_relations([Relation.SCHEMA_SIM])
+        schema_sim_index = networkbuilder.build_schema_sim_relation_batched(network)
+        et = time.time()
+        print("Time to rebuild schema-sim: {0}".format(str(et - st)))
+
+    # Content_sim text relation (minhash-based)
+    st = time.time()
+    mh_ids = []
+    mh_signatures = []
+    for nid, profile in profiles.items():
+        data_type, minhash = profile[5], profile[6]
+        if data_type == "T" and minhash is not None:
+            mh_ids.append(nid)
+            mh_signatures.append(np.asarray(minhash))
+    content_sim_index = _updated_content_sim_index(content_sim_index, removed | affected, mh_ids, mh_signatures)
+    for nid, mh_sig in zip(mh_ids, mh_signatures):
+        for r_nid in content_sim_index.query(mh_sig[:content_sim_index.h]):
+            if r_nid != nid:
+                network.add_relation(nid, r_nid, Relation.CONTENT_SIM, 1)
+    et = time.time()
+    print("Time to update text content-sim: {0}".format(str(et - st)))
+
+    # Content_sim num relation and inclusion dependencies
+    st = time.time()
+    if num_signatures is not None and len(num_signatures[0]) > 0:
+        num_nids, sigs, is_int = num_signatures
+        networkbuilder.build_content_sim_relation_num_overlap_distr_arrays(network, num_nids, sigs, is_int,
+                                                                           affected=affected)
+    et = time.time()
+    print("Time to update num content-sim: {0}".format(str(et - st)))
+
+    # Primary Key / Foreign key relation, the neighbors may be the primary key of the affected columns
+    st = time.time()
+    pkfk_nids = set(affected)
+    for nid in affected:
+        for relation in [Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY]:
+            pkfk_nids.update(hit.nid for hit in network.neighbors_id(nid, relation))
+    networkbuilder.build_pkfk_relation(network, nids=sorted(pkfk_nids))
+    et = time.time()
+    print("Time to update PKFK: {0}".format(str(et - st)))
+
+    return schema_sim_index, content_sim_index
+
+
+def update_model(path, added, removed, changed, store=None):
+    """
+    Updates the model serialized in path with the columns that were added, removed or changed in the lake, once
+    they have been profiled into the store, and writes it again in every format it was written
+    :param path: the model path
+    :param added: nids of the new columns
+    :param removed: nids of the columns that are no longer in the lake
+    :param changed: nids of the columns whose data changed
+    :param store: the StoreHandler with the current profiles
+    :return: the updated FieldNetwork
+    """
+    if store is None:
+        from modelstore.elasticstore import StoreHandler
+        store = StoreHandler()
+    path = path + '/'  # force separator
+    start_all = time.time()
+
+    network = fieldnetwork.deserialize_network(path)
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path)
+
+    st = time.time()
+    profiles = store.get_fields_profiles(set(added) | set(changed))
+    missing = (set(added) | set(changed)) - set(profiles.keys())
+    if len(missing) > 0:
+        print("WARNING: " + str(len(missing)) + " added or changed columns are not in the store, removing them")
+    num_nids = []
+    num_batches = []
+    num_is_int = []
+    for nids, sigs, is_int in store.stream_fields_num_signatures():
+        num_nids.extend(nids)
+        num_batches.append(sigs)
+        num_is_int.append(is_int)
+    num_signatures = None
+    if len(num_batches) > 0:
+        num_signatures = (num_nids, np.concatenate(num_batches), np.concatenate(num_is_int))
+    et = time.time()
+    print("Time to extract profiles and signatures from store: {0}".format(str(et - st)))
+
+    removed = set(removed) | missing
+    schema_sim_index, content_sim_index = update_network(network, schema_sim_index, content_sim_index, removed,
+                                                         profiles, num_signatures)
+
+    # Patch every serialized form of the model, the binary ones are replaced file by file (see modelformat)
+    st = time.time()
+    fieldnetwork.serialize_network(network, path)
+    if os.path.isfile(path + "compact_graph.npz"):
+        fieldnetwork.serialize_compact_network(network, path)
+    if modelformat.has_mmap_model(path):
+        modelformat.serialize_network_mmap(network, path)
+    indexformat.serialize_indexes(schema_sim_index, content_sim_index, path)
+
+    from DoD import join_estimation
+    from DoD import join_path_index
+    if os.path.isfile(path + join_path_index.INDEX_FILE):
+        join_path_index.load_or_build_join_path_index(network, path)
+    hll_sketches = join_estimation.load_hll_sketches(path)
+    if hll_sketches is not None:
+        # sketches of the changed columns are stale, the estimates fall back to the profile until they are rebuilt
+        stale = removed | set(changed)
+        join_estimation.serialize_hll_sketches({nid: hll for nid, hll in hll_sketches.items() if nid not in stale},
+                                               path)
+    et = time.time()
+    print("Time to serialize the model: {0}".format(str(et - st)))
+
+    end_all = time.time()
+    print("Total time: {0}".format(str(end_all - start_all)))
+    return network
+
+
+if __name__ == "__main__":
+    print("Incremental model update")
+
+    if len(sys.argv) != 3:
+        print("USAGE: python network_update.py <path_to_serialized_model> <changes_json>")
+        print("where changes_json has the lists of nids 'added', 'removed' and 'changed'")
+        exit()
+
+    model_path = sys.argv[1]
+    with open(sys.argv[2], 'r') as f:
+        changes = json.load(f)
+    update_model(model_path, changes.get("added", []), changes.get("removed", []), changes.get("changed", []))
+    print("DONE!")
@@ -1,4 +1,5 @@
 from os import listdir
+import multiprocessing
 import pandas as pd
 from datasketch import MinHash, MinHashLSH
 import numpy as np
@@ -56,6 +57,121 @@ def deserialize_store_mh(path1):
     return mh_kv
 
 
+# Batched MinHash: the signature of a whole column is computed with numpy instead of one MinHash.update per value.
+# Values are hashed to 64 bits with pandas, and each permutation is a multiply-add-shift universal hash of those,
+# h(x) = ((a * x + b) mod 2^64) >> 32 with a odd, so all the permutations of a chunk of values are a single matrix
+# operation. The signatures are not comparable with those of datasketch.MinHash, only among themselves
+
+MH_MAX_HASH = np.uint64((1 << 32) - 1)
+
+global mh_signatures
+mh_signatures = None  # (key_index, signatures matrix) of the stored signatures, see deserialize_store_mh_batched
+
+
+def mh_permutations(permutations=512, seed=1):
+    """
+    :return: (a, b) uint64 arrays with the parameters of each permutation
+    """
+    gen = np.random.RandomState(seed)
+    a = gen.randint(0, np.iinfo(np.int64).max, size=permutations, dtype=np.int64).astype(np.uint64) * 2 + 1
+    b = gen.randint(0, np.iinfo(np.int64).max, size=permutations, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def hash_values(values):
+    """
+    :return: uint64 array with a 64-bit hash of the string of each distinct value
+    """
+    strings = pd.Series(values, dtype=object).astype(str).values
+    return np.unique(pd.util.hash_array(strings, categorize=False))
+
+
+def get_mh_batched(values, permutations=512, chunk_size=1024, params=None):
+    """
+    :param values: the values of a column, duplicates are ignored
+    :param permutations: length of the signature
+    :param chunk_size: number of values hashed at once, which bounds the memory to chunk_size x permutations
+    :param params: the (a, b) of mh_permutations, to avoid recomputing them for every column
+    :return: uint64 array with the signature
+    """
+    a, b = params if params is not None else mh_permutations(permutations)
+    signature = np.full(len(a), MH_MAX_HASH, dtype=np.uint64)
+    hashes = hash_values(values)
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size].reshape(-1, 1)
+        # uint64 arithmetic wraps around, i.e., it is mod 2^64. In place, to avoid temporary matrices
+        permuted = chunk * a
+        permuted += b
+        permuted >>= np.uint64(32)
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature
+
+
+def jaccard_batched(signature1, signature2):
+    """
+    :return: the Jaccard similarity estimated from two signatures of get_mh_batched
+    """
+    return float(np.count_nonzero(signature1 == signature2)) / len(signature1)
+
+
+def _file_signatures(task):
+    path1, f, permutations = task
+    params = mh_permutations(permutations)
+    df1 = pd.read_csv(path1 + f, sep=";", dtype=str)
+    keys = []
+    signatures = np.empty((len(df1.columns), permutations), dtype=np.uint64)
+    for i, c in enumerate(df1.columns):
+        keys.append(f + c)
+        signatures[i] = get_mh_batched(df1[c].values, permutations, params=params)
+    return keys, signatures
+
+
+def _set_mh_signatures(signatures):
+    global mh_signatures
+    mh_signatures = signatures
+
+
+def _map_files(function, tasks, num_workers, signatures=None):
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(1, min(num_workers, len(tasks)))
+    if num_workers == 1:
+        return [function(task) for task in tasks]
+    # the workers get the stored signatures once, not with every task
+    with multiprocessing.Pool(processes=num_workers, initializer=_set_mh_signatures, initargs=(signatures,)) as pool:
+        return pool.map(function, tasks)
+
+
+def compute_and_store_mh_batched(path1, store_path, permutations=512, num_workers=None):
+    """
+    Same as compute_and_store_mh with get_mh_batched, with the files spread across a pool of processes. The
+    signatures are stored in store_path + str(permutations) + ".npz": a (num_columns, permutations) uint64 matrix
+    and the key (file + column) of each row
+    :param num_workers: number of processes, by default as many as cores
+    :return: (key_index, signatures) where key_index is a dict key -> row of signatures
+    """
+    st = time.time()
+    fnames = [f for f in listdir(path1)]
+    results = _map_files(_file_signatures, [(path1, f, permutations) for f in fnames], num_workers)
+    keys = [key for file_keys, _ in results for key in file_keys]
+    signatures = [file_signatures for _, file_signatures in results]
+    signatures = np.concatenate(signatures) if len(signatures) > 0 else np.empty((0, permutations), dtype=np.uint64)
+    np.savez(store_path + str(permutations) + ".npz", keys=np.asarray(keys, dtype=str), signatures=signatures)
+    et = time.time()
+    print("Time to compute signatures of " + str(len(keys)) + " columns: " + str(et - st))
+    return {key: i for i, key in enumerate(keys)}, signatures
+
+
+def deserialize_store_mh_batched(path1):
+    """
+    :return: (key_index, signatures) stored by compute_and_store_mh_batched
+    """
+    with np.load(path1) as stored:
+        keys = stored['keys'].tolist()
+        signatures = stored['signatures']
+    return {key: i for i, key in enumerate(keys)}, signatures
+
+
 def col2col_ress(path1, path2, sample_perc, store_path):
     with open(store_path, 'w') as fw:
         fnames = [f for f in listdir(path1)]
@@ -91,6 +207,82 @@ def col2col_ress(path1, path2, sample_perc, store_path):
                 print("EST-JS: " + str(scaled_est_js))
 
 
+def _file_ress(task):
+    path1, path2, f, sample_perc, seed = task
+    key_index, signatures = mh_signatures
+    params = mh_permutations(signatures.shape[1])
+    rnd = np.random.RandomState(seed)
+    df1 = pd.read_csv(path1 + f, sep=";", dtype=str)
+    df2 = pd.read_csv(path2 + f, sep=";", dtype=str)
+    lines = []
+    for c in df1.columns:
+        card1 = len(set(df1[c].values))
+        val2 = df2[c].drop_duplicates().values
+        sample_size = max(1, int(len(val2) * sample_perc))
+        val2 = rnd.choice(val2, sample_size, replace=False)
+        mh1 = signatures[key_index[f + c]]
+        mh2 = get_mh_batched(val2, signatures.shape[1], params=params)
+        card2 = len(val2)
+        if card1 == 0:
+            max_js = 0
+        else:
+            max_js = card2 / card1
+        est_js = jaccard_batched(mh1, mh2)
+        if max_js == 0:
+            scaled_est_js = 0
+        else:
+            scaled_est_js = est_js / max_js
+        lines.append(str(f)+"."+str(c)+","+str(max_js)+","+str(est_js)+","+str(scaled_est_js)+'\n')
+    return lines
+
+
+def col2col_ress_batched(path1, path2, sample_perc, store_path, num_workers=None):
+    """
+    Same scores as col2col_ress, with the signatures of get_mh_batched and the files spread across a pool of
+    processes. The signatures of path1 are those of the global mh_signatures, see deserialize_store_mh_batched
+    :param num_workers: number of processes, by default as many as cores
+    :return:
+    """
+    if mh_signatures is None:
+        print("ERROR load the signatures of " + str(path1) + " in mh_signatures first")
+        raise Exception
+    fnames = [f for f in listdir(path1)]
+    seeds = np.random.randint(0, np.iinfo(np.int32).max, size=len(fnames))
+    tasks = [(path1, path2, f, sample_perc, seed) for f, seed in zip(fnames, seeds)]
+    results = _map_files(_file_ress, tasks, num_workers, signatures=mh_signatures)
+    with open(store_path, 'w') as fw:
+        for lines in results:
+            for s in lines:
+                fw.write(s)
+
+
+def _file_js(task):
+    path1, path2, f = task
+    df1 = pd.read_csv(path1 + f, sep=";", dtype=str)
+    df2 = pd.read_csv(path2 + f, sep=";", dtype=str)
+    lines = []
+    for c in df1.columns:
+        val1 = set(df1[c].values)
+        val2 = set(df2[c].values)
+        js = len(val1.intersection(val2)) / len(val1.union(val2))
+        lines.append(str(f)+"."+str(c)+","+str(js)+'\n')
+    return lines
+
+
+def col2col_js_parallel(path1, path2, store_path, num_workers=None):
+    """
+    Same as col2col_js with the files spread across a pool of processes
+    :param num_workers: number of processes, by default as many as cores
+    :return:
+    """
+    fnames = [f for f in listdir(path1)]
+    results = _map_files(_file_js, [(path1, path2, f) for f in fnames], num_workers)
+    with open(store_path, 'w') as fw:
+        for lines in results:
+            for s in lines:
+                fw.write(s)
+
+
 def col2col_js(path1, path2, store_path):
     with open(store_path, 'w') as fw:
         fnames = [f for f in listdir(path1)]
@@ -331,7 +523,6 @@ if __name__ == "__main__":
     # cols_changed_more_than("/Users/ra-mit/data/ress_exp/s25/mh_scores.csv", 0.5)
     # exit()
 
-    global mh_kv
     mh_kv = deserialize_store_mh("/Users/ra-mit/data/ress_exp/mh_kv_512.pkl")
     # for k, v in mh_kv.items():
     #     print(str(k))
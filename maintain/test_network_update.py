@@ -0,0 +1,104 @@
+import unittest
+
+import numpy as np
+
+from api.apiutils import Relation
+from benchmarking.network_building_benchmarks import generate_field_names
+from benchmarking.network_building_benchmarks import generate_mh_signatures
+from benchmarking.network_building_benchmarks import generate_num_signatures
+from benchmarking.network_building_benchmarks import relation_edges
+from knowledgerepr import fieldnetwork
+from knowledgerepr import networkbuilder
+from knowledgerepr.fieldnetwork import FieldNetwork
+from maintain import network_update
+
+
+def synthetic_lake(num_sigs, mh_sigs):
+    """
+    :return: dict nid -> profile as StoreHandler.get_fields_profiles, with the given signatures and a name and
+    cardinality that depend on the nid only
+    """
+    profiles = dict()
+    for data_type, sigs in [("N", num_sigs), ("T", mh_sigs)]:
+        for nid, sig in sigs:
+            name = generate_field_names(1, seed=int(nid))[0]
+            unique_values = int(np.random.RandomState(int(nid)).randint(50, 101))
+            profiles[nid] = ("syndb", "synt" + str(int(nid) % 50), name, 100, unique_values, data_type,
+                             sig if data_type == "T" else None)
+    return profiles
+
+
+def build_from_scratch(profiles, num_sigs):
+    network = FieldNetwork()
+    network.init_meta_schema([(nid,) + profile[:6] for nid, profile in profiles.items()])
+    networkbuilder.build_schema_sim_relation_batched(network)
+    mh_nids = [nid for nid, profile in profiles.items() if profile[5] == "T"]
+    mh_signatures = np.asarray([profiles[nid][6] for nid in mh_nids], dtype=int)
+    content_sim_index = networkbuilder.build_content_sim_mh_text_matrix(network, mh_nids, mh_signatures,
+                                                                        num_workers=1)
+    networkbuilder.build_content_sim_relation_num_overlap_distr_arrays(
+        network, [nid for nid, _ in num_sigs], [sig for _, sig in num_sigs],
+        [isinstance(sig[0], int) and isinstance(sig[1], int) for _, sig in num_sigs])
+    networkbuilder.build_pkfk_relation(network)
+    return network, content_sim_index
+
+
+class TestNetworkUpdate(unittest.TestCase):
+
+    def test_update_same_as_rebuild(self):
+        print(self._testMethodName)
+        self.assert_update_same_as_rebuild(lambda network: network)
+
+    def test_update_compact_same_as_rebuild(self):
+        print(self._testMethodName)
+        self.assert_update_same_as_rebuild(fieldnetwork.compact_field_network)
+
+    def assert_update_same_as_rebuild(self, backend):
+        """
+        :param backend: converts the FieldNetwork built from scratch into the network that is updated
+        """
+        num_sigs = generate_num_signatures(300, seed=7)
+        mh_sigs = [(str(2000000 + i), sig) for i, (_, sig) in enumerate(generate_mh_signatures(200, seed=5))]
+        profiles = synthetic_lake(num_sigs, mh_sigs)
+        network, content_sim_index = build_from_scratch(profiles, num_sigs)
+        network = backend(network)
+
+        # Remove some columns, change the data of others and add some new ones
+        new_num_sigs = generate_num_signatures(320, seed=8)
+        new_mh_sigs = generate_mh_signatures(220, seed=6)
+        removed = {nid for nid, _ in num_sigs[:10]} | {nid for nid, _ in mh_sigs[:10]}
+        changed_num = {num_sigs[i][0]: new_num_sigs[i][1] for i in range(10, 20)}
+        changed_mh = {mh_sigs[i][0]: new_mh_sigs[i][1] for i in range(10, 20)}
+        added_num = [(str(int(nid) + 1000), sig) for nid, sig in new_num_sigs[300:]]
+        added_mh = [(str(2000000 + int(nid)), sig) for nid, sig in new_mh_sigs[200:]]
+
+        final_num_sigs = [(nid, changed_num.get(nid, sig)) for nid, sig in num_sigs if nid not in removed]
+        final_num_sigs += added_num
+        final_mh_sigs = [(nid, changed_mh.get(nid, sig)) for nid, sig in mh_sigs if nid not in removed]
+        final_mh_sigs += added_mh
+        final_profiles = synthetic_lake(final_num_sigs, final_mh_sigs)
+        expected, _ = build_from_scratch(final_profiles, final_num_sigs)
+
+        updated_profiles = {nid: final_profiles[nid] for nid in
+                            list(changed_num.keys()) + list(changed_mh.keys()) +
+                            [nid for nid, _ in added_num + added_mh]}
+        num_signatures = ([nid for nid, _ in final_num_sigs], np.asarray([sig for _, sig in final_num_sigs]),
+                          np.asarray([isinstance(s[0], int) and isinstance(s[1], int) for _, s in final_num_sigs]))
+        _, content_sim_index = network_update.update_network(network, None, content_sim_index, removed,
+                                                             updated_profiles, num_signatures)
+
+        self.assertEqual(sorted(expected.iterate_ids()), sorted(network.iterate_ids()))
+        for relation in [Relation.CONTENT_SIM, Relation.INCLUSION_DEPENDENCY, Relation.PKFK]:
+            expected_edges = relation_edges(expected, relation)
+            found = relation_edges(network, relation)
+            self.assertTrue(len(expected_edges) > 0)
+            self.assertEqual(expected_edges.keys(), found.keys())
+            for k, v in expected_edges.items():
+                self.assertAlmostEqual(v, found[k])
+        self.assertEqual(sorted(nid for nid, _ in final_mh_sigs), sorted(content_sim_index.ids))
+        for nid, mh_sig in final_mh_sigs:
+            self.assertIn(nid, content_sim_index.query(mh_sig))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from maintain import ress_utils
+
+
+def write_tables(path, num_files, seed=0):
+    rnd = np.random.RandomState(seed)
+    for i in range(num_files):
+        df = pd.DataFrame({"c" + str(j): rnd.randint(0, 300, size=200).astype(str) for j in range(3)})
+        df.to_csv(path + "t" + str(i) + ".csv", sep=";", index=False)
+
+
+class TestRessUtils(unittest.TestCase):
+
+    def test_batched_mh_estimates_jaccard(self):
+        print(self._testMethodName)
+
+        params = ress_utils.mh_permutations(512)
+        values = np.arange(2000)
+        for overlap in [0, 500, 1000, 1500, 2000]:
+            other = np.arange(2000 - overlap, 4000 - overlap)
+            expected = overlap / (4000 - overlap)
+            # same signature in chunks, and as strings, as read from the csv files
+            mh1 = ress_utils.get_mh_batched(values, params=params, chunk_size=300)
+            mh2 = ress_utils.get_mh_batched(other.astype(str), params=params)
+            self.assertTrue(abs(ress_utils.jaccard_batched(mh1, mh2) - expected) < 0.1)
+        self.assertTrue(np.array_equal(ress_utils.get_mh_batched(values, params=params),
+                                       ress_utils.get_mh_batched(np.concatenate([values, values])[::-1],
+                                                                 params=params)))
+
+    def test_parallel_same_as_serial(self):
+        print(self._testMethodName)
+
+        path1 = tempfile.mkdtemp() + "/"
+        path2 = tempfile.mkdtemp() + "/"
+        out = tempfile.mkdtemp() + "/"
+        write_tables(path1, 4, seed=1)
+        write_tables(path2, 4, seed=1)
+
+        serial_index, serial = ress_utils.compute_and_store_mh_batched(path1, out + "serial", 128, num_workers=1)
+        ress_utils.compute_and_store_mh_batched(path1, out + "parallel", 128, num_workers=2)
+        key_index, signatures = ress_utils.deserialize_store_mh_batched(out + "parallel128.npz")
+        self.assertEqual(serial_index, key_index)
+        self.assertEqual(12, len(key_index))
+        self.assertTrue(np.array_equal(serial, signatures))
+
+        ress_utils.mh_signatures = (key_index, signatures)
+        ress_utils.col2col_ress_batched(path1, path2, 1.0, out + "ress.csv", num_workers=2)
+        ress_utils.col2col_js_parallel(path1, path2, out + "js.csv", num_workers=2)
+        with open(out + "ress.csv") as f:
+            scores = [float(line.split(',')[-1]) for line in f]
+        with open(out + "js.csv") as f:
+            js = [float(line.split(',')[-1]) for line in f]
+        # the files did not change
+        self.assertEqual([1.0] * 12, scores)
+        self.assertEqual([1.0] * 12, js)
+        self.assertTrue(os.path.isfile(out + "serial128.npz"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
 import re
+import threading
+import queue
 from datetime import datetime
 from elasticsearch import Elasticsearch
 
 from enum import Enum
 from collections import defaultdict
+import numpy as np
 
 from api.apiutils import Hit
 from api.annotation import MDHit, MDComment
@@ -141,6 +144,33 @@ class StoreHandler:
             scroll_id = res['_scroll_id']  # update the scroll_id
         client.clear_scroll(scroll_id=scroll_id)
 
+    def keyword_query(self, keywords, elasticfieldname, max_hits=15, exact=False):
+        """
+        Index and body of the query that matches keywords in elasticfieldname
+        :param exact: term query on the not analyzed fields if True, match query on the analyzed fields otherwise
+        :return: (index, query body)
+        """
+        query = "term" if exact else "match"
+        if elasticfieldname == KWType.KW_CONTENT:
+            return "text", {"from": 0, "size": max_hits, "query": {query: {"text": keywords}}}
+        elif elasticfieldname == KWType.KW_SCHEMA:
+            field = "columnNameNA" if exact else "columnName"
+            return "profile", {"from": 0, "size": max_hits, "query": {query: {field: keywords}}}
+        elif elasticfieldname == KWType.KW_ENTITIES:
+            return "profile", {"from": 0, "size": max_hits, "query": {query: {"entities": keywords}}}
+        elif elasticfieldname == KWType.KW_TABLE:
+            field = "sourceNameNA" if exact else "sourceName"
+            return "profile", {"from": 0, "size": max_hits, "query": {query: {field: keywords}}}
+        return None, None
+
+    def _hits_of(self, res):
+        if res['hits']['total'] == 0:
+            return []
+        for el in res['hits']['hits']:
+            data = Hit(str(el['_source']['id']), el['_source']['dbName'], el['_source']['sourceName'],
+                       el['_source']['columnName'], el['_score'])
+            yield data
+
     def exact_search_keywords(self, keywords, elasticfieldname, max_hits=15):
         """
         Like search_keywords, but returning only exact results
@@ -149,38 +179,16 @@ class StoreHandler:
         :param max_hits:
         :return:
         """
-        index = None
-        query_body = None
         filter_path = ['hits.hits._source.id',
                        'hits.hits._score',
                        'hits.total',
                        'hits.hits._source.dbName',
                        'hits.hits._source.sourceName',
                        'hits.hits._source.columnName']
-        if elasticfieldname == KWType.KW_CONTENT:
-            index = "text"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"term": {"text": keywords}}}
-        elif elasticfieldname == KWType.KW_SCHEMA:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"term": {"columnNameNA": keywords}}}
-        elif elasticfieldname == KWType.KW_ENTITIES:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"term": {"entities": keywords}}}
-        elif elasticfieldname == KWType.KW_TABLE:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"term": {"sourceNameNA": keywords}}}
+        index, query_body = self.keyword_query(keywords, elasticfieldname, max_hits=max_hits, exact=True)
         res = client.search(index=index, body=query_body,
                             filter_path=filter_path)
-        if res['hits']['total'] == 0:
-            return []
-        for el in res['hits']['hits']:
-            data = Hit(str(el['_source']['id']), el['_source']['dbName'], el['_source']['sourceName'],
-                       el['_source']['columnName'], el['_score'])
-            yield data
+        return self._hits_of(res)
 
     def search_keywords(self, keywords, elasticfieldname, max_hits=15):
         """
@@ -189,38 +197,61 @@ class StoreHandler:
         :param elasticfieldname: what is the field in the store where to apply the query
         :return: the list of documents that contain the keywords
         """
-        index = None
-        query_body = None
         filter_path = ['hits.hits._source.id',
                        'hits.hits._score',
                        'hits.total',
                        'hits.hits._source.dbName',
                        'hits.hits._source.sourceName',
                        'hits.hits._source.columnName']
-        if elasticfieldname == KWType.KW_CONTENT:
-            index = "text"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"match": {"text": keywords}}}
-        elif elasticfieldname == KWType.KW_SCHEMA:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"match": {"columnName": keywords}}}
-        elif elasticfieldname == KWType.KW_ENTITIES:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"match": {"entities": keywords}}}
-        elif elasticfieldname == KWType.KW_TABLE:
-            index = "profile"
-            query_body = {"from": 0, "size": max_hits,
-                          "query": {"match": {"sourceName": keywords}}}
+        index, query_body = self.keyword_query(keywords, elasticfieldname, max_hits=max_hits)
         res = client.search(index=index, body=query_body,
                             filter_path=filter_path)
-        if res['hits']['total'] == 0:
+        return self._hits_of(res)
+
+    def multi_search_keywords(self, queries):
+        """
+        Runs many keyword queries in a single _msearch request
+        :param queries: list of (keywords, elasticfieldname, max_hits, exact)
+        :return: list with the list of Hit of each query, in the same order
+        """
+        if len(queries) == 0:
             return []
-        for el in res['hits']['hits']:
-            data = Hit(str(el['_source']['id']), el['_source']['dbName'], el['_source']['sourceName'],
-                       el['_source']['columnName'], el['_score'])
-            yield data
+        # every response keeps hits.total, or error, so the responses stay aligned with the queries
+        filter_path = ['responses.error',
+                       'responses.hits.total',
+                       'responses.hits.hits._source.id',
+                       'responses.hits.hits._score',
+                       'responses.hits.hits._source.dbName',
+                       'responses.hits.hits._source.sourceName',
+                       'responses.hits.hits._source.columnName']
+        body = []
+        for keywords, elasticfieldname, max_hits, exact in queries:
+            index, query_body = self.keyword_query(keywords, elasticfieldname, max_hits=max_hits, exact=exact)
+            body.append({"index": index})
+            body.append(query_body)
+        res = client.msearch(body=body, filter_path=filter_path)
+        results = []
+        for (keywords, _, _, _), response in zip(queries, res['responses']):
+            if 'error' in response:
+                print("ERROR in search of: " + str(keywords) + " " + str(response['error']))
+                results.append([])
+                continue
+            results.append(list(self._hits_of(response)))
+        return results
+
+    def search_keywords_batch(self, keywords_list, elasticfieldname, max_hits=15):
+        """
+        search_keywords of each keywords in keywords_list, in a single request
+        :return: list with the list of Hit of each keywords
+        """
+        return self.multi_search_keywords([(kw, elasticfieldname, max_hits, False) for kw in keywords_list])
+
+    def exact_search_keywords_batch(self, keywords_list, elasticfieldname, max_hits=15):
+        """
+        exact_search_keywords of each keywords in keywords_list, in a single request
+        :return: list with the list of Hit of each keywords
+        """
+        return self.multi_search_keywords([(kw, elasticfieldname, max_hits, True) for kw in keywords_list])
 
     def fuzzy_keyword_match(self, keywords, max_hits=15):
         """
@@ -429,6 +460,50 @@ class StoreHandler:
         client.clear_scroll(scroll_id=scroll_id)
         return id_sig
 
+    def get_fields_sketches(self, nids):
+        """
+        Retrieves the number of values, of distinct values, and the minhash of the given fields
+        :param nids: ids of the fields
+        :return: dict nid -> (totalValues, uniqueValues, minhash), minhash is None for fields without one
+        """
+        nids = [str(nid) for nid in nids]
+        if len(nids) == 0:
+            return dict()
+        body = {"query": {"ids": {"values": nids}}, "size": len(nids)}
+        res = client.search(index='profile', body=body,
+                            filter_path=['hits.hits._id',
+                                         'hits.hits._source.totalValues',
+                                         'hits.hits._source.uniqueValues',
+                                         'hits.hits._source.minhash']
+                            )
+        sketches = dict()
+        for h in res.get('hits', dict()).get('hits', []):
+            source = h['_source']
+            sketches[h['_id']] = (source.get('totalValues'), source.get('uniqueValues'), source.get('minhash'))
+        return sketches
+
+    def get_fields_profiles(self, nids, page_size=c.export_page_size):
+        """
+        Retrieves the profile of the given fields, e.g., the fields added or changed since the network was built
+        :param nids: ids of the fields
+        :param page_size: number of fields retrieved per request
+        :return: dict nid -> (dbName, sourceName, columnName, totalValues, uniqueValues, dataType, minhash), minhash
+        is None for fields without one. Fields that are not in the store are missing
+        """
+        nids = [str(nid) for nid in nids]
+        source_fields = ['dbName', 'sourceName', 'columnName', 'totalValues', 'uniqueValues', 'dataType', 'minhash']
+        profiles = dict()
+        for start in range(0, len(nids), page_size):
+            page = nids[start:start + page_size]
+            body = {"query": {"ids": {"values": page}}, "size": len(page)}
+            res = client.search(index='profile', body=body,
+                                filter_path=['hits.hits._id'] + ['hits.hits._source.' + f for f in source_fields])
+            for h in res.get('hits', dict()).get('hits', []):
+                s = h['_source']
+                profiles[h['_id']] = (s['dbName'], s['sourceName'], s['columnName'], s['totalValues'],
+                                      s['uniqueValues'], s['dataType'], s.get('minhash'))
+        return profiles
+
     def get_all_fields_num_signatures(self):
         """
         Retrieves numerical fields and signatures from the store
@@ -468,6 +543,132 @@ class StoreHandler:
         client.clear_scroll(scroll_id=scroll_id)
         return id_sig
 
+    def _scroll_slices(self, query_body, source_fields, num_slices, page_size):
+        """
+        Scrolls the profile index with num_slices sliced scrolls, each one in its own thread
+        :param query_body: the query to scroll
+        :param source_fields: fields of _source to retrieve for each hit
+        :param num_slices: number of slices (and threads) to split the scroll into
+        :param page_size: number of hits retrieved per scroll request
+        :return: generator of pages (lists of hits), in no particular order among slices
+        """
+        filter_path = ['_scroll_id', 'hits.hits._id'] + ['hits.hits._source.' + f for f in source_fields]
+        pages = queue.Queue(maxsize=2 * num_slices)  # bounded so that downloading does not outrun the consumer
+        done = object()
+        stop = threading.Event()  # set when the consumer is gone, so that the threads stop and clear their scrolls
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scroll_slice(slice_id):
+            scroll_id = None
+            try:
+                body = dict(query_body)
+                if num_slices > 1:
+                    body["slice"] = {"id": slice_id, "max": num_slices}
+                res = client.search(index='profile', body=body, scroll="10m", size=page_size,
+                                    filter_path=filter_path)
+                scroll_id = res.get('_scroll_id')
+                hits = res.get('hits', {}).get('hits', [])
+                while len(hits) > 0 and put(hits):
+                    res = client.scroll(scroll="5m", scroll_id=scroll_id, filter_path=filter_path)
+                    scroll_id = res.get('_scroll_id')
+                    hits = res.get('hits', {}).get('hits', [])
+            except Exception as e:
+                put(e)
+            finally:
+                try:
+                    if scroll_id is not None:
+                        client.clear_scroll(scroll_id=scroll_id)
+                finally:
+                    put(done)
+
+        workers = [threading.Thread(target=scroll_slice, args=(i,), daemon=True) for i in range(num_slices)]
+        for w in workers:
+            w.start()
+        try:
+            remaining = num_slices
+            while remaining > 0:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            # unblock the threads if the consumer stopped early, and wait until they cleared their scrolls
+            stop.set()
+            for w in workers:
+                w.join()
+
+    def stream_mh_text_signatures(self, batch_size=c.export_batch_size, num_slices=c.export_num_slices,
+                                  page_size=c.export_page_size):
+        """
+        Same signatures as get_all_mh_text_signatures, but streamed in fixed-size batches that are ready as soon
+        as enough hits have been downloaded
+        :param batch_size: number of signatures per batch, the last one may be smaller
+        :param num_slices: number of parallel sliced scrolls
+        :param page_size: number of hits retrieved per scroll request
+        :return: generator of (nids, mh) where mh is a (len(nids), k) uint64 matrix
+        """
+        query_body = {
+            "query": {"bool": {"filter": [{"term": {"dataType": "T"}}]}}}
+        nids = []
+        rows = []
+        for page in self._scroll_slices(query_body, ['minhash'], num_slices, page_size):
+            for h in page:
+                nids.append(h['_id'])
+                rows.append(h['_source']['minhash'])
+            while len(nids) >= batch_size:
+                yield nids[:batch_size], self._to_uint64_matrix(rows[:batch_size])
+                nids = nids[batch_size:]
+                rows = rows[batch_size:]
+        if len(nids) > 0:
+            yield nids, self._to_uint64_matrix(rows)
+
+    def _to_uint64_matrix(self, rows):
+        # Signed values (e.g., java longs) keep their bits
+        return np.asarray(rows, dtype=np.int64).view(np.uint64)
+
+    def stream_fields_num_signatures(self, batch_size=c.export_batch_size, num_slices=c.export_num_slices,
+                                     page_size=c.export_page_size):
+        """
+        Same signatures as get_all_fields_num_signatures, but streamed in fixed-size batches that are ready as soon
+        as enough hits have been downloaded
+        :param batch_size: number of signatures per batch, the last one may be smaller
+        :param num_slices: number of parallel sliced scrolls
+        :param page_size: number of hits retrieved per scroll request
+        :return: generator of (nids, sigs, is_int) where sigs is a (len(nids), 4) float64 matrix with median, iqr,
+        minValue and maxValue, and is_int tells whether median and iqr were stored as integers
+        """
+        query_body = {
+            "query": {"bool": {"filter": [{"term": {"dataType": "N"}}]}}}
+        source_fields = ['median', 'iqr', 'minValue', 'maxValue']
+        nids = []
+        rows = []
+        is_int = []
+        for page in self._scroll_slices(query_body, source_fields, num_slices, page_size):
+            for h in page:
+                s = h['_source']
+                nids.append(h['_id'])
+                rows.append((s['median'], s['iqr'], s['minValue'], s['maxValue']))
+                is_int.append(not isinstance(s['median'], float) and not isinstance(s['iqr'], float))
+            while len(nids) >= batch_size:
+                yield nids[:batch_size], np.asarray(rows[:batch_size], dtype=np.float64), \
+                    np.asarray(is_int[:batch_size], dtype=bool)
+                nids = nids[batch_size:]
+                rows = rows[batch_size:]
+                is_int = is_int[batch_size:]
+        if len(nids) > 0:
+            yield nids, np.asarray(rows, dtype=np.float64), np.asarray(is_int, dtype=bool)
+
     """
     Metadata
     """
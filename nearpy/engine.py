@@ -23,6 +23,7 @@
 import json
 
 import numpy as np
+import scipy.sparse
 
 from nearpy.hashes import RandomBinaryProjections
 from nearpy.hashes import PCABinaryProjections
@@ -92,6 +93,10 @@ class Engine(object):
         The data argument must be JSON-serializable. It is stored with the
         vector and will be returned in search results.
         """
+        if not scipy.sparse.issparse(v) and \
+                self._hash_matrices(_as_row(v)) is not None:
+            self.store_vectors(_as_row(v), [data])
+            return
         # We will store the normalized vector (used during retrieval)
         nv = unitvec(v)
         # Store vector in each bucket of all hashes
@@ -101,6 +106,27 @@ class Engine(object):
                 self.storage.store_vector(lshash.hash_name, bucket_key,
                                           nv, data)
 
+    def store_vectors(self, matrix, keys):
+        """
+        Hashes every row of matrix and stores it in all matching buckets in
+        the storage, row i with keys[i] as data. Hashes with integer keys
+        hash all rows with one matrix product, and storages with bucket
+        blocks keep the vectors of each bucket in one contiguous block.
+        """
+        nm = _unit_rows(matrix)
+        bucket_keys = self._hash_matrices(matrix)
+        if bucket_keys is not None:
+            for lshash, lshash_keys in zip(self.lshashes, bucket_keys):
+                self.storage.store_vectors(lshash.hash_name, lshash_keys,
+                                           nm, keys)
+            return
+        for i in range(matrix.shape[0]):
+            v, nv = _vector_of(matrix, i), _vector_of(nm, i)
+            for lshash in self.lshashes:
+                for bucket_key in lshash.hash_vector(v):
+                    self.storage.store_vector(lshash.hash_name, bucket_key,
+                                              nv, keys[i])
+
     def candidate_count(self, v):
         """
         Returns candidate count for nearest neighbour search for specified vector.
@@ -125,6 +151,9 @@ class Engine(object):
         finally the (optional) filter function to construct the returned list
         of either (vector, data, distance) tuples or (vector, data) tuples.
         """
+        if not scipy.sparse.issparse(v) and \
+                self._hash_matrices(_as_row(v)) is not None:
+            return self.neighbours_batch(_as_row(v))[0]
 
         # Collect candidates from all buckets from all hashes
         candidates = self._get_candidates(v)
@@ -146,6 +175,103 @@ class Engine(object):
         # If there is no vector filter, just return list of candidates
         return candidates
 
+    def neighbours_batch(self, matrix):
+        """
+        Like neighbours for every row of matrix, returns a list with the
+        result of each row. With integer keys and bucket blocks, all rows are
+        hashed with one matrix product and the distances of the rows that
+        fall in a bucket to the vectors in the bucket are one matrix product.
+        """
+        bucket_keys = self._hash_matrices(matrix)
+        if bucket_keys is None:
+            return [self.neighbours(_vector_of(matrix, i))
+                    for i in range(matrix.shape[0])]
+        nm = _unit_rows(matrix)
+        candidates = [[] for _ in range(matrix.shape[0])]
+        for lshash, lshash_keys in zip(self.lshashes, bucket_keys):
+            query_rows, query_keys = self._probes(lshash, lshash_keys)
+            order = np.argsort(query_keys, kind='mergesort')
+            sorted_keys = query_keys[order]
+            boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+            for probes in np.split(order, boundaries):
+                if len(probes) == 0:
+                    continue
+                rows = query_rows[probes]
+                block = self.storage.get_block(lshash.hash_name,
+                                               query_keys[probes[0]])
+                if block is None:
+                    continue
+                vectors, data = block
+                if self.distance:
+                    queries = nm[rows]
+                    if scipy.sparse.issparse(queries):
+                        queries = queries.toarray()
+                    distances = self._block_distances(vectors, queries)
+                    for j, row in enumerate(rows):
+                        candidates[row].extend(
+                            zip(vectors, data, distances[:, j]))
+                else:
+                    for row in rows:
+                        candidates[row].extend(zip(vectors, data))
+
+        results = []
+        for row_candidates in candidates:
+            # Apply fetch vector filters if specified and return filtered list
+            if self.fetch_vector_filters:
+                row_candidates = self._apply_filter(
+                    self.fetch_vector_filters, row_candidates)
+            # Apply vector filters if specified and return filtered list
+            if self.vector_filters:
+                row_candidates = self._apply_filter(
+                    self.vector_filters, row_candidates)
+            results.append(row_candidates)
+        return results
+
+    def _hash_matrices(self, matrix):
+        """
+        Integer bucket keys of every row of matrix for each hash, or None if
+        some hash has no integer keys or the storage keeps no bucket blocks
+        """
+        if not hasattr(self.storage, 'store_vectors'):
+            return None
+        bucket_keys = []
+        for lshash in self.lshashes:
+            lshash_keys = lshash.hash_matrix(matrix)
+            if lshash_keys is None:
+                return None
+            bucket_keys.append(lshash_keys)
+        return bucket_keys
+
+    def _probes(self, lshash, lshash_keys):
+        """
+        Rows of the queries and keys of the buckets they probe. With
+        multi-probe, the probed keys that have no block in the storage are
+        dropped before looking up the blocks one by one.
+        """
+        masks = lshash.probe_masks()
+        if masks is None:
+            return np.arange(len(lshash_keys)), lshash_keys
+        query_keys = (lshash_keys[:, None] ^ masks[None, :]).ravel()
+        query_rows = np.repeat(np.arange(len(lshash_keys)), len(masks))
+        stored = np.isin(query_keys,
+                         self.storage.block_keys(lshash.hash_name))
+        return query_rows[stored], query_keys[stored]
+
+    def _block_distances(self, vectors, queries):
+        """
+        Distances between the rows of vectors and the rows of queries, both
+        normalized, as a (vectors, queries) matrix
+        """
+        if isinstance(self.distance, CosineDistance):
+            return 1.0 - np.dot(vectors, queries.T)
+        if isinstance(self.distance, EuclideanDistance):
+            squared = (vectors ** 2).sum(axis=1)[:, None] \
+                + (queries ** 2).sum(axis=1)[None, :] \
+                - 2.0 * np.dot(vectors, queries.T)
+            return np.sqrt(np.maximum(squared, 0.0))
+        return np.array([[self.distance.distance(x, q) for q in queries]
+                         for x in vectors]).reshape(len(vectors), len(queries))
+
     def _get_candidates(self, v):
         """ Collect candidates from all buckets from all hashes """
         candidates = []
@@ -185,3 +311,28 @@ class Engine(object):
     def clean_buckets(self, hash_name):
         """ Clears buckets in storage (removes all vectors and their data). """
         self.storage.clean_buckets(hash_name)
+
+
+def _as_row(v):
+    """ Dense vector v as a matrix with one row """
+    return np.asarray(v).reshape(1, -1)
+
+
+def _vector_of(matrix, i):
+    """ Row i of matrix as the vectors store_vector receives """
+    if scipy.sparse.issparse(matrix):
+        return matrix[i].T
+    return np.asarray(matrix[i]).ravel()
+
+
+def _unit_rows(matrix):
+    """ Scales every row of matrix to unit length, zero rows are kept """
+    if scipy.sparse.issparse(matrix):
+        matrix = scipy.sparse.csr_matrix(matrix, dtype=float)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return scipy.sparse.diags(1.0 / norms).dot(matrix).tocsr()
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
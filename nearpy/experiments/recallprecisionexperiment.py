@@ -200,8 +200,11 @@ class RecallPrecisionExperiment(object):
         return result
 
     def __vector_to_string(self, vector):
-        """ Returns string representation of vector. """
-        return numpy.array_str(numpy.round(unitvec(vector), decimals=3))
+        """
+        Returns byte representation of the rounded vector. array_str would
+        elide the middle of vectors with more than 1000 components.
+        """
+        return (numpy.round(unitvec(vector), decimals=3) + 0.0).tobytes()
 
     def __index_of_vector(self, vector):
         """ Returns index of specified vector from test data set. """
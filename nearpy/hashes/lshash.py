@@ -44,6 +44,23 @@ class LSHash(object):
         """
         raise NotImplementedError
 
+    def hash_matrix(self, matrix):
+        """
+        Hashes every row of matrix at once and returns a uint64 array with
+        the bucket key of each row, or None if the hash has no integer keys.
+        Integer keys are only used by storages that keep bucket blocks.
+        """
+        return None
+
+    def probe_masks(self):
+        """
+        Returns a uint64 array of masks that are XOR-ed with the integer key
+        of a query to get the keys of all the buckets to probe, the first one
+        being 0 for the bucket of the query, or None if only that bucket is
+        probed.
+        """
+        return None
+
     def get_config(self):
         """
         Returns pickle-serializable configuration struct for storage.
@@ -20,6 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import itertools
+
 import numpy
 import scipy
 import scipy.sparse
@@ -36,7 +38,8 @@ class RandomBinaryProjections(LSHash):
     for storage.
     """
 
-    def __init__(self, hash_name, projection_count, rand_seed=None):
+    def __init__(self, hash_name, projection_count, rand_seed=None,
+                 probe_distance=0):
         """
         Creates projection_count random vectors, that are used for projections
         thus working as normals of random hyperplanes. Each random vector /
@@ -44,13 +47,20 @@ class RandomBinaryProjections(LSHash):
 
         So if you for example decide to use projection_count=10, the bucket
         keys will have 10 digits and will look like '1010110011'.
+
+        When querying, the buckets whose keys differ from the key of the
+        query in up to probe_distance bits are also probed (multi-probe), so
+        near neighbours on the other side of a few hyperplanes are found
+        without more hash tables.
         """
         super(RandomBinaryProjections, self).__init__(hash_name)
         self.projection_count = projection_count
+        self.probe_distance = probe_distance
         self.dim = None
         self.normals = None
         self.rand = numpy.random.RandomState(rand_seed)
         self.normals_csr = None
+        self.masks = {}
 
     def reset(self, dim):
         """ Resets / Initializes the hash for the specified dimension. """
@@ -76,7 +86,63 @@ class RandomBinaryProjections(LSHash):
             # Project vector onto all hyperplane normals
             projection = numpy.dot(self.normals, v)
         # Return binary key
-        return [''.join(['1' if x > 0.0 else '0' for x in projection])]
+        key = ''.join(['1' if x > 0.0 else '0' for x in projection])
+        if not querying or self.probe_distance == 0:
+            return [key]
+        # Keys of the buckets to probe, the bucket of the query first
+        return [self._flip_bits(key, bits) for bits in self._probe_bits()]
+
+    def _probe_bits(self):
+        """
+        Positions of the bits to flip for every bucket to probe, from the
+        least to the most distant
+        """
+        positions = range(self.projection_count)
+        probes = []
+        for distance in range(min(self.probe_distance,
+                                  self.projection_count) + 1):
+            probes.extend(itertools.combinations(positions, distance))
+        return probes
+
+    def _flip_bits(self, key, bits):
+        key = list(key)
+        for i in bits:
+            key[i] = '1' if key[i] == '0' else '0'
+        return ''.join(key)
+
+    def probe_masks(self):
+        """
+        Masks of the buckets within probe_distance of a packed key, see
+        hash_matrix. None without multi-probe or with string keys only.
+        """
+        if self.probe_distance == 0 or self.projection_count > 64:
+            return None
+        config = (self.projection_count, self.probe_distance)
+        if config not in self.masks:
+            # bit 0 is the first character of the string key, the MSB
+            weights = numpy.left_shift(numpy.uint64(1), numpy.arange(
+                self.projection_count - 1, -1, -1, dtype=numpy.uint64))
+            self.masks[config] = numpy.array(
+                [numpy.bitwise_or.reduce(weights[list(bits)]) if bits
+                 else 0 for bits in self._probe_bits()], dtype=numpy.uint64)
+        return self.masks[config]
+
+    def hash_matrix(self, matrix):
+        """
+        Hashes every row of matrix with one matrix product. The bits of each
+        row are packed into a uint64 key whose binary representation is the
+        string key of hash_vector. None if there are more than 64 projections.
+        """
+        if self.projection_count > 64:
+            return None
+        if scipy.sparse.issparse(matrix):
+            projection = numpy.asarray(matrix.dot(self.normals.T))
+        else:
+            projection = numpy.dot(numpy.atleast_2d(matrix), self.normals.T)
+        weights = numpy.left_shift(numpy.uint64(1), numpy.arange(
+            self.projection_count - 1, -1, -1, dtype=numpy.uint64))
+        bits = (projection > 0.0).astype(numpy.uint64)
+        return (bits * weights).sum(axis=1, dtype=numpy.uint64)
 
     def get_config(self):
         """
@@ -87,6 +153,7 @@ class RandomBinaryProjections(LSHash):
             'hash_name': self.hash_name,
             'dim': self.dim,
             'projection_count': self.projection_count,
+            'probe_distance': self.probe_distance,
             'normals': self.normals
         }
 
@@ -97,4 +164,5 @@ class RandomBinaryProjections(LSHash):
         self.hash_name = config['hash_name']
         self.dim = config['dim']
         self.projection_count = config['projection_count']
+        self.probe_distance = config.get('probe_distance', 0)
         self.normals = config['normals']
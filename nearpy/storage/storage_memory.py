@@ -27,6 +27,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import numpy
+import scipy.sparse
+
 from nearpy.storage.storage import Storage
 
 
@@ -35,6 +38,10 @@ class MemoryStorage(Storage):
 
     def __init__(self):
         self.buckets = {}
+        # hash_name -> {uint64 key: [vectors with spare capacity, count, data]}
+        self.blocks = {}
+        # hash_name -> sorted uint64 keys of the blocks, None when stale
+        self.sorted_block_keys = {}
         self.hash_configs = {}
 
     def store_vector(self, hash_name, bucket_key, v, data):
@@ -49,26 +56,92 @@ class MemoryStorage(Storage):
             self.buckets[hash_name][bucket_key] = []
         self.buckets[hash_name][bucket_key].append((v, data))
 
+    def store_vectors(self, hash_name, bucket_keys, vectors, data):
+        """
+        Stores row i of vectors with data[i] in the bucket with integer key
+        bucket_keys[i]. The vectors of each bucket are kept in one contiguous
+        dense block, that grows by doubling.
+        """
+        blocks = self.blocks.setdefault(hash_name, {})
+        self.sorted_block_keys[hash_name] = None
+        order = numpy.argsort(bucket_keys, kind='mergesort')
+        sorted_keys = bucket_keys[order]
+        boundaries = numpy.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        for rows in numpy.split(order, boundaries):
+            if len(rows) == 0:
+                continue
+            new_vectors = vectors[rows]
+            if scipy.sparse.issparse(new_vectors):
+                new_vectors = new_vectors.toarray()
+            key = int(bucket_keys[rows[0]])
+            if key not in blocks:
+                blocks[key] = [numpy.empty((0, new_vectors.shape[1])), 0, []]
+            block = blocks[key]
+            count = block[1] + len(rows)
+            if count > block[0].shape[0]:
+                grown = numpy.empty((max(count, 2 * block[0].shape[0]),
+                                     new_vectors.shape[1]))
+                grown[:block[1]] = block[0][:block[1]]
+                block[0] = grown
+            block[0][block[1]:count] = new_vectors
+            block[1] = count
+            block[2].extend(data[i] for i in rows)
+
+    def get_block(self, hash_name, bucket_key):
+        """
+        Returns (vectors, data) of the bucket with integer key bucket_key,
+        vectors as one matrix with a row per vector, or None if it's empty.
+        """
+        block = self.blocks.get(hash_name, {}).get(int(bucket_key))
+        if block is None:
+            return None
+        return block[0][:block[1]], block[2]
+
+    def block_keys(self, hash_name):
+        """
+        Returns the sorted uint64 keys of the non-empty blocks of the hash.
+        """
+        keys = self.sorted_block_keys.get(hash_name)
+        if keys is None:
+            keys = numpy.sort(numpy.fromiter(
+                self.blocks.get(hash_name, {}).keys(), dtype=numpy.uint64))
+            self.sorted_block_keys[hash_name] = keys
+        return keys
+
     def get_bucket(self, hash_name, bucket_key):
         """
         Returns bucket content as list of tuples (vector, data).
         """
+        bucket = []
         if hash_name in self.buckets:
             if bucket_key in self.buckets[hash_name]:
-                return self.buckets[hash_name][bucket_key]
-        return []
+                bucket = self.buckets[hash_name][bucket_key]
+        if hash_name in self.blocks:
+            # a binary string key is also the key of the block with its value
+            if isinstance(bucket_key, str) and len(bucket_key) > 0 \
+                    and set(bucket_key) <= set('01'):
+                bucket_key = int(bucket_key, 2)
+            if isinstance(bucket_key, (int, numpy.integer)):
+                block = self.get_block(hash_name, bucket_key)
+                if block is not None:
+                    bucket = bucket + list(zip(block[0], block[1]))
+        return bucket
 
     def clean_buckets(self, hash_name):
         """
         Removes all buckets and their content for specified hash.
         """
         self.buckets[hash_name] = {}
+        self.blocks[hash_name] = {}
+        self.sorted_block_keys[hash_name] = None
 
     def clean_all_buckets(self):
         """
         Removes all buckets from all hashes and their content.
         """
         self.buckets = {}
+        self.blocks = {}
+        self.sorted_block_keys = {}
 
     def store_hash_configuration(self, lshash):
         """
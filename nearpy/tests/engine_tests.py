@@ -25,6 +25,7 @@ import scipy
 import unittest
 
 from nearpy import Engine
+from nearpy.hashes import RandomBinaryProjections
 from nearpy.utils.utils import unitvec
 
 
@@ -75,5 +76,52 @@ class TestEngine(unittest.TestCase):
             self.assertEqual(y_data, x_data)
             self.assertAlmostEqual(y_distance, 0.0, delta=delta)
 
+    def test_batch_retrieval(self):
+        engine = Engine(100, lshashes=[RandomBinaryProjections('a', 6),
+                                       RandomBinaryProjections('b', 4)])
+        x = numpy.random.randn(500, 100)
+        engine.store_vectors(x, list(range(500)))
+        # vectors stored one by one go to the same buckets
+        engine.store_vector(x[0], 500)
+
+        n = engine.neighbours_batch(x[:50])
+        self.assertEqual(len(n), 50)
+        for k in range(50):
+            # x[0] and 500 are at the same distance, in any order
+            self.assertEqual({d for _, d, _ in n[k]},
+                             {d for _, d, _ in engine.neighbours(x[k])})
+            candidates = engine._get_candidates(x[k])
+            expected = sorted(
+                {data: 1.0 - numpy.dot(v, unitvec(x[k]))
+                 for v, data in candidates}.items(), key=lambda c: c[1])
+            self.assertEqual({d for d, _ in expected[:10]},
+                             {d for _, d, _ in n[k]})
+            self.assertTrue(numpy.allclose([d for _, d in expected[:10]],
+                                           [d for _, _, d in n[k]]))
+        self.assertTrue(500 in [d for _, d, _ in n[0]])
+
+    def test_multi_probe_retrieval(self):
+        probing = RandomBinaryProjections('a', 8, rand_seed=1,
+                                          probe_distance=2)
+        engine = Engine(100, lshashes=[probing])
+        # 1 + 8 + 28 buckets within 2 bits
+        self.assertEqual(len(probing.hash_vector(numpy.ones(100),
+                                                 querying=True)), 37)
+        single = Engine(100, lshashes=[RandomBinaryProjections(
+            'a', 8, rand_seed=1)])
+        x = numpy.random.randn(500, 100)
+        engine.store_vectors(x, list(range(500)))
+        single.store_vectors(x, list(range(500)))
+
+        n = engine.neighbours_batch(x[:50])
+        for k in range(50):
+            candidates = engine._get_candidates(x[k])
+            self.assertTrue(len(candidates) >= single.candidate_count(x[k]))
+            expected = sorted(
+                {data: 1.0 - numpy.dot(v, unitvec(x[k]))
+                 for v, data in candidates}.items(), key=lambda c: c[1])
+            self.assertEqual([d for d, _ in expected[:10]],
+                             [d for _, d, _ in n[k]])
+
 if __name__ == '__main__':
     unittest.main()
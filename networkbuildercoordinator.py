@@ -1,11 +1,15 @@
 from modelstore.elasticstore import StoreHandler
 from knowledgerepr import fieldnetwork
 from knowledgerepr import networkbuilder
+from knowledgerepr import indexformat
+from knowledgerepr import modelformat
 from knowledgerepr.fieldnetwork import FieldNetwork
-from inputoutput import inputoutput as io
 
 import sys
 import time
+import numpy as np
+
+import config as c
 
 
 def main(output_path=None):
@@ -25,7 +29,8 @@ def main(output_path=None):
 
     # Schema_sim relation
     start_schema_sim = time.time()
-    schema_sim_index = networkbuilder.build_schema_sim_relation(network)
+    #schema_sim_index = networkbuilder.build_schema_sim_relation(network)
+    schema_sim_index = networkbuilder.build_schema_sim_relation_batched(network)
     end_schema_sim = time.time()
     print("Total schema-sim: {0}".format(str(end_schema_sim - start_schema_sim)))
     print("!!2 " + str(end_schema_sim - start_schema_sim))
@@ -55,21 +60,40 @@ def main(output_path=None):
     # Content_sim text relation (minhash-based)
     start_text_sig_sim = time.time()
     st = time.time()
-    mh_signatures = store.get_all_mh_text_signatures()
+    # mh_signatures = store.get_all_mh_text_signatures()
+    mh_nids = []
+    mh_batches = []
+    for nids, mh in store.stream_mh_text_signatures():
+        mh_nids.extend(nids)
+        mh_batches.append(mh)
+    mh_signatures = np.concatenate(mh_batches) if len(mh_batches) > 0 else np.empty((0, c.k), dtype=np.uint64)
     et = time.time()
     print("Time to extract minhash signatures from store: {0}".format(str(et - st)))
     print("!!3 " + str(et - st))
 
-    content_sim_index = networkbuilder.build_content_sim_mh_text(network, mh_signatures)
+    # content_sim_index = networkbuilder.build_content_sim_mh_text(network, mh_signatures)
+    content_sim_index = networkbuilder.build_content_sim_mh_text_matrix(network, mh_nids, mh_signatures)
     end_text_sig_sim = time.time()
     print("Total text-sig-sim (minhash): {0}".format(str(end_text_sig_sim - start_text_sig_sim)))
     print("!!4 " + str(end_text_sig_sim - start_text_sig_sim))
 
     # Content_sim num relation
     start_num_sig_sim = time.time()
-    id_sig = store.get_all_fields_num_signatures()
+    # id_sig = store.get_all_fields_num_signatures()
+    num_nids = []
+    num_batches = []
+    num_is_int = []
+    for nids, sigs, is_int in store.stream_fields_num_signatures():
+        num_nids.extend(nids)
+        num_batches.append(sigs)
+        num_is_int.append(is_int)
     #networkbuilder.build_content_sim_relation_num(network, id_sig)
-    networkbuilder.build_content_sim_relation_num_overlap_distr(network, id_sig)
+    #networkbuilder.build_content_sim_relation_num_overlap_distr(network, id_sig)
+    #networkbuilder.build_content_sim_relation_num_overlap_distr_sweep(network, id_sig)
+    if len(num_batches) > 0:
+        networkbuilder.build_content_sim_relation_num_overlap_distr_arrays(network, num_nids,
+                                                                           np.concatenate(num_batches),
+                                                                           np.concatenate(num_is_int))
     #networkbuilder.build_content_sim_relation_num_overlap_distr_indexed(network, id_sig)
     end_num_sig_sim = time.time()
     print("Total num-sig-sim: {0}".format(str(end_num_sig_sim - start_num_sig_sim)))
@@ -90,12 +114,11 @@ def main(output_path=None):
     if output_path is not None:
         path = output_path
     fieldnetwork.serialize_network(network, path)
+    # And the memory-mapped model, that the query-time systems open instead of the pickles (see modelformat)
+    modelformat.serialize_network_mmap(network, path)
 
-    # Serialize indexes
-    path_schsim = path + "/schema_sim_index.pkl"
-    io.serialize_object(schema_sim_index, path_schsim)
-    path_cntsim = path + "/content_sim_index.pkl"
-    io.serialize_object(content_sim_index, path_cntsim)
+    # Serialize indexes, in the binary format that SSAPI jobs memory-map (see indexformat)
+    indexformat.serialize_indexes(schema_sim_index, content_sim_index, path)
 
     print("DONE!")
 
@@ -1188,21 +1188,13 @@ def __find_relation_class_matchings(self):
     # Index vectors in engine
     st = time.time()
 
-    for idx in range(len(docs)):
-        sparse_row = tfidf.getrow(idx)
-        dense_row = sparse_row.todense()
-        array = dense_row.A[0]
-        new_index_engine.index(array, idx)
+    new_index_engine.bulk_index(tfidf, list(range(len(docs))))
     et = time.time()
     print("Total index text: " + str((et - st)))
 
     # Now query for similar ones:
     raw_matchings = defaultdict(list)
-    for idx in range(len(docs)):
-        sparse_row = tfidf.getrow(idx)
-        dense_row = sparse_row.todense()
-        array = dense_row.A[0]
-        N = new_index_engine.query(array)
+    for idx, N in enumerate(new_index_engine.query_batch(tfidf)):
         if len(N) > 1:
             for n in N:
                 (data, key, value) = n
@@ -1381,7 +1373,7 @@ def _get_kr_classes_vectors(kr_handlers):
 
 
 def adhoc_test():
-    from inputoutput import inputoutput as io
+    from knowledgerepr import indexformat
     from knowledgerepr import fieldnetwork
     from modelstore.elasticstore import StoreHandler
     from ontomatch.ss_api import SSAPI
@@ -1421,8 +1413,7 @@ def adhoc_test():
     store_client = StoreHandler()
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object("../models/chembl22/" + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object("../models/chembl22/" + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes("../models/chembl22/")
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1445,7 +1436,7 @@ if __name__ == "__main__":
 
     #adhoc_test()
 
-    from inputoutput import inputoutput as io
+    from knowledgerepr import indexformat
     from knowledgerepr import fieldnetwork
     from modelstore.elasticstore import StoreHandler
     from ontomatch.ss_api import SSAPI
@@ -1470,8 +1461,7 @@ if __name__ == "__main__":
     store_client = StoreHandler()
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object("../models/chembl22/" + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object("../models/chembl22/" + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes("../models/chembl22/")
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -10,7 +10,7 @@ from knowledgerepr import fieldnetwork
 from modelstore.elasticstore import StoreHandler
 from ontomatch import glove_api
 from ontomatch.ss_api import SSAPI
-from inputoutput import inputoutput as io
+from knowledgerepr import indexformat
 from collections import defaultdict
 
 # INDIVIDUAL FUNCTIONS
@@ -451,8 +451,7 @@ def best_config(path_to_serialized_model, onto_name, path_to_ontology, path_to_s
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -496,8 +495,7 @@ def relative_merit_one_onto(path_to_serialized_model, onto_name, path_to_ontolog
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1012,8 +1010,7 @@ def generate_results_battery_parameters(path_to_serialized_model, onto_name,
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1187,8 +1184,7 @@ def generate_results_battery_parameters2(path_to_serialized_model, onto_name,
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1395,8 +1391,7 @@ def local_test(path_to_raw_data, path_to_ground_truth_file):
     store_client = StoreHandler()
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object("../models/chembl22/" + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object("../models/chembl22/" + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes("../models/chembl22/")
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1664,8 +1659,7 @@ def combine_and_report_results(path_to_raw_data, path_to_ground_truth_file):
     store_client = StoreHandler()
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object("../models/chembl22/" + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object("../models/chembl22/" + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes("../models/chembl22/")
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
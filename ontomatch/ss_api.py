@@ -7,7 +7,7 @@ from knowledgerepr.networkbuilder import LSHRandomProjectionsIndex
 from ontomatch import glove_api
 from collections import defaultdict
 from ontomatch.onto_parser import OntoHandler
-from inputoutput import inputoutput as io
+from knowledgerepr import indexformat
 from datasketch import MinHash, MinHashLSH
 import numpy as np
 from nltk.corpus import stopwords
@@ -571,8 +571,7 @@ def test_l6(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -614,8 +613,7 @@ def test_e2e(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -709,8 +707,7 @@ def generate_matchings(input_model_path, input_ontology_name_path, output_file):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(input_model_path + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(input_model_path + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(input_model_path)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -740,8 +737,7 @@ def test_4_n_42(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -881,8 +877,7 @@ def test_5_n_52(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -994,8 +989,7 @@ def can_l6_cancel_l42_and_l52(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1147,8 +1141,7 @@ def main(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
 
@@ -1221,8 +1214,7 @@ def test_fuzzy(path_to_serialized_model):
     store_client = StoreHandler()
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1248,8 +1240,7 @@ def test_find_links(path_to_serialized_model, matchings):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
 
@@ -1314,8 +1305,7 @@ def test_chembl_annotations(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1368,8 +1358,7 @@ def debug_neg_signal(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1477,8 +1466,7 @@ def try_descr(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1541,8 +1529,7 @@ def test(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1646,8 +1633,7 @@ def test_lsh_quality(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1705,8 +1691,7 @@ def test_l42_lsh(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1746,8 +1731,7 @@ def test_l42_lsh(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
@@ -1786,8 +1770,7 @@ def test_l42_lsh(path_to_serialized_model):
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
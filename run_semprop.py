@@ -1,7 +1,7 @@
 from collections import defaultdict
 from sys import argv
 
-from inputoutput import inputoutput as io
+from knowledgerepr import indexformat
 
 from knowledgerepr import fieldnetwork
 from modelstore.elasticstore import StoreHandler
@@ -192,8 +192,7 @@ if __name__ == "__main__":
     print("Loading language model...OK")
 
     # Retrieve indexes
-    schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-    content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+    schema_sim_index, content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     # Create ontomatch api
     om = SSAPI(network, store_client, schema_sim_index, content_sim_index)
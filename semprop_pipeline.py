@@ -4,7 +4,7 @@ from collections import defaultdict
 from knowledgerepr import fieldnetwork
 from modelstore.elasticstore import StoreHandler
 from ontomatch import glove_api
-from inputoutput import inputoutput as io
+from knowledgerepr import indexformat
 from ontomatch.matcher_lib import MatchingType
 from ontomatch.ss_api import SSAPI
 from ontomatch import matcher_lib as matcherlib
@@ -34,8 +34,7 @@ class SemProp:
     def add_data_model(self, path_to_serialized_model):
         print('Loading data model ... ')
         self.network = fieldnetwork.deserialize_network(path_to_serialized_model)
-        self.schema_sim_index = io.deserialize_object(path_to_serialized_model + 'schema_sim_index.pkl')
-        self.content_sim_index = io.deserialize_object(path_to_serialized_model + 'content_sim_index.pkl')
+        self.schema_sim_index, self.content_sim_index = indexformat.load_indexes(path_to_serialized_model)
 
     def add_language_model(self, path_to_sem_model):
         print("Loading language model...")
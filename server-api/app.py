@@ -10,6 +10,9 @@ import json
 import pandas as pd
 from DoD.dod import DoD
 from DoD import data_processing_utils as dpu
+from DoD import join_path_index as jpi
+from DoD import join_estimation as je
+from DoD.hash_join import SpilledRelation
 import server_config as C
 
 # move to top level and import some more things
@@ -21,6 +24,7 @@ sys.path.insert(0, parentdir)
 from api.apiutils import Relation
 from modelstore.elasticstore import StoreHandler
 from knowledgerepr import fieldnetwork
+from knowledgerepr import modelformat
 from algebra import API
 from modelstore.elasticstore import KWType
 
@@ -28,11 +32,16 @@ from modelstore.elasticstore import KWType
 path_to_serialized_model = C.path_model
 sep = C.separator
 print("Configuring DoD with model: " + str(path_to_serialized_model) + " separator: " + str(sep))
-network = fieldnetwork.deserialize_network(path_to_serialized_model)
+dpu.enable_relation_cache_copy_on_write()
+network = fieldnetwork.deserialize_network(path_to_serialized_model,
+                                           backend=modelformat.model_backend(path_to_serialized_model))
 store_client = StoreHandler()
+join_path_index = jpi.load_or_build_join_path_index(network, path_to_serialized_model)
+join_estimator = je.JoinEstimator(store_client, hll_sketches=je.load_hll_sketches(path_to_serialized_model))
 
 global dod
-dod = DoD(network=network, store_client=store_client, csv_separator=sep)
+dod = DoD(network=network, store_client=store_client, csv_separator=sep, join_path_index=join_path_index,
+          join_estimator=join_estimator)
 
 global matview
 matview = None
@@ -141,7 +150,11 @@ def download_view():
 def obtain_view_analysis(view):
     htmls = []
     for c in view.columns:
-        html_repr = view[c].describe().to_frame().to_html()
+        if isinstance(view, SpilledRelation):  # one column at a time fits in memory
+            column = pd.concat([chunk[c] for chunk in view.chunks()] + [view.empty[c]], ignore_index=True)
+        else:
+            column = view[c]
+        html_repr = column.describe().to_frame().to_html()
         htmls.append(html_repr)
     return htmls
 
@@ -224,10 +237,15 @@ if __name__ == '__main__':
     # basic test
     path_to_serialized_model = args.model
     sep = args.sep
-    network = fieldnetwork.deserialize_network(path_to_serialized_model)
+    dpu.enable_relation_cache_copy_on_write()
+    network = fieldnetwork.deserialize_network(path_to_serialized_model,
+                                               backend=modelformat.model_backend(path_to_serialized_model))
     store_client = StoreHandler()
+    join_path_index = jpi.load_or_build_join_path_index(network, path_to_serialized_model)
+    join_estimator = je.JoinEstimator(store_client, hll_sketches=je.load_hll_sketches(path_to_serialized_model))
 
     global dod
-    dod = DoD(network=network, store_client=store_client, csv_separator=sep)
+    dod = DoD(network=network, store_client=store_client, csv_separator=sep, join_path_index=join_path_index,
+              join_estimator=join_estimator)
 
     app.run()
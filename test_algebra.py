@@ -31,6 +31,21 @@ class testAlgebra(unittest.TestCase):
         # not implemented
         pass
 
+    def test_search_many(self):
+        kws = ['foo', 'bar']
+        max_results = 11
+        multi_search_keywords = self.m_store_client.multi_search_keywords
+        multi_search_keywords.return_value = [[], []]
+
+        result = self.api.search_many(kws, KWType.KW_CONTENT, max_results=max_results)
+
+        self.m_network.assert_not_called()
+        multi_search_keywords.assert_called_once_with(
+            [('foo', KWType.KW_CONTENT, max_results, False),
+             ('bar', KWType.KW_CONTENT, max_results, False)])
+        self.assertEqual(len(result), 2)
+        self.assertTrue(all(isinstance(drs, DRS) for drs in result))
+
     @patch('algebra.DRS', MagicMock(return_value='return_drs'))
     def test_keyword_search_source(self, *args):
         kw = 'foo'